@@ -0,0 +1,116 @@
+"""Admission control for telemetry ingest.
+
+Two layers, both checked before any DB or AIEngine work:
+
+* ``LoadSheddingMiddleware`` caps the number of ingest requests in flight
+  across the worker. Past the cap new ones get 503 + Retry-After before the
+  body is even read, so overload shows up as fast rejections instead of
+  everyone's latency climbing.
+* ``AdmissionController.check_vehicle`` applies a token bucket per
+  ``vehicle_id`` so one chatty head unit gets 429s while the rest of the
+  fleet is unaffected.
+"""
+import os
+import time
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+INGEST_PATHS = ("/telemetry", "/ingest/telemetry")
+
+RATE_PER_VEHICLE = float(os.environ.get("INGEST_RATE_PER_VEHICLE", 5.0))  # samples/sec
+BURST_PER_VEHICLE = float(os.environ.get("INGEST_BURST_PER_VEHICLE", 20.0))
+MAX_IN_FLIGHT = int(os.environ.get("INGEST_MAX_IN_FLIGHT", 256))
+SHED_RETRY_AFTER_S = 1
+# Idle buckets are full again after burst/rate seconds and can be dropped
+PRUNE_INTERVAL_S = 60.0
+
+
+class AdmissionController:
+    def __init__(self, rate: float = RATE_PER_VEHICLE, burst: float = BURST_PER_VEHICLE,
+                 max_in_flight: int = MAX_IN_FLIGHT):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        # vehicle_id -> [tokens, last refill time]
+        self._buckets: Dict[str, List[float]] = {}
+        self._last_prune = time.monotonic()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+    def check_vehicle(self, vehicle_id: str):
+        """Take a token for ``vehicle_id`` or raise 429 with Retry-After."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(vehicle_id)
+        if bucket is None:
+            bucket = [self.burst, now]
+            self._buckets[vehicle_id] = bucket
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] < 1.0:
+            self.rate_limited += 1
+            retry_after = max(1, int((1.0 - bucket[0]) / self.rate + 0.999))
+            raise HTTPException(status_code=429, detail="Telemetry rate limit exceeded for vehicle",
+                                headers={"Retry-After": str(retry_after)})
+        bucket[0] -= 1.0
+        self.admitted += 1
+
+        if now - self._last_prune > PRUNE_INTERVAL_S:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        self._last_prune = now
+        idle = self.burst / self.rate
+        stale = [vid for vid, (_, last) in self._buckets.items() if now - last > idle]
+        for vid in stale:
+            del self._buckets[vid]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rate_per_vehicle": self.rate,
+            "burst_per_vehicle": self.burst,
+            "tracked_vehicles": len(self._buckets),
+            "admitted_total": self.admitted,
+            "rate_limited_total": self.rate_limited,
+            "shed_total": self.shed,
+        }
+
+
+class LoadSheddingMiddleware:
+    def __init__(self, app, controller: AdmissionController, paths=INGEST_PATHS):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        controller = self.controller
+        if controller.in_flight >= controller.max_in_flight:
+            controller.shed += 1
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(SHED_RETRY_AFTER_S).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Server overloaded, retry later"}'})
+            return
+
+        controller.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.in_flight -= 1
@@ -1,7 +1,31 @@
+import uuid
 from datetime import datetime
 from models import VehicleTelemetry, Alert
 
+# Rule thresholds, shared with the vectorized rules in importer.py
+HARSH_FORCE = 15.0  # accelerometer magnitude
+OVERSPEED_KMH = 120.0
+LOW_BATTERY = 20.0  # percent
+ENGINE_OVERHEAT_C = 100.0
+
+def _alert_id(prefix: str, telemetry: VehicleTelemetry) -> str:
+    # Unique per vehicle and sample: a seconds timestamp alone collides as soon as
+    # two vehicles (or two samples) trip the same rule within a second
+    return f"{prefix}-{telemetry.vehicle_id}-{int(datetime.now().timestamp())}-{uuid.uuid4().hex[:8]}"
+
 class AIEngine:
+    def __init__(self, geofence_engine=None, geocoder=None):
+        self.geofence_engine = geofence_engine
+        self.geocoder = geocoder
+
+    def _location(self, telemetry: VehicleTelemetry) -> str:
+        # Locality name when the offline geocoder knows the area, raw coordinates otherwise
+        if self.geocoder is not None:
+            place = self.geocoder.reverse(telemetry.latitude, telemetry.longitude)
+            if place:
+                return place
+        return f"{telemetry.latitude}, {telemetry.longitude}"
+
     def detect_rash_driving(self, telemetry: VehicleTelemetry) -> list[Alert]:
         alerts = []
         
@@ -10,26 +34,30 @@ class AIEngine:
         if telemetry.accelerometer:
             accel = telemetry.accelerometer
             total_force = (accel.x**2 + accel.y**2 + accel.z**2)**0.5
-            if total_force > 15.0: # Threshold for harsh event
+            if total_force > HARSH_FORCE: # Threshold for harsh event
                 alerts.append(Alert(
-                    alert_id=f"RD-{int(datetime.now().timestamp())}",
+                    alert_id=_alert_id("RD", telemetry),
                     vehicle_id=telemetry.vehicle_id,
                     type="RASH_DRIVING",
                     severity="HIGH",
                     message="Harsh driving maneuver detected!",
                     timestamp=datetime.now(),
-                    location=f"{telemetry.latitude}, {telemetry.longitude}"
+                    location=self._location(telemetry),
+                    latitude=telemetry.latitude,
+                    longitude=telemetry.longitude
                 ))
 
         # 2. Overspeeding
-        if telemetry.speed > 120.0:
+        if telemetry.speed > OVERSPEED_KMH:
             alerts.append(Alert(
-                alert_id=f"OS-{int(datetime.now().timestamp())}",
+                alert_id=_alert_id("OS", telemetry),
                 vehicle_id=telemetry.vehicle_id,
                 type="RASH_DRIVING",
                 severity="MEDIUM",
                 message=f"Overspeeding detected: {telemetry.speed} km/h",
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                latitude=telemetry.latitude,
+                longitude=telemetry.longitude
             ))
             
         return alerts
@@ -39,25 +67,53 @@ class AIEngine:
         
         # Mock Predictive Logic
         # 1. Battery Health (for EVs)
-        if telemetry.battery_level is not None and telemetry.battery_level < 20.0:
+        if telemetry.battery_level is not None and telemetry.battery_level < LOW_BATTERY:
              alerts.append(Alert(
-                alert_id=f"MNT-{int(datetime.now().timestamp())}",
+                alert_id=_alert_id("MNT", telemetry),
                 vehicle_id=telemetry.vehicle_id,
                 type="MAINTENANCE",
                 severity="MEDIUM",
                 message="Battery critically low. Recharge required soon.",
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                latitude=telemetry.latitude,
+                longitude=telemetry.longitude
             ))
             
         # 2. Engine Temp
-        if telemetry.engine_temp is not None and telemetry.engine_temp > 100.0:
+        if telemetry.engine_temp is not None and telemetry.engine_temp > ENGINE_OVERHEAT_C:
              alerts.append(Alert(
-                alert_id=f"ENG-{int(datetime.now().timestamp())}",
+                alert_id=_alert_id("ENG", telemetry),
                 vehicle_id=telemetry.vehicle_id,
                 type="MAINTENANCE",
                 severity="CRITICAL",
                 message="Engine overheating! Stop immediately.",
-                timestamp=datetime.now()
+                timestamp=datetime.now(),
+                latitude=telemetry.latitude,
+                longitude=telemetry.longitude
+            ))
+
+        return alerts
+
+    def detect_geofence_events(self, telemetry: VehicleTelemetry) -> list[Alert]:
+        alerts = []
+        if self.geofence_engine is None:
+            return alerts
+
+        events = self.geofence_engine.check(
+            telemetry.vehicle_id, telemetry.latitude, telemetry.longitude
+        )
+        for fence, event in events:
+            verb = "entered" if event == "ENTER" else "left"
+            alerts.append(Alert(
+                alert_id=_alert_id(f"GEO-{fence.geofence_id}-{event}", telemetry),
+                vehicle_id=telemetry.vehicle_id,
+                type="GEOFENCE",
+                severity="MEDIUM",
+                message=f"Vehicle {verb} geofence '{fence.name}'",
+                timestamp=datetime.now(),
+                location=self._location(telemetry),
+                latitude=telemetry.latitude,
+                longitude=telemetry.longitude
             ))
 
         return alerts
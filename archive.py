@@ -0,0 +1,363 @@
+"""Cold-tier archive for telemetry older than ``ARCHIVE_AFTER_DAYS``.
+
+``python -m archive`` moves aged ``telemetry_logs`` rows into one file per
+vehicle-month under ``ARCHIVE_DIR`` and deletes them from the database
+(each telemetry shard in turn). ``crud.get_telemetry`` and
+``crud.get_insights`` read the archive alongside the hot rows, so callers
+don't see where a row lives. Each run records its cutoff in
+``ARCHIVE_DIR/%high-water``. Reads only look in the archive for time
+ranges older than that mark, whatever ``--older-than-days`` the job used.
+
+File layout: a small header with a block index (first/last timestamp and
+byte range per block), then blocks of up to ``BLOCK_ROWS`` rows. Inside a
+block each column is stored contiguously, delta-encoded integers
+(timestamps in microseconds, coordinates in microdegrees, speed and battery
+in hundredths), and the whole block is zlib-compressed. Smooth telemetry
+deltas are tiny, so a row takes a few bytes instead of the ~100 it costs in
+SQLite with its index. Reads mmap the file, use the index to skip blocks
+outside the requested time range and decode only the rest.
+
+Archived rows keep ~0.1 m / 0.01 km/h / 0.01% precision and have no ``id``.
+If compaction stops between writing a file and deleting the rows, the next
+run merges the duplicates away.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+import shards
+import sql_models
+import versions
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "archive"))
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 21))
+BLOCK_ROWS = 4096
+ZLIB_LEVEL = 6
+# Ids per DELETE ... IN (...), under SQLite's bound-parameter limit
+DELETE_BATCH = 5000
+
+_MAGIC = b"TLA1"
+_HEADER = struct.Struct("<4sI")
+_INDEX_DTYPE = np.dtype([("first", "<i8"), ("last", "<i8"), ("offset", "<i8"), ("nbytes", "<i4"), ("rows", "<i4")])
+_EPOCH = datetime(1970, 1, 1)
+_NO_BATTERY = -1
+# Sits next to the vehicle directories; quote() never produces "%h"
+_HIGH_WATER = "%high-water"
+COLUMNS = ("timestamp", "speed", "latitude", "longitude", "battery_level")
+
+
+def to_us(dt: datetime) -> int:
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=int(us))
+
+
+class ArchivedTelemetry:
+    """Read-only stand-in for a TelemetryLog row that lives in the archive."""
+    __slots__ = ("id", "vehicle_id", "timestamp", "speed", "latitude", "longitude", "battery_level")
+
+    def __init__(self, vehicle_id, timestamp, speed, latitude, longitude, battery_level):
+        self.id = None
+        self.vehicle_id = vehicle_id
+        self.timestamp = timestamp
+        self.speed = speed
+        self.latitude = latitude
+        self.longitude = longitude
+        self.battery_level = battery_level
+
+
+def _empty() -> Dict[str, np.ndarray]:
+    return {"ts": np.empty(0, np.int64), "lat": np.empty(0, np.int32), "lng": np.empty(0, np.int32),
+            "speed": np.empty(0, np.int32), "battery": np.empty(0, np.int32)}
+
+
+def _encode_block(cols: Dict[str, np.ndarray]) -> bytes:
+    parts = []
+    for name, dtype in (("ts", np.int64), ("lat", np.int32), ("lng", np.int32), ("speed", np.int32), ("battery", np.int32)):
+        values = cols[name].astype(dtype)
+        parts.append(np.diff(values, prepend=dtype(0)).astype(dtype).tobytes())
+    return zlib.compress(b"".join(parts), ZLIB_LEVEL)
+
+
+def _decode_block(raw: bytes, rows: int) -> Dict[str, np.ndarray]:
+    buf = zlib.decompress(raw)
+    cols = {}
+    offset = 0
+    for name, dtype in (("ts", np.int64), ("lat", np.int32), ("lng", np.int32), ("speed", np.int32), ("battery", np.int32)):
+        width = np.dtype(dtype).itemsize * rows
+        cols[name] = np.cumsum(np.frombuffer(buf, dtype=dtype, count=rows, offset=offset), dtype=dtype)
+        offset += width
+    return cols
+
+
+def decode_columns(cols: Dict[str, np.ndarray]) -> tuple:
+    """Encoded columns back to (timestamps, speeds, latitudes, longitudes, battery levels) lists."""
+    battery = np.where(cols["battery"] == _NO_BATTERY, np.nan, cols["battery"] / 100.0)
+    return (
+        list(map(from_us, cols["ts"].tolist())),
+        (cols["speed"] / 100.0).tolist(),
+        (cols["lat"] / 1e6).tolist(),
+        (cols["lng"] / 1e6).tolist(),
+        [None if b != b else b for b in battery.tolist()],
+    )
+
+
+class TelemetryArchive:
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        self._high_water = (None, None)  # (marker mtime_ns, value)
+
+    def archived_before(self) -> Optional[datetime]:
+        """Every archived row is older than this; None when nothing has been archived.
+
+        Recorded by ``compact()`` from the cutoff it actually used, so reads
+        stay correct whatever ``--older-than-days`` or environment the job ran with.
+        """
+        path = os.path.join(self.root, _HIGH_WATER)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if self._high_water[0] != mtime:
+            with open(path) as f:
+                self._high_water = (mtime, datetime.fromisoformat(f.read().strip()))
+        return self._high_water[1]
+
+    def _raise_high_water(self, cutoff: datetime):
+        current = self.archived_before()
+        if current is not None and current >= cutoff:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, _HIGH_WATER)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(cutoff.isoformat())
+        os.replace(tmp, path)
+
+    def _vehicle_dir(self, vehicle_id: str) -> str:
+        return os.path.join(self.root, quote(vehicle_id, safe=""))
+
+    def path(self, vehicle_id: str, month: str) -> str:
+        return os.path.join(self._vehicle_dir(vehicle_id), month + ".tla")
+
+    def months(self, vehicle_id: str) -> List[str]:
+        try:
+            names = os.listdir(self._vehicle_dir(vehicle_id))
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-4] for n in names if n.endswith(".tla"))
+
+    # --- reading ---
+
+    def _read_file(self, path: str, start_us: Optional[int], end_us: Optional[int]) -> Dict[str, np.ndarray]:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, blocks = _HEADER.unpack_from(mm, 0)
+            if magic != _MAGIC:
+                raise ValueError(f"{path} is not a telemetry archive")
+            index = np.frombuffer(mm, dtype=_INDEX_DTYPE, count=blocks, offset=_HEADER.size).copy()
+            chunks = []
+            for first, last, offset, nbytes, rows in index.tolist():
+                if (start_us is not None and last < start_us) or (end_us is not None and first >= end_us):
+                    continue
+                chunks.append(_decode_block(mm[offset:offset + nbytes], rows))
+        if not chunks:
+            return _empty()
+        cols = {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+        if start_us is not None or end_us is not None:
+            keep = np.ones(len(cols["ts"]), dtype=bool)
+            if start_us is not None:
+                keep &= cols["ts"] >= start_us
+            if end_us is not None:
+                keep &= cols["ts"] < end_us
+            cols = {k: v[keep] for k, v in cols.items()}
+        return cols
+
+    def vehicles(self) -> List[str]:
+        try:
+            return sorted(unquote(entry.name) for entry in os.scandir(self.root) if entry.is_dir())
+        except FileNotFoundError:
+            return []
+
+    def iter_months(self, vehicle_id: str, start: datetime = None, end: datetime = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Encoded columns for ``start <= timestamp < end``, one month at a time, oldest first."""
+        start_month = start.strftime("%Y-%m") if start else None
+        end_month = end.strftime("%Y-%m") if end else None
+        start_us = to_us(start) if start else None
+        end_us = to_us(end) if end else None
+        for month in self.months(vehicle_id):
+            if (start_month is None or month >= start_month) and (end_month is None or month <= end_month):
+                yield self._read_file(self.path(vehicle_id, month), start_us, end_us)
+
+    def read(self, vehicle_id: str, start: datetime = None, end: datetime = None) -> Dict[str, np.ndarray]:
+        """Encoded columns for ``start <= timestamp < end``, oldest first."""
+        parts = list(self.iter_months(vehicle_id, start, end))
+        if not parts:
+            return _empty()
+        return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+    def rows(self, vehicle_id: str, start: datetime = None, end: datetime = None) -> List[ArchivedTelemetry]:
+        return self._to_rows(vehicle_id, self.read(vehicle_id, start, end))
+
+    def latest(self, vehicle_id: str, limit: int) -> List[ArchivedTelemetry]:
+        """Newest ``limit`` archived rows, newest first; only opens the months it needs."""
+        collected = []
+        count = 0
+        for month in reversed(self.months(vehicle_id)):
+            cols = self._read_file(self.path(vehicle_id, month), None, None)
+            collected.append(cols)
+            count += len(cols["ts"])
+            if count >= limit:
+                break
+        if not collected:
+            return []
+        cols = {k: np.concatenate([c[k] for c in reversed(collected)]) for k in collected[0]}
+        cols = {k: v[::-1][:limit] for k, v in cols.items()}
+        return self._to_rows(vehicle_id, cols)
+
+    def iter_positions(self) -> Iterator[tuple]:
+        """(latitude, longitude, timestamp) of every archived row, like ``crud.iter_telemetry_positions``."""
+        for vehicle_id in self.vehicles():
+            for cols in self.iter_months(vehicle_id):
+                timestamps, _, lats, lngs, _ = decode_columns(cols)
+                yield from zip(lats, lngs, timestamps)
+
+    @staticmethod
+    def _to_rows(vehicle_id: str, cols: Dict[str, np.ndarray]) -> List[ArchivedTelemetry]:
+        return [ArchivedTelemetry(vehicle_id, *values) for values in zip(*decode_columns(cols))]
+
+    # --- writing ---
+
+    def write_month(self, vehicle_id: str, month: str, cols: Dict[str, np.ndarray]):
+        """Merge ``cols`` into the vehicle-month file (replaced atomically)."""
+        path = self.path(vehicle_id, month)
+        if os.path.exists(path):
+            existing = self._read_file(path, None, None)
+            cols = {k: np.concatenate([existing[k], cols[k]]) for k in cols}
+        order = np.lexsort((cols["lng"], cols["lat"], cols["ts"]))
+        cols = {k: v[order] for k, v in cols.items()}
+        # Drop exact duplicates left by an interrupted compaction
+        if len(cols["ts"]) > 1:
+            stacked = np.stack([cols[k].astype(np.int64) for k in ("ts", "lat", "lng", "speed", "battery")])
+            keep = np.concatenate([[True], np.any(stacked[:, 1:] != stacked[:, :-1], axis=0)])
+            cols = {k: v[keep] for k, v in cols.items()}
+
+        total = len(cols["ts"])
+        blocks = []
+        for lo in range(0, total, BLOCK_ROWS):
+            block = {k: v[lo:lo + BLOCK_ROWS] for k, v in cols.items()}
+            blocks.append((int(block["ts"][0]), int(block["ts"][-1]), len(block["ts"]), _encode_block(block)))
+        index = np.zeros(len(blocks), dtype=_INDEX_DTYPE)
+        offset = _HEADER.size + index.nbytes
+        for i, (first, last, rows, data) in enumerate(blocks):
+            index[i] = (first, last, offset, len(data), rows)
+            offset += len(data)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(blocks)))
+            f.write(index.tobytes())
+            for _, _, _, data in blocks:
+                f.write(data)
+        os.replace(tmp, path)
+
+    def compact_vehicle(self, db: Session, vehicle_id: str, cutoff: datetime) -> int:
+        """Archive ``vehicle_id``'s rows older than ``cutoff``, one month at a time.
+
+        Each month is read with its own bounded SELECT, written, and then
+        exactly the rows that were read are deleted (by id) and committed.
+        Rows inserted meanwhile, even with old timestamps, stay put for the
+        next run.
+        """
+        log = sql_models.TelemetryLog
+        first = db.execute(
+            select(func.min(log.timestamp)).where(log.vehicle_id == vehicle_id, log.timestamp < cutoff)
+        ).scalar()
+        if first is None:
+            return 0
+        # Readers must start consulting the archive before any hot row goes away
+        self._raise_high_water(cutoff)
+        moved = 0
+        month_start = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        while month_start < cutoff:
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            moved += self._compact_month(db, vehicle_id, month_start, min(next_month, cutoff))
+            month_start = next_month
+        return moved
+
+    def _compact_month(self, db: Session, vehicle_id: str, start: datetime, end: datetime) -> int:
+        log = sql_models.TelemetryLog
+        rows = db.execute(
+            select(log.id, log.timestamp, log.speed, log.latitude, log.longitude, log.battery_level)
+            .where(log.vehicle_id == vehicle_id, log.timestamp >= start, log.timestamp < end)
+        ).all()
+        if not rows:
+            return 0
+        ids, ts, speed, lat, lng, battery = zip(*rows)
+        self.write_month(vehicle_id, start.strftime("%Y-%m"), {
+            "ts": np.array(ts, dtype="datetime64[us]").astype(np.int64),
+            "speed": np.round(np.array(speed, dtype=np.float64) * 100).astype(np.int32),
+            "lat": np.round(np.array(lat, dtype=np.float64) * 1e6).astype(np.int32),
+            "lng": np.round(np.array(lng, dtype=np.float64) * 1e6).astype(np.int32),
+            "battery": np.array([_NO_BATTERY if b is None else round(b * 100) for b in battery], dtype=np.int32),
+        })
+        # The file is in place; only now drop the rows, and only the ones it holds
+        for lo in range(0, len(ids), DELETE_BATCH):
+            db.execute(delete(log).where(log.id.in_(ids[lo:lo + DELETE_BATCH])))
+        # Archived values are rounded, so insights may shift in the last digit
+        versions.bump(db, "insights", vehicle_id)
+        db.commit()
+        return len(ids)
+
+    def compact(self, db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, vacuum: bool = False) -> dict:
+        """Archive every vehicle's rows older than ``older_than_days`` on each telemetry shard."""
+        cutoff = datetime.now() - timedelta(days=older_than_days)
+        log = sql_models.TelemetryLog
+        stats = {"vehicles": 0, "rows": 0}
+        for shard_db in shards.router.each(db):
+            vehicle_ids = shard_db.execute(select(log.vehicle_id).where(log.timestamp < cutoff).distinct()).scalars().all()
+            for vehicle_id in vehicle_ids:
+                moved = self.compact_vehicle(shard_db, vehicle_id, cutoff)
+                stats["vehicles"] += 1
+                stats["rows"] += moved
+            if vacuum and shard_db.bind.dialect.name == "sqlite":
+                with shard_db.bind.connect() as conn:
+                    conn.exec_driver_sql("VACUUM")
+        return stats
+
+
+telemetry_archive = TelemetryArchive()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old telemetry rows into the columnar archive")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--vacuum", action="store_true", help="reclaim SQLite file space afterwards")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        stats = telemetry_archive.compact(db, args.older_than_days, args.vacuum)
+    finally:
+        db.close()
+    print("archived %d rows from %d vehicles in %.1fs into %s" % (
+        stats["rows"], stats["vehicles"], time.perf_counter() - started, telemetry_archive.root))
+
+
+if __name__ == "__main__":
+    main()
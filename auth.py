@@ -0,0 +1,102 @@
+"""Signed access tokens and off-thread password hashing.
+
+Tokens are ``<payload>.<signature>`` with a base64url JSON payload and an
+HMAC-SHA256 signature, so checking one costs a hash instead of bcrypt.
+bcrypt itself runs in a small process pool: a burst of logins then queues
+there instead of tying up the threadpool every sync endpoint depends on.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+import crud
+
+TOKEN_TTL_S = int(os.environ.get("ACCESS_TOKEN_TTL_S", 7 * 24 * 3600))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", min(2, os.cpu_count() or 1)))
+
+_secret = os.environ.get("AUTH_SECRET")
+if not _secret:
+    # Tokens won't survive restarts or be shared across workers without a configured secret
+    print("AUTH_SECRET not set, using a random per-process token secret")
+    _secret = secrets.token_urlsafe(32)
+_SECRET = _secret.encode()
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SECRET, payload.encode("utf-8", "surrogateescape"), hashlib.sha256).digest())
+
+
+def create_access_token(user_id: str):
+    """Returns (token, expires_at unix seconds)."""
+    expires_at = int(time.time()) + TOKEN_TTL_S
+    payload = _b64encode(json.dumps({"sub": user_id, "exp": expires_at}, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}", expires_at
+
+
+def verify_access_token(token: str) -> Optional[str]:
+    """User id for a valid, unexpired token, else None."""
+    payload, sep, signature = token.partition(".")
+    # compare_digest only takes ASCII str; compare bytes so odd header characters fail as a mismatch
+    if not sep or not hmac.compare_digest(signature.encode("utf-8", "surrogateescape"),
+                                          _sign(payload).encode()):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims.get("sub")
+
+
+def require_user_id(authorization: str = Header(None)) -> str:
+    """Dependency: user id from an ``Authorization: Bearer <token>`` header."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing access token")
+    user_id = verify_access_token(authorization[7:].strip())
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid or expired access token")
+    return user_id
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _pool
+
+
+async def hash_password(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), crud.get_password_hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), crud.verify_password, password, hashed_password)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
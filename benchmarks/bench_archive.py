@@ -0,0 +1,97 @@
+"""Storage per row and month range scans: SQLite hot table vs the archive.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_archive --vehicles 20 --days 60
+
+Generates a synthetic fleet whose history ends ``ARCHIVE_AFTER_DAYS`` ago,
+measures the database size, compacts everything into a temporary archive
+and measures again, then times reading one vehicle's month of telemetry
+both ways.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+import archive
+import sql_models
+from database import make_engine
+from synthetic_fleet import generate_fleet
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--vehicles", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between samples")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fleet.db")
+        engine = make_engine("sqlite:///" + db_path)
+        end = datetime.now() - timedelta(days=archive.ARCHIVE_AFTER_DAYS + 1)
+        generate_fleet(engine, users=1, vehicles=args.vehicles, days=args.days, interval_s=args.interval, end=end)
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT count(*) FROM telemetry_logs")).scalar()
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        db = sessionmaker(bind=engine)()
+        vid = db.query(sql_models.TelemetryLog.vehicle_id).first()[0]
+        month_end = end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month_start = (month_end - timedelta(days=1)).replace(day=1)
+
+        def sql_scan():
+            return db.query(sql_models.TelemetryLog).filter(
+                sql_models.TelemetryLog.vehicle_id == vid,
+                sql_models.TelemetryLog.timestamp >= month_start,
+                sql_models.TelemetryLog.timestamp < month_end,
+            ).all()
+
+        hot_rows = len(sql_scan())
+        sql_s = best_of(lambda: (sql_scan(), db.expunge_all()))
+        db_before = os.path.getsize(db_path)
+
+        store = archive.TelemetryArchive(os.path.join(tmp, "archive"))
+        started = time.perf_counter()
+        store.compact(db, older_than_days=archive.ARCHIVE_AFTER_DAYS, vacuum=True)
+        compact_s = time.perf_counter() - started
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        db_after = os.path.getsize(db_path)
+        archive_bytes = dir_size(store.root)
+
+        assert len(store.rows(vid, month_start, month_end)) == hot_rows
+        columns_s = best_of(lambda: store.read(vid, month_start, month_end))
+        rows_s = best_of(lambda: store.rows(vid, month_start, month_end))
+        db.close()
+
+    print("telemetry rows:        %d" % rows)
+    print("sqlite (table+index):  %.1f bytes/row" % ((db_before - db_after) / rows))
+    print("archive:               %.1f bytes/row  (%.1fx smaller)" % (
+        archive_bytes / rows, (db_before - db_after) / archive_bytes))
+    print("compaction:            %.1fs (%.0f rows/s)" % (compact_s, rows / compact_s))
+    print("one vehicle-month (%d rows):" % hot_rows)
+    print("  sqlite ORM query     %7.1f ms" % (sql_s * 1000))
+    print("  archive columns      %7.1f ms  (%.1fx)" % (columns_s * 1000, sql_s / columns_s))
+    print("  archive row objects  %7.1f ms  (%.1fx)" % (rows_s * 1000, sql_s / rows_s))
+
+
+if __name__ == "__main__":
+    main()
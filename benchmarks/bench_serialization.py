@@ -0,0 +1,109 @@
+"""Compare the default FastAPI/pydantic JSON path with serialization.py.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_serialization
+"""
+import json
+import random
+import timeit
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+
+import sql_models
+from models import Trip, VehicleTelemetry, AccelerometerData
+from serialization import dumps, telemetry_message, telemetry_log_to_dict, trip_to_dict
+
+TELEMETRY_ROWS = 5000
+TRIPS = 200
+POINTS_PER_TRIP = 500
+
+
+def make_telemetry_rows():
+    start = datetime(2024, 1, 1)
+    return [
+        sql_models.TelemetryLog(
+            id=i, vehicle_id="v_101", timestamp=start + timedelta(seconds=2 * i),
+            speed=random.uniform(0, 120), latitude=12.97 + i * 1e-5, longitude=77.59 + i * 1e-5,
+            battery_level=random.uniform(10, 100)
+        )
+        for i in range(TELEMETRY_ROWS)
+    ]
+
+
+def make_trips():
+    start = datetime(2024, 1, 1)
+    trips = []
+    for i in range(TRIPS):
+        points = [{"lat": 12.97 + j * 1e-4, "lng": 77.59 + j * 1e-4,
+                   "timestamp": (start + timedelta(seconds=j)).isoformat()}
+                  for j in range(POINTS_PER_TRIP)]
+        trips.append(sql_models.Trip(
+            trip_id=f"t_{i}", vehicle_id="v_101", title=f"Trip {i}",
+            start_time=start, end_time=start + timedelta(hours=1), distance_km=12.5,
+            score=80, score_color="0xFF388E3C", status="COMPLETED",
+            route_points_json=json.dumps(points)
+        ))
+    return trips
+
+
+def baseline_telemetry(rows):
+    # What FastAPI did for `return crud.get_telemetry(...)` without a response_model
+    return json.dumps(jsonable_encoder(rows)).encode()
+
+
+def baseline_trips(trips):
+    # Old /trips path: json.loads per trip, response_model validation, default encoder
+    data = []
+    for t in trips:
+        data.append(Trip(
+            trip_id=t.trip_id, vehicle_id=t.vehicle_id, title=t.title,
+            start_time=t.start_time, end_time=t.end_time, distance_km=t.distance_km,
+            score=t.score, score_color=t.score_color, status=t.status,
+            route_points=json.loads(t.route_points_json)
+        ))
+    return json.dumps(jsonable_encoder(data)).encode()
+
+
+def baseline_broadcast(t: VehicleTelemetry):
+    return json.dumps({"type": "telemetry", "data": t.dict(exclude_none=True, by_alias=True)}, default=str)
+
+
+def bench(label, fn, number):
+    best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+    print(f"  {label:<10} {best * 1000:10.3f} ms")
+    return best
+
+
+def main():
+    random.seed(42)
+    rows = make_telemetry_rows()
+    trips = make_trips()
+    sample = VehicleTelemetry(
+        vehicle_id="v_101", timestamp=datetime(2024, 1, 1), speed=72.5, latitude=12.97,
+        longitude=77.59, battery_level=64.0, engine_temp=88.0,
+        accelerometer=AccelerometerData(x=0.1, y=0.2, z=9.8)
+    )
+
+    cases = [
+        (f"GET /telemetry ({TELEMETRY_ROWS} rows)",
+         lambda: baseline_telemetry(rows),
+         lambda: dumps([telemetry_log_to_dict(r) for r in rows]), 5),
+        (f"GET /trips ({TRIPS} trips x {POINTS_PER_TRIP} points)",
+         lambda: baseline_trips(trips),
+         lambda: dumps([trip_to_dict(t) for t in trips]), 1),
+        ("telemetry broadcast frame",
+         lambda: baseline_broadcast(sample),
+         lambda: telemetry_message(sample).text(), 2000),
+    ]
+    for name, old, new, number in cases:
+        print(name)
+        old_t = bench("baseline", old, number)
+        new_t = bench("fast", new, number)
+        print(f"  speedup    {old_t / new_t:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Telemetry write throughput against 1..K SQLite shards.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_shards --writers 4 --shards 1,2,4 --rows 2000
+
+Each writer process calls ``crud.create_telemetry`` (one commit per row,
+including the insights ETag bump) for random vehicles, routed by
+``shards.py``. With one file every commit queues on SQLite's single write
+lock; with K files up to K writers commit at once.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+import crud
+import shards
+from models import VehicleTelemetry
+from shards import ShardRouter
+
+
+def writer(urls, rows: int, seed: int, start_event):
+    shards.router = ShardRouter(urls)
+    rng = random.Random(seed)
+    start_event.wait()
+    for _ in range(rows):
+        vid = "V%04d" % rng.randrange(1000)
+        # Every row goes to a shard, so the main-database session is never used
+        crud.create_telemetry(None, VehicleTelemetry(vehicle_id=vid, timestamp=datetime.now(),
+                                                     speed=rng.uniform(0, 120), latitude=12.97,
+                                                     longitude=77.59, battery_level=80.0))
+
+
+def run(shard_count: int, writers: int, rows: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = ["sqlite:///" + os.path.join(tmp, "shard_%d.db" % i) for i in range(shard_count)]
+        ShardRouter(urls).migrate()
+        start_event = multiprocessing.Event()
+        procs = [multiprocessing.Process(target=writer, args=(urls, rows, i, start_event)) for i in range(writers)]
+        for p in procs:
+            p.start()
+        # Let every writer finish importing before the clock starts
+        time.sleep(1.0)
+        started = time.perf_counter()
+        start_event.set()
+        for p in procs:
+            p.join()
+        return writers * rows / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--writers", type=int, default=4, help="writer processes")
+    parser.add_argument("--shards", default="1,2,4", help="comma-separated shard counts")
+    parser.add_argument("--rows", type=int, default=2000, help="rows per writer")
+    args = parser.parse_args()
+
+    base = None
+    for count in (int(c) for c in args.shards.split(",")):
+        rate = run(count, args.writers, args.rows)
+        base = base or rate
+        print("%2d shard(s): %9.0f rows/s  (%.2fx)" % (count, rate, rate / base))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Async load generator: N simulated vehicles plus M WebSocket dashboards.
+
+Needs httpx and websockets (``pip install -r requirements-dev.txt``).
+Start a server first (``uvicorn main:app``), then run from the repo root:
+
+    python -m benchmarks.loadgen --vehicles 200 --rate 0.5 --subscribers 50 --duration 60
+
+Each vehicle posts telemetry at ``--rate`` samples/sec. Sends are scheduled
+open-loop: a slow response does not delay the vehicle's next sample, and
+request latency is measured from the scheduled send time, so server stalls
+show up in the percentiles instead of silently lowering the offered load.
+
+Subscribers connect to ``/ws/telemetry/{vehicle_id}`` for the first M
+vehicles and measure telemetry-to-dashboard latency: the time from the POST
+leaving the generator to the matching broadcast frame arriving.
+
+Payloads are a mix of normal driving, overspeed, accelerometer spikes and
+low battery (``--mix``), so the AIEngine and alert paths are exercised too.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+
+DEFAULT_MIX = "normal=0.85,overspeed=0.05,spike=0.05,low_battery=0.05"
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(spec: str) -> Tuple[List[str], List[float]]:
+    kinds, weights = [], []
+    for part in spec.split(","):
+        kind, weight = part.split("=")
+        kinds.append(kind.strip())
+        weights.append(float(weight))
+    return kinds, weights
+
+
+class SimulatedVehicle:
+    def __init__(self, vehicle_id: str, rng: random.Random):
+        self.vehicle_id = vehicle_id
+        self.rng = rng
+        self.seq = 0
+        self.lat = 12.9716 + rng.uniform(-0.1, 0.1)
+        self.lng = 77.5946 + rng.uniform(-0.1, 0.1)
+        self.battery = rng.uniform(40, 100)
+
+    def next_payload(self, kind: str) -> dict:
+        rng = self.rng
+        self.seq += 1
+        self.lat += rng.uniform(-0.0005, 0.0005)
+        self.lng += rng.uniform(-0.0005, 0.0005)
+        self.battery = max(5.0, self.battery - rng.uniform(0, 0.05))
+        payload = {
+            "vehicle_id": self.vehicle_id,
+            # Unique per sample; subscribers use it to match broadcasts to sends
+            "timestamp": datetime.now().isoformat(),
+            "seq": self.seq,
+            "speed": rng.uniform(20, 80),
+            "rpm": rng.uniform(1000, 4000),
+            "latitude": self.lat,
+            "longitude": self.lng,
+            "battery_level": self.battery,
+            "engine_temp": rng.uniform(80, 95),
+            "accelerometer": {"x": rng.uniform(-1, 1), "y": rng.uniform(-1, 1), "z": rng.uniform(9, 10.5)},
+        }
+        if kind == "overspeed":
+            payload["speed"] = rng.uniform(125, 160)
+        elif kind == "spike":
+            payload["accelerometer"]["z"] = rng.uniform(16, 25)
+        elif kind == "low_battery":
+            payload["battery_level"] = rng.uniform(5, 19)
+        return payload
+
+
+class Stats:
+    def __init__(self):
+        self.request_latency: List[float] = []
+        self.e2e_latency: List[float] = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.ws_messages = 0
+        self.alerts = 0
+        # (vehicle_id, timestamp) -> perf_counter at send, for subscribed vehicles only
+        self.in_flight: Dict[Tuple[str, str], float] = {}
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p%d_ms" % p: None for p in PERCENTILES}
+    ordered = sorted(samples)
+    return {"p%d_ms" % p: round(ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))] * 1000.0, 3)
+            for p in PERCENTILES}
+
+
+async def send_sample(client: httpx.AsyncClient, url: str, payload: dict, scheduled: float,
+                      stats: Stats, track: bool):
+    if track:
+        stats.in_flight[(payload["vehicle_id"], payload["timestamp"])] = time.perf_counter()
+    try:
+        resp = await client.post(url, json=payload)
+        stats.statuses[resp.status_code] += 1
+        if resp.status_code == 200:
+            stats.alerts += resp.json().get("alerts_generated", 0)
+    except httpx.HTTPError as exc:
+        stats.errors[type(exc).__name__] += 1
+        return
+    stats.request_latency.append(time.perf_counter() - scheduled)
+
+
+async def drive(vehicle: SimulatedVehicle, client: httpx.AsyncClient, url: str, rate: float,
+                deadline: float, mix: Tuple[List[str], List[float]], stats: Stats, track: bool,
+                pending: set):
+    interval = 1.0 / rate
+    # Spread vehicles over the first interval so they don't all fire together
+    next_send = time.perf_counter() + vehicle.rng.uniform(0, interval)
+    kinds, weights = mix
+    while next_send < deadline:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        payload = vehicle.next_payload(vehicle.rng.choices(kinds, weights)[0])
+        task = asyncio.create_task(send_sample(client, url, payload, next_send, stats, track))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        next_send += interval
+
+
+async def subscribe(ws_url: str, stats: Stats, stop: asyncio.Event, ready: asyncio.Event):
+    async with websockets.connect(ws_url) as ws:
+        ready.set()
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            received = time.perf_counter()
+            stats.ws_messages += 1
+            message = json.loads(raw)
+            if message.get("type") != "telemetry":
+                continue
+            data = message["data"]
+            sent = stats.in_flight.pop((data["vehicle_id"], data["timestamp"]), None)
+            if sent is not None:
+                stats.e2e_latency.append(received - sent)
+
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    vehicles = [SimulatedVehicle("%s%05d" % (args.prefix, i), random.Random(rng.random()))
+                for i in range(args.vehicles)]
+    base = args.url.rstrip("/")
+    url = base + ("/ingest/telemetry" if args.endpoint == "ingest" else "/telemetry")
+    ws_base = "ws" + base[len("http"):]
+    stats = Stats()
+
+    stop = asyncio.Event()
+    subscribed = vehicles[:args.subscribers]
+    readiness = [asyncio.Event() for _ in subscribed]
+    subscribers = [asyncio.create_task(subscribe("%s/ws/telemetry/%s" % (ws_base, v.vehicle_id),
+                                                 stats, stop, ready))
+                   for v, ready in zip(subscribed, readiness)]
+    if readiness:
+        await asyncio.wait_for(asyncio.gather(*(r.wait() for r in readiness)), timeout=30)
+    subscribed_ids = {v.vehicle_id for v in subscribed}
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    pending = set()
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(drive(v, client, url, args.rate, deadline, mix, stats,
+                                     v.vehicle_id in subscribed_ids, pending)
+                               for v in vehicles))
+        if pending:
+            await asyncio.wait(list(pending))
+        elapsed = time.perf_counter() - start
+
+    # Give the last broadcasts a moment to arrive
+    await asyncio.sleep(0.5)
+    stop.set()
+    await asyncio.gather(*subscribers, return_exceptions=True)
+
+    ok = stats.statuses.get(200, 0)
+    return {
+        "endpoint": url,
+        "vehicles": args.vehicles,
+        "rate_per_vehicle": args.rate,
+        "subscribers": args.subscribers,
+        "duration_s": round(elapsed, 3),
+        "requests": sum(stats.statuses.values()),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "statuses": {str(k): v for k, v in sorted(stats.statuses.items())},
+        "errors": dict(stats.errors),
+        "alerts_generated": stats.alerts,
+        "request_latency": percentiles(stats.request_latency),
+        "ws_messages": stats.ws_messages,
+        "e2e_latency": percentiles(stats.e2e_latency),
+        # Sent to a subscribed vehicle but never seen on its socket
+        "broadcasts_missed": len(stats.in_flight),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=("ingest", "telemetry"), default="ingest")
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0.5, help="samples/sec per vehicle")
+    parser.add_argument("--subscribers", type=int, default=10, help="vehicles with a WebSocket dashboard")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--prefix", default="LOAD-")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
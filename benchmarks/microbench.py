@@ -0,0 +1,243 @@
+"""Microbenchmarks for the ingest and read hot paths, with stored baselines.
+
+Run from the repo root:
+
+    python -m benchmarks.microbench                 # compare against the baseline
+    python -m benchmarks.microbench --save          # record a new baseline
+    python -m benchmarks.microbench --quick         # smaller tables, fewer repeats
+
+Each case reports the best per-operation time over several repeats (the
+least noisy estimate on a shared machine) and, when a baseline exists,
+the change against it. With ``--fail-over 0.2`` the run exits non-zero if
+any case got more than 20% slower, so it can gate a pull request.
+
+DB cases run against a throwaway SQLite file filled with ``--rows``
+telemetry rows spread over the last week across ``--vehicles`` vehicles,
+so queries see realistic table sizes instead of the empty dev database.
+Baselines are machine-specific: record one on the machine that compares.
+
+``--db URL`` runs the DB cases against an existing database instead, e.g.
+one filled by ``python -m synthetic_fleet`` (note that the create case
+adds rows to it).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+import crud
+import sql_models
+from ai_engine import AIEngine
+from database import Base
+from geofence import GeofenceEngine
+from models import GeoPoint, Geofence, VehicleTelemetry
+from serialization import dumps, telemetry_log_to_dict, telemetry_message
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "microbench.json")
+HOT_VEHICLE = "BENCH-00000"
+
+
+def telemetry_payload(rng: random.Random, vehicle_id: str = HOT_VEHICLE) -> dict:
+    return {
+        "vehicle_id": vehicle_id,
+        "timestamp": datetime.now().isoformat(),
+        "speed": rng.uniform(0, 140),
+        "rpm": rng.uniform(1000, 4000),
+        "latitude": 12.9716 + rng.uniform(-0.05, 0.05),
+        "longitude": 77.5946 + rng.uniform(-0.05, 0.05),
+        "fuel_level": rng.uniform(10, 100),
+        "battery_level": rng.uniform(10, 100),
+        "engine_temp": rng.uniform(80, 110),
+        "accelerometer": {"x": rng.uniform(-2, 2), "y": rng.uniform(-2, 2), "z": rng.uniform(8, 20)},
+    }
+
+
+def build_database(path: str, rows: int, vehicles: int, seed: int):
+    engine = create_engine("sqlite:///" + path, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    vehicle_ids = ["BENCH-%05d" % i for i in range(vehicles)]
+    now = datetime.now()
+    week = 7 * 24 * 3600
+    with engine.begin() as conn:
+        conn.execute(insert(sql_models.Vehicle), [
+            {"vehicle_id": vid, "make": "Bench", "model": "Bench", "registration_number": vid}
+            for vid in vehicle_ids
+        ])
+        batch = []
+        for i in range(rows):
+            batch.append({
+                "vehicle_id": vehicle_ids[i % vehicles],
+                "timestamp": now - timedelta(seconds=rng.uniform(0, week)),
+                "speed": rng.uniform(0, 120),
+                "latitude": 12.97 + rng.uniform(-0.1, 0.1),
+                "longitude": 77.59 + rng.uniform(-0.1, 0.1),
+                "battery_level": rng.uniform(10, 100),
+            })
+            if len(batch) == 10000:
+                conn.execute(insert(sql_models.TelemetryLog), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(sql_models.TelemetryLog), batch)
+    return engine
+
+
+def build_ai_engine(vehicle_id: str) -> AIEngine:
+    fences = GeofenceEngine()
+    rng = random.Random(7)
+    for i in range(200):
+        lat, lng = 12.9716 + rng.uniform(-0.2, 0.2), 77.5946 + rng.uniform(-0.2, 0.2)
+        if i % 2:
+            fences.add(Geofence(geofence_id="f%d" % i, name="Fence %d" % i, vehicle_id=vehicle_id,
+                                center_lat=lat, center_lng=lng, radius_m=500))
+        else:
+            fences.add(Geofence(geofence_id="f%d" % i, name="Fence %d" % i, vehicle_id=vehicle_id,
+                                shape="POLYGON", points=[
+                                    GeoPoint(lat=lat, lng=lng), GeoPoint(lat=lat + 0.01, lng=lng),
+                                    GeoPoint(lat=lat + 0.01, lng=lng + 0.01), GeoPoint(lat=lat, lng=lng + 0.01)]))
+    return AIEngine(fences)
+
+
+def make_cases(db, args, vehicle_id: str = HOT_VEHICLE):
+    rng = random.Random(args.seed)
+    payloads = [telemetry_payload(rng, vehicle_id) for _ in range(256)]
+    samples = [VehicleTelemetry(**p) for p in payloads]
+    raw = [json.dumps(p) for p in payloads]
+    ai = build_ai_engine(vehicle_id)
+    rows = crud.get_telemetry(db, vehicle_id, limit=100)
+    cycle = {"i": 0}
+
+    def next_sample():
+        cycle["i"] = (cycle["i"] + 1) % len(samples)
+        return samples[cycle["i"]]
+
+    def ai_evaluate():
+        t = next_sample()
+        ai.detect_rash_driving(t)
+        ai.predict_maintenance(t)
+        ai.detect_geofence_events(t)
+
+    # name -> (callable, operations per timing loop)
+    return {
+        "crud.create_telemetry": (lambda: crud.create_telemetry(db, next_sample()), 50),
+        "crud.get_telemetry (limit 100)": (lambda: crud.get_telemetry(db, vehicle_id, limit=100), 20),
+        "crud.get_insights (7 days)": (lambda: crud.get_insights(db, vehicle_id), 3),
+        "AIEngine rules (200 fences)": (ai_evaluate, 2000),
+        "VehicleTelemetry parse (dict)": (lambda: VehicleTelemetry(**payloads[0]), 5000),
+        "VehicleTelemetry parse (json)": (lambda: VehicleTelemetry.model_validate_json(raw[0]), 5000),
+        "broadcast frame encode": (lambda: telemetry_message(samples[0]).text(), 5000),
+        "telemetry history encode (100 rows)": (lambda: dumps([telemetry_log_to_dict(r) for r in rows]), 500),
+    }
+
+
+def run_cases(cases, repeat: int, only=None) -> dict:
+    results = {}
+    for name, (fn, number) in cases.items():
+        if only and only not in name:
+            continue
+        fn()  # warm caches and lazy imports
+        times = timeit.repeat(fn, number=number, repeat=repeat)
+        results[name] = min(times) / number
+    return results
+
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return "%9.3f ms" % (seconds * 1e3)
+    return "%9.2f us" % (seconds * 1e6)
+
+
+def report(results: dict, baseline: dict, fail_over: float) -> bool:
+    base = baseline.get("results", {}) if baseline else {}
+    width = max(len(name) for name in results)
+    print("%-*s %12s %12s %8s" % (width, "case", "current", "baseline", "change"))
+    regressed = False
+    for name, current in results.items():
+        previous = base.get(name)
+        if previous:
+            change = current / previous - 1.0
+            flag = ""
+            if fail_over and change > fail_over:
+                flag = "  REGRESSION"
+                regressed = True
+            print("%-*s %12s %12s %+7.1f%%%s" % (width, name, format_time(current),
+                                                  format_time(previous), change * 100, flag))
+        else:
+            print("%-*s %12s %12s %8s" % (width, name, format_time(current), "-", "new"))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=200000, help="telemetry rows in the benchmark DB")
+    parser.add_argument("--vehicles", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--quick", action="store_true", help="20k rows, 3 repeats")
+    parser.add_argument("--only", help="run cases whose name contains this")
+    parser.add_argument("--db", help="benchmark against this existing database (SQLAlchemy URL)")
+    parser.add_argument("--vehicle", help="vehicle to query with --db (default: the first one)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--fail-over", type=float, default=0.0,
+                        help="exit 1 if any case is slower than baseline by more than this fraction")
+    args = parser.parse_args()
+    if args.quick:
+        args.rows, args.repeat = 20000, 3
+
+    if args.db:
+        engine = create_engine(args.db)
+        db = sessionmaker(bind=engine)()
+        vehicle_id = args.vehicle or db.query(sql_models.Vehicle.vehicle_id).order_by(
+            sql_models.Vehicle.vehicle_id).limit(1).scalar()
+        try:
+            results = run_cases(make_cases(db, args, vehicle_id), args.repeat, args.only)
+        finally:
+            db.close()
+            engine.dispose()
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = build_database(os.path.join(tmp, "bench.db"), args.rows, args.vehicles, args.seed)
+            db = sessionmaker(bind=engine)()
+            try:
+                results = run_cases(make_cases(db, args), args.repeat, args.only)
+            finally:
+                db.close()
+                engine.dispose()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        dataset = args.db or args.rows
+        if baseline.get("rows") != dataset:
+            print("note: baseline was recorded against %s rows, this run used %s" % (baseline.get("rows"), dataset))
+    regressed = report(results, baseline, args.fail_over)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "rows": args.db or args.rows,
+                "vehicles": args.vehicles,
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+        print("baseline written to %s" % args.baseline)
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""HTTP response compression (brotli / gzip) and precompressed body cache.
+
+Large JSON bodies (trip routes, telemetry history) are compressed by
+``CompressionMiddleware`` when the client accepts it. Bodies that never
+change for a given resource version can be compressed once and served from
+``precompressed_cache`` via ``precompressed_response``.
+"""
+import gzip
+import os
+from typing import Callable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MINIMUM_SIZE = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = 6
+# Quality 5 is close to gzip speed with noticeably smaller JSON output
+BROTLI_QUALITY = 5
+# Precompressed bodies are cached at a higher ratio since they are reused
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 11
+
+precompressed_cache = LRUCache(maxsize=512)
+
+
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def choose_encoding(accept_encoding: Optional[str], supported: Tuple[str, ...] = ("br", "gzip")) -> Optional[str]:
+    """The ``supported`` coding with the highest q-value, earlier ones winning ties.
+
+    ``q=0`` means "not acceptable", and ``*`` stands for codings not listed.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        accepted[coding.strip().lower()] = _quality(params)
+    best, best_q = None, 0.0
+    for coding in supported:
+        if coding == "br" and brotli is None:
+            continue
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, encoding: str, cached: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=CACHED_BROTLI_QUALITY if cached else BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=CACHED_GZIP_LEVEL if cached else GZIP_LEVEL)
+
+
+def precompressed_response(request: Request, key, build_body: Callable[[], bytes],
+                           headers: dict = None, media_type: str = "application/json") -> Response:
+    """Serve ``build_body()`` for an immutable ``key``, compressing it at most once per encoding.
+
+    ``key`` must change whenever the body would (e.g. include the resource ETag).
+    """
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    entry = precompressed_cache.get((key, encoding))
+    if entry is None:
+        identity = precompressed_cache.get((key, None))
+        if identity is None:
+            identity = (None, build_body())
+            precompressed_cache.put((key, None), identity)
+        body = identity[1]
+        if encoding and len(body) >= MINIMUM_SIZE:
+            entry = (encoding, compress(body, encoding, cached=True))
+        else:
+            entry = identity
+        precompressed_cache.put((key, encoding), entry)
+    encoding, body = entry
+
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class CompressionMiddleware:
+    """Compress single-chunk responses above ``minimum_size``.
+
+    Streaming responses and bodies that already carry a Content-Encoding
+    pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = None
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                if b"content-encoding" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if start_message is not None:
+                start, start_message = start_message, None
+                if message.get("more_body") or len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                body = compress(body, encoding)
+                headers = [(k, v) for k, v in start.get("headers", [])
+                           if k.lower() not in (b"content-length", b"vary")]
+                headers += [
+                    (b"content-encoding", encoding.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"vary", b"Accept-Encoding"),
+                ]
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": body})
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
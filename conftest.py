@@ -0,0 +1,18 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Keep the suite off the developer's databases and data directories: point
+# everything at a scratch directory before any app module reads its settings
+_tmp = tempfile.mkdtemp(prefix="fleet-tests-")
+atexit.register(shutil.rmtree, _tmp, ignore_errors=True)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmp, "sql_app.db")
+os.environ["TELEMETRY_SHARD_URL"] = "sqlite:///" + os.path.join(_tmp, "telemetry_shard_{shard}.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(_tmp, "archive")
+os.environ["IMPORT_DIR"] = os.path.join(_tmp, "imports")
+
+# The app no longer creates tables on import; give the test database its schema
+from migrate import migrate
+
+migrate()
@@ -1,26 +1,44 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, selectinload
 import sql_models
 import models
 import json
+from cache import profile_cache
+import versions
+import shards
+from geo import geohash_decode
 
-from passlib.context import CryptContext
+_pwd_context = None
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def get_pwd_context():
+    # passlib is only needed once someone logs in; keep it off the import path
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 def get_user(db: Session, user_id: str):
-    return db.query(sql_models.User).filter(sql_models.User.user_id == user_id).first()
+    # Profiles always include vehicles, so load them together instead of lazily
+    return db.query(sql_models.User).options(
+        selectinload(sql_models.User.vehicles)
+    ).filter(sql_models.User.user_id == user_id).first()
 
 def get_user_by_phone(db: Session, phone: str):
-    return db.query(sql_models.User).filter(sql_models.User.phone == phone).first()
+    return db.query(sql_models.User).options(
+        selectinload(sql_models.User.vehicles)
+    ).filter(sql_models.User.phone == phone).first()
 
-def create_user(db: Session, user: models.UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: models.UserCreate, hashed_password: str = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     # Exclude password from dict, add hashed_password
     user_data = user.dict()
     del user_data['password']
@@ -29,6 +47,7 @@ def create_user(db: Session, user: models.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    profile_cache.invalidate(db_user.user_id)
     return db_user
 
 def get_vehicle(db: Session, vehicle_id: str):
@@ -37,47 +56,70 @@ def get_vehicle(db: Session, vehicle_id: str):
 def create_vehicle(db: Session, vehicle: models.Vehicle):
     db_vehicle = sql_models.Vehicle(**vehicle.dict())
     db.add(db_vehicle)
+    versions.bump(db, "vehicle", db_vehicle.vehicle_id)
     db.commit()
     db.refresh(db_vehicle)
+    profile_cache.invalidate(db_vehicle.owner_id)
     return db_vehicle
 
 def update_vehicle(db: Session, vehicle_id: str, vehicle_update: dict):
     db_vehicle = db.query(sql_models.Vehicle).filter(sql_models.Vehicle.vehicle_id == vehicle_id).first()
     if db_vehicle:
+        # The update may move the vehicle to another owner
+        profile_cache.invalidate(db_vehicle.owner_id)
         for key, value in vehicle_update.items():
             setattr(db_vehicle, key, value)
+        versions.bump(db, "vehicle", vehicle_id)
         db.commit()
         db.refresh(db_vehicle)
+        profile_cache.invalidate(db_vehicle.owner_id)
     return db_vehicle
 
 def delete_vehicle(db: Session, vehicle_id: str):
     db_vehicle = db.query(sql_models.Vehicle).filter(sql_models.Vehicle.vehicle_id == vehicle_id).first()
     if db_vehicle:
+        owner_id = db_vehicle.owner_id
         db.delete(db_vehicle)
+        versions.bump(db, "vehicle", vehicle_id)
         db.commit()
+        profile_cache.invalidate(owner_id)
     return db_vehicle
 
+# Telemetry and alerts live on the vehicle's shard (see shards.py); with
+# sharding off, shards.router hands back `db` itself.
+
 def get_alerts(db: Session, vehicle_id: str, actioned: bool = None):
-    query = db.query(sql_models.Alert).filter(sql_models.Alert.vehicle_id == vehicle_id)
-    if actioned is not None:
-        query = query.filter(sql_models.Alert.is_actioned == actioned)
-    return query.all()
+    with shards.router.session(db, vehicle_id) as shard_db:
+        query = shard_db.query(sql_models.Alert).filter(sql_models.Alert.vehicle_id == vehicle_id)
+        if actioned is not None:
+            query = query.filter(sql_models.Alert.is_actioned == actioned)
+        return query.all()
 
 def create_alert(db: Session, alert: models.Alert):
     db_alert = sql_models.Alert(**alert.dict())
-    db.add(db_alert)
-    db.commit()
-    db.refresh(db_alert)
+    with shards.router.session(db, alert.vehicle_id) as shard_db:
+        shard_db.add(db_alert)
+        versions.bump(shard_db, "alerts", alert.vehicle_id)
+        shard_db.commit()
+        shard_db.refresh(db_alert)
     return db_alert
 
-def action_alert(db: Session, alert_id: str):
+def _action_alert(db: Session, alert_id: str):
     alert = db.query(sql_models.Alert).filter(sql_models.Alert.alert_id == alert_id).first()
     if alert:
         alert.is_actioned = True
+        versions.bump(db, "alerts", alert.vehicle_id)
         db.commit()
         db.refresh(alert)
     return alert
 
+def action_alert(db: Session, alert_id: str):
+    # Only the id is known, so ask every shard
+    for alert in shards.router.fan_out(db, lambda shard_db: _action_alert(shard_db, alert_id)):
+        if alert:
+            return alert
+    return None
+
 def get_trips(db: Session, vehicle_id: str):
     trips = db.query(sql_models.Trip).filter(sql_models.Trip.vehicle_id == vehicle_id).all()
     # Convert JSON string back to list of dicts for response if needed, 
@@ -92,10 +134,87 @@ def create_trip(db: Session, trip: models.Trip):
     
     db_trip = sql_models.Trip(**trip_data)
     db.add(db_trip)
+    versions.bump(db, "trips", db_trip.vehicle_id)
     db.commit()
     db.refresh(db_trip)
     return db_trip
 
+def get_geofence(db: Session, geofence_id: str):
+    return db.query(sql_models.Geofence).filter(sql_models.Geofence.geofence_id == geofence_id).first()
+
+def get_geofences(db: Session, vehicle_id: str = None, user_id: str = None):
+    query = db.query(sql_models.Geofence)
+    if vehicle_id is not None:
+        query = query.filter(sql_models.Geofence.vehicle_id == vehicle_id)
+    if user_id is not None:
+        query = query.filter(sql_models.Geofence.user_id == user_id)
+    return query.all()
+
+def create_geofence(db: Session, geofence: models.Geofence):
+    fence_data = geofence.dict()
+    fence_data['points_json'] = json.dumps([p.dict() for p in geofence.points])
+    del fence_data['points']
+
+    db_fence = sql_models.Geofence(**fence_data)
+    db.add(db_fence)
+    db.commit()
+    db.refresh(db_fence)
+    return db_fence
+
+def delete_geofence(db: Session, geofence_id: str):
+    db_fence = get_geofence(db, geofence_id)
+    if db_fence:
+        db.delete(db_fence)
+        db.commit()
+    return db_fence
+
+def get_vehicle_owners(db: Session):
+    return db.query(sql_models.Vehicle.vehicle_id, sql_models.Vehicle.owner_id).all()
+
+def increment_heatmap_cells(db: Session, increments: dict):
+    rows = []
+    for (precision, kind, geohash, bucket), count in increments.items():
+        lat, lng = geohash_decode(geohash)
+        rows.append({"precision": precision, "kind": kind, "geohash": geohash,
+                     "bucket": bucket, "lat": lat, "lng": lng, "count": count})
+
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(sql_models.HeatmapCell).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["precision", "kind", "geohash", "bucket"],
+        set_={"count": sql_models.HeatmapCell.count + stmt.excluded.count}
+    )
+    db.execute(stmt)
+    db.commit()
+
+def get_heatmap_cells(db: Session, precision: int, kind: str, start, end,
+                      min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    cell = sql_models.HeatmapCell
+    return db.query(
+        cell.geohash, cell.lat, cell.lng, func.sum(cell.count)
+    ).filter(
+        cell.precision == precision,
+        cell.kind == kind,
+        cell.bucket >= start,
+        cell.bucket < end,
+        cell.lat.between(min_lat, max_lat),
+        cell.lng.between(min_lng, max_lng)
+    ).group_by(cell.geohash, cell.lat, cell.lng).all()
+
+def clear_heatmap_cells(db: Session):
+    db.query(sql_models.HeatmapCell).delete()
+    db.commit()
+
+def iter_telemetry_positions(db: Session):
+    log = sql_models.TelemetryLog
+    for shard_db in shards.router.each(db):
+        yield from shard_db.query(log.latitude, log.longitude, log.timestamp).yield_per(10000)
+
+def iter_alert_positions(db: Session):
+    alert = sql_models.Alert
+    for shard_db in shards.router.each(db):
+        yield from shard_db.query(alert.latitude, alert.longitude, alert.location, alert.timestamp).yield_per(10000)
+
 def create_telemetry(db: Session, telemetry: models.VehicleTelemetry):
     # Only store fields that exist in sql_models.TelemetryLog
     telemetry_data = {
@@ -108,15 +227,27 @@ def create_telemetry(db: Session, telemetry: models.VehicleTelemetry):
     }
     
     db_telemetry = sql_models.TelemetryLog(**telemetry_data)
-    db.add(db_telemetry)
-    db.commit()
-    db.refresh(db_telemetry)
+    with shards.router.session(db, telemetry.vehicle_id) as shard_db:
+        shard_db.add(db_telemetry)
+        versions.bump(shard_db, "insights", telemetry.vehicle_id)
+        shard_db.commit()
+        shard_db.refresh(db_telemetry)
     return db_telemetry
 
 def get_telemetry(db: Session, vehicle_id: str, limit: int = 100):
-    return db.query(sql_models.TelemetryLog).filter(
-        sql_models.TelemetryLog.vehicle_id == vehicle_id
-    ).order_by(sql_models.TelemetryLog.timestamp.desc()).limit(limit).all()
+    with shards.router.session(db, vehicle_id) as shard_db:
+        hot = shard_db.query(sql_models.TelemetryLog).filter(
+            sql_models.TelemetryLog.vehicle_id == vehicle_id
+        ).order_by(sql_models.TelemetryLog.timestamp.desc()).limit(limit).all()
+    # The archive only holds rows older than its high-water mark, so it can't change a full page of newer rows
+    import archive
+    archived_before = archive.telemetry_archive.archived_before()
+    if archived_before is None or (len(hot) == limit and hot[-1].timestamp >= archived_before):
+        return hot
+    cold = archive.telemetry_archive.latest(vehicle_id, limit)
+    if not cold:
+        return hot
+    return sorted(hot + cold, key=lambda row: row.timestamp, reverse=True)[:limit]
 
 def get_insights(db: Session, vehicle_id: str):
     from datetime import datetime, timedelta
@@ -125,10 +256,15 @@ def get_insights(db: Session, vehicle_id: str):
     seven_days_ago = datetime.now() - timedelta(days=7)
     
     # Fetch logs
-    logs = db.query(sql_models.TelemetryLog).filter(
-        sql_models.TelemetryLog.vehicle_id == vehicle_id,
-        sql_models.TelemetryLog.timestamp >= seven_days_ago
-    ).all()
+    with shards.router.session(db, vehicle_id) as shard_db:
+        logs = shard_db.query(sql_models.TelemetryLog).filter(
+            sql_models.TelemetryLog.vehicle_id == vehicle_id,
+            sql_models.TelemetryLog.timestamp >= seven_days_ago
+        ).all()
+    import archive
+    archived_before = archive.telemetry_archive.archived_before()
+    if archived_before is not None and seven_days_ago < archived_before:
+        logs += archive.telemetry_archive.rows(vehicle_id, start=seven_days_ago)
     
     # Process logs
     daily_speeds = {}
@@ -0,0 +1,187 @@
+"""Duplicate suppression and short-window reordering for telemetry ingest.
+
+Devices may tag samples with a per-vehicle ``seq`` (monotonic counter) or
+an opaque ``message_id``. Per vehicle we keep the highest seq seen plus a
+64-bit bitmap of the seqs just below it (the anti-replay window used by
+IPsec), or the last few message ids, so a retried sample is recognised in
+O(1) and dropped before any DB or AIEngine work. A seq more than the
+window below the highest one means the device restarted its counter, and
+the window starts over from it. A sample stays "in
+flight" until the caller reports it ``done`` or ``forget``s it; a retry
+that arrives meanwhile is neither processed nor acked, because the
+original may still fail.
+
+With seqs, ``ReorderBuffer`` also lets a sample that arrives ahead of a gap
+wait briefly for the missing one, so alerts and geofence transitions are
+evaluated in order when the network reorders requests.
+"""
+import asyncio
+import os
+from collections import deque
+from typing import Dict, Optional
+
+from models import VehicleTelemetry
+
+SEQ_WINDOW = 64
+MESSAGE_ID_WINDOW = int(os.environ.get("INGEST_MESSAGE_ID_WINDOW", 128))
+REORDER_WAIT_S = float(os.environ.get("INGEST_REORDER_WAIT_MS", 200)) / 1000.0
+# Gaps wider than this are treated as lost samples, not reordering
+REORDER_MAX_GAP = 16
+
+_WINDOW_MASK = (1 << SEQ_WINDOW) - 1
+
+# check() verdicts
+NEW = "new"
+DUPLICATE = "duplicate"
+IN_FLIGHT = "in_flight"
+
+
+class _SeqState:
+    __slots__ = ("high", "window", "ids", "id_set", "in_flight")
+
+    def __init__(self):
+        self.high = -1
+        self.window = 0  # bit i set => seq (high - i) already seen
+        self.ids = None
+        self.id_set = None
+        self.in_flight = set()  # seqs / message ids accepted but not yet done
+
+
+class IngestDeduplicator:
+    def __init__(self):
+        self._states: Dict[str, _SeqState] = {}
+        self.duplicates = 0
+
+    @staticmethod
+    def _key(telemetry: VehicleTelemetry):
+        return telemetry.seq if telemetry.seq is not None else telemetry.message_id
+
+    def check(self, telemetry: VehicleTelemetry) -> str:
+        """Record the sample: NEW (now in flight), DUPLICATE of a processed one, or IN_FLIGHT."""
+        key = self._key(telemetry)
+        if key is None:
+            return NEW
+        state = self._states.get(telemetry.vehicle_id)
+        if state is None:
+            state = _SeqState()
+            self._states[telemetry.vehicle_id] = state
+        if key in state.in_flight:
+            return IN_FLIGHT
+
+        if telemetry.seq is not None:
+            duplicate = self._check_seq(state, telemetry.seq)
+        else:
+            duplicate = self._check_id(state, telemetry.message_id)
+        if duplicate:
+            self.duplicates += 1
+            return DUPLICATE
+        state.in_flight.add(key)
+        return NEW
+
+    def done(self, telemetry: VehicleTelemetry):
+        """The sample was processed; copies of it are duplicates from now on."""
+        state = self._states.get(telemetry.vehicle_id)
+        if state is not None:
+            state.in_flight.discard(self._key(telemetry))
+
+    def _check_seq(self, state: _SeqState, seq: int) -> bool:
+        if seq > state.high:
+            shift = seq - state.high
+            state.window = ((state.window << shift) | 1) & _WINDOW_MASK if shift < SEQ_WINDOW else 1
+            state.high = seq
+            return False
+        offset = state.high - seq
+        if offset >= SEQ_WINDOW:
+            # A jump back past the window is a device restart, not a late
+            # sample: start a fresh window at seq so its retries are caught
+            state.high = seq
+            state.window = 1
+            return False
+        bit = 1 << offset
+        if state.window & bit:
+            return True
+        state.window |= bit
+        return False
+
+    def _check_id(self, state: _SeqState, message_id: str) -> bool:
+        if state.ids is None:
+            state.ids = deque()
+            state.id_set = set()
+        if message_id in state.id_set:
+            return True
+        state.ids.append(message_id)
+        state.id_set.add(message_id)
+        if len(state.ids) > MESSAGE_ID_WINDOW:
+            state.id_set.discard(state.ids.popleft())
+        return False
+
+    def forget(self, telemetry: VehicleTelemetry):
+        """Undo ``check`` for a sample whose processing failed, so its retry is accepted."""
+        state = self._states.get(telemetry.vehicle_id)
+        if state is None:
+            return
+        state.in_flight.discard(self._key(telemetry))
+        if telemetry.seq is not None:
+            offset = state.high - telemetry.seq
+            if 0 <= offset < SEQ_WINDOW:
+                state.window &= ~(1 << offset)
+        elif telemetry.message_id in (state.id_set or ()):
+            # Out of the deque too, or its stale entry would later evict a re-added id early
+            state.id_set.discard(telemetry.message_id)
+            state.ids.remove(telemetry.message_id)
+
+    def remove(self, vehicle_id: str):
+        self._states.pop(vehicle_id, None)
+
+
+class _Pending:
+    __slots__ = ("next_seq", "waiters")
+
+    def __init__(self):
+        self.next_seq: Optional[int] = None
+        self.waiters: Dict[int, asyncio.Future] = {}
+
+
+class ReorderBuffer:
+    def __init__(self, wait_s: float = REORDER_WAIT_S):
+        self.wait_s = wait_s
+        self._vehicles: Dict[str, _Pending] = {}
+        self.reordered = 0
+
+    async def wait_turn(self, vehicle_id: str, seq: Optional[int]):
+        """Hold a sample that is ahead of a small gap until the gap fills or ``wait_s`` passes."""
+        if seq is None or self.wait_s <= 0:
+            return
+        pending = self._vehicles.get(vehicle_id)
+        if pending is None:
+            pending = _Pending()
+            self._vehicles[vehicle_id] = pending
+        if pending.next_seq is None or seq <= pending.next_seq or seq - pending.next_seq > REORDER_MAX_GAP:
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        pending.waiters[seq] = future
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.wait_s)
+            self.reordered += 1
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            pending.waiters.pop(seq, None)
+
+    def done(self, vehicle_id: str, seq: Optional[int]):
+        """Mark ``seq`` processed and release the next waiting sample, if any."""
+        if seq is None:
+            return
+        pending = self._vehicles.get(vehicle_id)
+        if pending is None:
+            return
+        # Far behind next_seq: the device restarted its counter (see IngestDeduplicator)
+        if pending.next_seq is None or seq + 1 > pending.next_seq or pending.next_seq - seq > SEQ_WINDOW:
+            pending.next_seq = seq + 1
+        waiter = pending.waiters.get(pending.next_seq)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(True)
+
+    def remove(self, vehicle_id: str):
+        self._vehicles.pop(vehicle_id, None)
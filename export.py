@@ -0,0 +1,169 @@
+"""Streaming telemetry export for ``GET /export/telemetry``.
+
+Rows come from the archive (oldest months first) and then from the
+database through a server-side cursor (``stream_results`` / ``yield_per``,
+a named cursor on PostgreSQL), ``BATCH_ROWS`` at a time. Each batch is
+encoded and sent before the next one is fetched, so memory use stays flat
+and the first bytes go out right away however large the export is.
+
+CSV and NDJSON are gzipped on the fly when the client accepts it.
+Parquet needs pyarrow and writes one row group per batch.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+from itertools import repeat
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+
+import archive
+import database
+import shards
+import sql_models
+from serialization import dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 10000))
+COLUMNS = ("vehicle_id", "timestamp", "speed", "latitude", "longitude", "battery_level")
+
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+if pyarrow is not None:
+    MEDIA_TYPES["parquet"] = "application/vnd.apache.parquet"
+
+
+def _archive_batches(vehicle_id: str, start: Optional[datetime], end: Optional[datetime]) -> Iterator[List[tuple]]:
+    for cols in archive.telemetry_archive.iter_months(vehicle_id, start, end):
+        for lo in range(0, len(cols["ts"]), BATCH_ROWS):
+            chunk = {k: v[lo:lo + BATCH_ROWS] for k, v in cols.items()}
+            yield list(zip(repeat(vehicle_id), *archive.decode_columns(chunk)))
+
+
+def _db_batches(shard_db, vehicle_id: Optional[str], start: Optional[datetime], end: Optional[datetime]) -> Iterator[List[tuple]]:
+    log = sql_models.TelemetryLog
+    query = select(log.vehicle_id, log.timestamp, log.speed, log.latitude, log.longitude, log.battery_level)
+    if vehicle_id is not None:
+        query = query.where(log.vehicle_id == vehicle_id)
+    if start is not None:
+        query = query.where(log.timestamp >= start)
+    if end is not None:
+        query = query.where(log.timestamp < end)
+    query = query.order_by(log.vehicle_id, log.timestamp)
+    result = shard_db.execute(query.execution_options(stream_results=True, yield_per=BATCH_ROWS))
+    try:
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+    finally:
+        result.close()
+
+
+def iter_batches(vehicle_id: Optional[str] = None, start: Optional[datetime] = None,
+                 end: Optional[datetime] = None) -> Iterator[List[tuple]]:
+    """Telemetry rows as ``COLUMNS`` tuples, in batches of at most ``BATCH_ROWS``.
+
+    ``vehicle_id=None`` exports the whole fleet: the archive vehicle by
+    vehicle, then every shard in turn.
+    """
+    # The response outlives the request's session, so the generator owns its own
+    db = database.SessionLocal()
+    try:
+        for vid in ([vehicle_id] if vehicle_id is not None else archive.telemetry_archive.vehicles()):
+            yield from _archive_batches(vid, start, end)
+        if vehicle_id is not None:
+            with shards.router.session(db, vehicle_id) as shard_db:
+                yield from _db_batches(shard_db, vehicle_id, start, end)
+        else:
+            for shard_db in shards.router.each(db):
+                yield from _db_batches(shard_db, None, start, end)
+    finally:
+        db.close()
+
+
+def encode_csv(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    for batch in batches:
+        writer.writerows(
+            (vid, ts.isoformat(), speed, lat, lng, "" if battery is None else battery)
+            for vid, ts, speed, lat, lng, battery in batch
+        )
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    # Header-only exports still get their header
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def encode_ndjson(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield b"".join(dumps(dict(zip(COLUMNS, row))) + b"\n" for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file for ParquetWriter that hands back what was written since the last drain
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def encode_parquet(batches: Iterable[List[tuple]]) -> Iterator[bytes]:
+    schema = pyarrow.schema([
+        ("vehicle_id", pyarrow.string()),
+        ("timestamp", pyarrow.timestamp("us")),
+        ("speed", pyarrow.float64()),
+        ("latitude", pyarrow.float64()),
+        ("longitude", pyarrow.float64()),
+        ("battery_level", pyarrow.float64()),
+    ])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    for batch in batches:
+        writer.write_table(pyarrow.table(dict(zip(COLUMNS, zip(*batch))), schema=schema))
+        yield sink.drain()
+    # Footer
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        # Sync-flush per batch so gzip doesn't hold back the first bytes
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream(fmt: str, vehicle_id: Optional[str] = None, start: Optional[datetime] = None,
+           end: Optional[datetime] = None, gzip: bool = False) -> Iterator[bytes]:
+    chunks = ENCODERS[fmt](iter_batches(vehicle_id, start, end))
+    return gzip_stream(chunks) if gzip else chunks
@@ -0,0 +1,146 @@
+"""Offline reverse geocoding against a local place list.
+
+The CSV (name, region, latitude, longitude) is compiled once into a NumPy
+array sorted by grid cell, which every worker opens with mmap so the OS page
+cache holds a single shared copy. Lookups are memoized on coordinates rounded
+to ~100 m, so a vehicle sitting in traffic resolves its locality once.
+
+Rebuild after editing the CSV (it is also rebuilt automatically when stale):
+
+    python geocoder.py data/places.csv
+"""
+import math
+import os
+import sys
+from functools import lru_cache
+from typing import Optional
+
+from geo import haversine_m
+
+DEFAULT_PLACES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "places.csv")
+
+CELL_DEG = 0.1
+# Rings of neighbouring cells searched around the query cell (~20 km)
+MAX_RING = 2
+MAX_DISTANCE_M = 25000.0
+QUANTIZE_DIGITS = 3
+CACHE_SIZE = 65536
+
+# numpy is imported where it is used so importing this module (and main) stays cheap
+_DTYPE = [("cell", "<i8"), ("lat", "<f8"), ("lng", "<f8")]
+
+
+def _cell_key(ci: int, cj: int) -> int:
+    return (ci + 1000) * 10000 + (cj + 2000)
+
+
+def _cell(lat: float, lng: float):
+    return math.floor(lat / CELL_DEG), math.floor(lng / CELL_DEG)
+
+
+def _index_paths(csv_path: str):
+    base, _ = os.path.splitext(csv_path)
+    return base + ".npy", base + ".labels"
+
+
+def build_index(csv_path: str):
+    import csv
+
+    import numpy as np
+
+    rows = []
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            lat = float(row["latitude"])
+            lng = float(row["longitude"])
+            label = row["name"]
+            if row.get("region"):
+                label = f"{label}, {row['region']}"
+            rows.append((_cell_key(*_cell(lat, lng)), lat, lng, label))
+    rows.sort(key=lambda r: r[0])
+
+    arr = np.array([r[:3] for r in rows], dtype=_DTYPE)
+    npy_path, labels_path = _index_paths(csv_path)
+    # Write to temp files and rename so concurrently booting workers never see half a file
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+    tmp_labels = f"{labels_path}.{os.getpid()}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, arr)
+    with open(tmp_labels, "w", encoding="utf-8") as f:
+        f.write("\n".join(r[3] for r in rows))
+    os.replace(tmp_labels, labels_path)
+    os.replace(tmp_npy, npy_path)
+    return npy_path, labels_path
+
+
+class ReverseGeocoder:
+    def __init__(self, places_file: str = None):
+        self.places_file = places_file or os.environ.get("PLACES_FILE", DEFAULT_PLACES_FILE)
+        self._places = None
+        self._labels = None
+        self._loaded = False
+        self._cached_lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup)
+
+    def _load(self):
+        self._loaded = True
+        if not os.path.exists(self.places_file):
+            print(f"Reverse geocoder disabled: {self.places_file} not found")
+            return
+        npy_path, labels_path = _index_paths(self.places_file)
+        try:
+            if (not os.path.exists(npy_path)
+                    or os.path.getmtime(npy_path) < os.path.getmtime(self.places_file)):
+                build_index(self.places_file)
+        except OSError as e:
+            print(f"Reverse geocoder disabled: cannot build index ({e})")
+            return
+        import numpy as np
+
+        self._places = np.load(npy_path, mmap_mode="r")
+        with open(labels_path, encoding="utf-8") as f:
+            self._labels = f.read().split("\n")
+
+    def warm_up(self):
+        """Open the index now instead of on the first lookup."""
+        if not self._loaded:
+            self._load()
+
+    def reverse(self, lat: float, lng: float) -> Optional[str]:
+        """Nearest place label, or None when nothing is within range."""
+        if not self._loaded:
+            self._load()
+        if self._places is None:
+            return None
+        return self._cached_lookup(round(lat, QUANTIZE_DIGITS), round(lng, QUANTIZE_DIGITS))
+
+    def _lookup(self, lat: float, lng: float) -> Optional[str]:
+        cells = self._places["cell"]
+        ci, cj = _cell(lat, lng)
+        best = None
+        best_dist = MAX_DISTANCE_M
+        for ring in range(MAX_RING + 1):
+            for di in range(-ring, ring + 1):
+                for dj in range(-ring, ring + 1):
+                    if max(abs(di), abs(dj)) != ring:
+                        continue
+                    key = _cell_key(ci + di, cj + dj)
+                    lo = cells.searchsorted(key, side="left")
+                    hi = cells.searchsorted(key, side="right")
+                    for i in range(lo, hi):
+                        place = self._places[i]
+                        d = haversine_m(lat, lng, float(place["lat"]), float(place["lng"]))
+                        if d < best_dist:
+                            best, best_dist = i, d
+            # A hit in the 3x3 neighbourhood is close enough; outer rings only help sparse areas
+            if best is not None and ring >= 1:
+                break
+        return self._labels[best] if best is not None else None
+
+    def cache_info(self):
+        return self._cached_lookup.cache_info()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PLACES_FILE
+    npy_path, _ = build_index(path)
+    print(f"Built {npy_path}")
@@ -0,0 +1,146 @@
+import math
+from typing import Dict, List, Optional, Set, Tuple
+
+from geo import haversine_m, radius_to_bbox
+from models import Geofence
+
+# Fences are bucketed into coarse grid cells (~5.5 km) by their bounding box,
+# so a sample is only tested against fences whose box overlaps its cell.
+FENCE_CELL_DEG = 0.05
+# Fences spanning more cells than this (state-sized areas) skip the grid and
+# are tested on every sample instead of bloating the index.
+MAX_CELLS_PER_FENCE = 400
+
+
+class _Fence:
+    __slots__ = ("geofence_id", "name", "user_id", "vehicle_id", "shape",
+                 "center_lat", "center_lng", "radius_m", "points", "bbox", "trigger")
+
+    def __init__(self, fence: Geofence):
+        self.geofence_id = fence.geofence_id
+        self.name = fence.name
+        self.user_id = fence.user_id
+        self.vehicle_id = fence.vehicle_id
+        self.shape = fence.shape
+        self.trigger = fence.trigger
+        self.center_lat = fence.center_lat
+        self.center_lng = fence.center_lng
+        self.radius_m = fence.radius_m
+        self.points = [(p.lat, p.lng) for p in fence.points]
+        if self.shape == "CIRCLE":
+            self.bbox = radius_to_bbox(self.center_lat, self.center_lng, self.radius_m)
+        else:
+            lats = [p[0] for p in self.points]
+            lngs = [p[1] for p in self.points]
+            self.bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    def applies_to(self, vehicle_id: str, owner_id: Optional[str]) -> bool:
+        if self.vehicle_id is not None:
+            return self.vehicle_id == vehicle_id
+        return owner_id is not None and self.user_id == owner_id
+
+    def contains(self, lat: float, lng: float) -> bool:
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        if self.shape == "CIRCLE":
+            return haversine_m(self.center_lat, self.center_lng, lat, lng) <= self.radius_m
+        # Ray casting; fences are small enough to treat lat/lng as planar
+        inside = False
+        pts = self.points
+        j = len(pts) - 1
+        for i in range(len(pts)):
+            yi, xi = pts[i]
+            yj, xj = pts[j]
+            if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+        return inside
+
+
+class GeofenceEngine:
+    """Spatially indexed geofences with enter/exit state per vehicle."""
+
+    def __init__(self):
+        self._fences: Dict[str, _Fence] = {}
+        self._cells: Dict[Tuple[int, int], Set[str]] = {}
+        self._fence_cells: Dict[str, List[Tuple[int, int]]] = {}
+        self._large: Set[str] = set()
+        # vehicle_id -> fence ids the vehicle is currently inside
+        self._inside: Dict[str, Set[str]] = {}
+        self._vehicle_owner: Dict[str, str] = {}
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / FENCE_CELL_DEG), math.floor(lng / FENCE_CELL_DEG))
+
+    def add(self, fence: Geofence):
+        self.remove(fence.geofence_id)
+        f = _Fence(fence)
+        self._fences[f.geofence_id] = f
+        ci0, cj0 = self._cell(f.bbox[0], f.bbox[1])
+        ci1, cj1 = self._cell(f.bbox[2], f.bbox[3])
+        if (ci1 - ci0 + 1) * (cj1 - cj0 + 1) > MAX_CELLS_PER_FENCE:
+            self._large.add(f.geofence_id)
+            return
+        cells = [(i, j) for i in range(ci0, ci1 + 1) for j in range(cj0, cj1 + 1)]
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(f.geofence_id)
+        self._fence_cells[f.geofence_id] = cells
+
+    def remove(self, geofence_id: str):
+        if self._fences.pop(geofence_id, None) is None:
+            return
+        self._large.discard(geofence_id)
+        for cell in self._fence_cells.pop(geofence_id, []):
+            members = self._cells.get(cell)
+            if members is not None:
+                members.discard(geofence_id)
+                if not members:
+                    del self._cells[cell]
+        for inside in self._inside.values():
+            inside.discard(geofence_id)
+
+    def set_vehicle_owner(self, vehicle_id: str, owner_id: Optional[str]):
+        if owner_id is None:
+            self._vehicle_owner.pop(vehicle_id, None)
+        else:
+            self._vehicle_owner[vehicle_id] = owner_id
+
+    def check(self, vehicle_id: str, lat: float, lng: float) -> List[Tuple[_Fence, str]]:
+        """Update vehicle state and return (fence, "ENTER"/"EXIT") transitions."""
+        previous = self._inside.get(vehicle_id)
+        if not self._fences and not previous:
+            return []
+
+        owner_id = self._vehicle_owner.get(vehicle_id)
+        candidates = self._cells.get(self._cell(lat, lng), set())
+        if self._large:
+            candidates = candidates | self._large
+
+        current = set()
+        for fid in candidates:
+            fence = self._fences[fid]
+            if fence.applies_to(vehicle_id, owner_id) and fence.contains(lat, lng):
+                current.add(fid)
+
+        if previous is None:
+            # First sample seen for this vehicle: establish state without alerting
+            self._inside[vehicle_id] = current
+            return []
+
+        events = []
+        for fid in current - previous:
+            events.append((self._fences[fid], "ENTER"))
+        for fid in previous - current:
+            fence = self._fences.get(fid)
+            if fence is not None:
+                events.append((fence, "EXIT"))
+        self._inside[vehicle_id] = current
+        return [(f, e) for f, e in events if f.trigger in (e, "BOTH")]
+
+    def forget_vehicle(self, vehicle_id: str):
+        self._inside.pop(vehicle_id, None)
+        self._vehicle_owner.pop(vehicle_id, None)
+
+    def __len__(self):
+        return len(self._fences)
@@ -0,0 +1,168 @@
+"""Geohash heatmap counters and tile cache.
+
+Every stored telemetry position and every alert bumps a counter for its
+geohash cell, per hour, at each zoom-relevant precision. Counters are
+batched in memory and upserted into ``heatmap_cells``, so a tile request
+reads a handful of pre-aggregated cells instead of raw history.
+"""
+import itertools
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import crud
+from cache import LRUCache
+from geo import geohash_encode
+
+PRECISIONS = (3, 4, 5, 6, 7)
+FLUSH_INTERVAL_S = 5.0
+FLUSH_MAX_PENDING = 1000
+TILE_CACHE_SIZE = 2048
+# Tiles that include the current hour are still changing
+LIVE_TILE_TTL_S = 30.0
+# Closed ranges change only with late data; imports and rebuilds in other
+# processes can't clear this process's cache, so they expire too
+CLOSED_TILE_TTL_S = 600.0
+
+KINDS = ("telemetry", "alert")
+
+
+def precision_for_zoom(zoom: int) -> int:
+    # Roughly one geohash cell per 8-16 screen pixels on a 256px tile
+    if zoom <= 5:
+        return 3
+    if zoom <= 8:
+        return 4
+    if zoom <= 11:
+        return 5
+    if zoom <= 14:
+        return 6
+    return 7
+
+
+def tile_bounds(z: int, x: int, y: int):
+    """(min_lat, min_lng, max_lat, max_lng) of a slippy-map tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def hour_bucket(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+class HeatmapAggregator:
+    def __init__(self, tile_cache: Optional[LRUCache] = None):
+        # (precision, kind, geohash, bucket) -> pending increment
+        self._pending: Dict[Tuple[int, str, str, datetime], int] = {}
+        self._last_flush = time.monotonic()
+        self.tile_cache = tile_cache
+
+    def record(self, lat: float, lng: float, ts: datetime, kind: str = "telemetry"):
+        bucket = hour_bucket(ts)
+        # Encode once at the finest precision; coarser cells are prefixes
+        full = geohash_encode(lat, lng, PRECISIONS[-1])
+        pending = self._pending
+        for p in PRECISIONS:
+            key = (p, kind, full[:p], bucket)
+            pending[key] = pending.get(key, 0) + 1
+
+    def maybe_flush(self, db: Session):
+        if (len(self._pending) >= FLUSH_MAX_PENDING
+                or time.monotonic() - self._last_flush >= FLUSH_INTERVAL_S):
+            self.flush(db)
+
+    def flush(self, db: Session):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        crud.increment_heatmap_cells(db, pending)
+        # Late samples change hours that closed-range tiles may have cached
+        if self.tile_cache is not None:
+            current = hour_bucket(datetime.now())
+            if any(bucket < current for _, _, _, bucket in pending):
+                self.tile_cache.clear()
+
+    def rebuild(self, db: Session):
+        """Recount every cell from raw history (one-off backfill), archived telemetry included."""
+        import archive
+
+        crud.clear_heatmap_cells(db)
+        if self.tile_cache is not None:
+            self.tile_cache.clear()
+        positions = itertools.chain(archive.telemetry_archive.iter_positions(), crud.iter_telemetry_positions(db))
+        for lat, lng, ts in positions:
+            self.record(lat, lng, ts, "telemetry")
+            if len(self._pending) >= FLUSH_MAX_PENDING:
+                self.flush(db)
+        for lat, lng, location, ts in crud.iter_alert_positions(db):
+            # Alerts stored before they had coordinates only have a location string
+            point = (lat, lng) if lat is not None and lng is not None else parse_location(location)
+            if point:
+                self.record(point[0], point[1], ts, "alert")
+            if len(self._pending) >= FLUSH_MAX_PENDING:
+                self.flush(db)
+        self.flush(db)
+
+
+def parse_location(location: str):
+    """(lat, lng) from a raw "lat, lng" alert location, else None."""
+    if not location:
+        return None
+    parts = location.split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+
+def get_tile(db: Session, cache: LRUCache, z: int, x: int, y: int,
+             start: datetime, end: datetime, kind: str):
+    start_bucket = hour_bucket(start)
+    end_bucket = hour_bucket(end) + timedelta(hours=1)
+    key = (z, x, y, start_bucket, end_bucket, kind)
+    tile = cache.get(key)
+    if tile is not None:
+        return tile
+
+    precision = precision_for_zoom(z)
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+    cells = [
+        {"geohash": gh, "lat": lat, "lng": lng, "count": int(count)}
+        for gh, lat, lng, count in crud.get_heatmap_cells(
+            db, precision, kind, start_bucket, end_bucket,
+            min_lat, min_lng, max_lat, max_lng)
+    ]
+    tile = {
+        "z": z, "x": x, "y": y,
+        "precision": precision,
+        "kind": kind,
+        "max_count": max((c["count"] for c in cells), default=0),
+        "cells": cells,
+    }
+    live = end_bucket > hour_bucket(datetime.now())
+    cache.put(key, tile, LIVE_TILE_TTL_S if live else CLOSED_TILE_TTL_S)
+    return tile
+
+
+if __name__ == "__main__":
+    # Backfill counters from existing history: python heatmap.py
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        HeatmapAggregator().rebuild(db)
+    finally:
+        db.close()
+    print("Heatmap cells rebuilt")
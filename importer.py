@@ -0,0 +1,443 @@
+"""Bulk import of historical telemetry from CSV or Parquet files.
+
+    python -m importer history.csv.gz --alerts --create-vehicles --owner fleet_admin --rejects rejects.csv
+
+Files are read ``IMPORT_CHUNK_ROWS`` rows at a time with pandas. Each chunk
+is validated against ``models.VehicleTelemetry`` column-wise: required
+fields present, and values coerced to the field types, with failures
+rejected instead of raising. Rows for unregistered vehicles are rejected,
+or with ``--create-vehicles`` the vehicles are registered to ``--owner``.
+The valid rows are bulk inserted into
+``telemetry_logs`` on each vehicle's shard. With ``--alerts`` the
+stateless AIEngine rules (overspeed, harsh driving, low battery, engine
+temperature) run over the chunk as array operations. An alert is raised
+when a vehicle crosses a threshold, not for every sample beyond it.
+Imported alerts are stamped with the sample's time and marked actioned.
+Their ids are made from the rule, vehicle and sample time, so importing the
+same rows again overwrites those alerts instead of adding copies.
+
+After each chunk commits, progress goes to ``<file>.checkpoint.json``:
+the byte offset for CSV, the row count for Parquet. Re-running the same
+command resumes from there, and ``--restart`` starts over. A crash between
+the commit and the checkpoint write re-imports that one chunk. CSV rows
+must not contain embedded newlines. Parquet needs pyarrow.
+
+``POST /admin/import`` accepts an upload of at most ``IMPORT_MAX_UPLOAD_BYTES``
+and runs the same import in a background thread; the upload and its
+checkpoint are deleted when the job ends. Job status lives in the
+worker that took the upload, so with several workers a status poll can
+land on one that doesn't know the job. Heatmap counters are not updated;
+run ``python heatmap.py`` afterwards to backfill them.
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import suppress
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, Optional, Tuple, get_args
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+
+import database
+import shards
+import sql_models
+import versions
+from ai_engine import ENGINE_OVERHEAT_C, HARSH_FORCE, LOW_BATTERY, OVERSPEED_KMH
+from cache import LRUCache, profile_cache
+from models import VehicleTelemetry
+from synthetic_fleet import ALERT_COLUMNS, ALERT_STYLE, TELEMETRY_COLUMNS, BulkWriter, format_times
+
+CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", 200000))
+IMPORT_DIR = os.environ.get("IMPORT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "imports"))
+MAX_UPLOAD_BYTES = int(os.environ.get("IMPORT_MAX_UPLOAD_BYTES", 2 * 1024 ** 3))
+# Finished upload jobs stay pollable this long; the table holds at most MAX_JOBS
+JOB_TTL_S = int(os.environ.get("IMPORT_JOB_TTL_S", 24 * 3600))
+MAX_JOBS = 1000
+EXTENSIONS = (".csv", ".csv.gz", ".parquet")
+
+
+def _schema() -> Dict[str, Tuple[type, bool]]:
+    # field -> (scalar type, required), Optional[...] unwrapped
+    schema = {}
+    for name, field in VehicleTelemetry.model_fields.items():
+        args = [a for a in get_args(field.annotation) if a is not type(None)]
+        schema[name] = (args[0] if args else field.annotation, field.is_required())
+    return schema
+
+
+SCHEMA = _schema()
+REQUIRED = [name for name, (_, required) in SCHEMA.items() if required]
+
+
+# --- readers: yield (chunk, position to resume after it) ---
+
+def _csv_chunks(path: str, chunk_rows: int, position: int) -> Iterator[Tuple[pd.DataFrame, int]]:
+    # Split on lines ourselves so the resume point is a byte offset; pandas'
+    # skiprows would have to re-read (and hold a set of) everything skipped
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        header = f.readline()
+        if position:
+            f.seek(position)
+        else:
+            position = f.tell()
+        while True:
+            block = b"".join(islice(f, chunk_rows))
+            if not block:
+                return
+            position += len(block)
+            yield pd.read_csv(io.BytesIO(header + block), dtype={"vehicle_id": str}), position
+
+
+def _parquet_chunks(path: str, chunk_rows: int, position: int) -> Iterator[Tuple[pd.DataFrame, int]]:
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet import needs pyarrow: pip install pyarrow")
+    parquet = pyarrow.parquet.ParquetFile(path)
+    # Skip whole row groups from the metadata, then the rest of a partial one
+    first_group, skip = 0, position
+    while first_group < parquet.num_row_groups and parquet.metadata.row_group(first_group).num_rows <= skip:
+        skip -= parquet.metadata.row_group(first_group).num_rows
+        first_group += 1
+    groups = list(range(first_group, parquet.num_row_groups))
+    if not groups:
+        return
+    for batch in parquet.iter_batches(batch_size=chunk_rows, row_groups=groups):
+        if skip:
+            dropped = min(skip, batch.num_rows)
+            batch, skip = batch.slice(dropped), skip - dropped
+            if not batch.num_rows:
+                continue
+        position += batch.num_rows
+        yield batch.to_pandas(), position
+
+
+def read_chunks(path: str, chunk_rows: int = CHUNK_ROWS, position: int = 0) -> Iterator[Tuple[pd.DataFrame, int]]:
+    if path.endswith(".parquet"):
+        return _parquet_chunks(path, chunk_rows, position)
+    return _csv_chunks(path, chunk_rows, position)
+
+
+# --- validation and alert rules, column-wise ---
+
+def _to_datetime(raw: pd.Series) -> pd.Series:
+    # Aware timestamps become naive UTC; naive ones are taken as they are
+    if pd.api.types.is_datetime64_any_dtype(raw):
+        values = raw if raw.dt.tz is None else raw.dt.tz_convert("UTC").dt.tz_localize(None)
+    elif pd.api.types.is_numeric_dtype(raw):
+        # Unix time; like pydantic, values past 2e10 are taken as milliseconds
+        millis = raw.abs() > 2e10
+        values = pd.to_datetime(raw.where(millis, raw * 1000), unit="ms", errors="coerce")
+    else:
+        values = pd.to_datetime(raw, errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None)
+    return values.astype("datetime64[us]")
+
+
+def validate(df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
+    """Coerce columns to the VehicleTelemetry field types.
+
+    Returns the coerced frame and a per-row error message (None when valid).
+    ``accelerometer.x`` / ``accelerometer_x`` style columns are kept as
+    ``accelerometer_x`` etc. for the harsh-driving rule.
+    """
+    df = df.rename(columns=lambda c: str(c).strip().lower().replace(".", "_"))
+    missing = [name for name in REQUIRED if name not in df.columns]
+    if missing:
+        raise ValueError("missing required columns: %s" % ", ".join(missing))
+
+    errors = pd.Series(None, index=df.index, dtype=object)
+    out = pd.DataFrame(index=df.index)
+    for name, (kind, required) in SCHEMA.items():
+        if name not in df.columns:
+            continue
+        raw = df[name]
+        if kind is str:
+            values = raw.where(raw.isna(), raw.astype(str).str.strip())
+            values = values.where(values != "")
+        elif kind is float or kind is int:
+            values = pd.to_numeric(raw, errors="coerce")
+        elif kind is datetime:
+            values = _to_datetime(raw)
+        else:
+            continue
+        absent = raw.isna()
+        if raw.dtype == object or pd.api.types.is_string_dtype(raw):
+            absent |= raw.astype(str).str.strip() == ""
+        errors = errors.mask(errors.isna() & values.isna() & ~absent, "invalid " + name)
+        if required:
+            errors = errors.mask(errors.isna() & absent, "missing " + name)
+        out[name] = values
+    for axis in ("x", "y", "z"):
+        column = "accelerometer_" + axis
+        if column in df.columns:
+            out[column] = pd.to_numeric(df[column], errors="coerce")
+    return out, errors
+
+
+ALERT_RULES = (
+    # prefix, type, severity, message
+    ("OS", "RASH_DRIVING", "MEDIUM", "Overspeeding detected: {speed} km/h"),
+    ("RD", "RASH_DRIVING", "HIGH", "Harsh driving maneuver detected!"),
+    ("MNT", "MAINTENANCE", "MEDIUM", "Battery critically low. Recharge required soon."),
+    ("ENG", "MAINTENANCE", "CRITICAL", "Engine overheating! Stop immediately."),
+)
+
+
+def _rule_masks(df: pd.DataFrame) -> Dict[str, pd.Series]:
+    masks = {"OS": df["speed"] > OVERSPEED_KMH}
+    if {"accelerometer_x", "accelerometer_y", "accelerometer_z"} <= set(df.columns):
+        force = np.sqrt(df["accelerometer_x"] ** 2 + df["accelerometer_y"] ** 2 + df["accelerometer_z"] ** 2)
+        masks["RD"] = force > HARSH_FORCE
+    if "battery_level" in df.columns:
+        masks["MNT"] = df["battery_level"] < LOW_BATTERY
+    if "engine_temp" in df.columns:
+        masks["ENG"] = df["engine_temp"] > ENGINE_OVERHEAT_C
+    return masks
+
+
+def detect_alerts(df: pd.DataFrame, state: Dict[Tuple[str, str], bool]) -> list:
+    """Alert rows (ALERT_COLUMNS) where a vehicle crosses a rule threshold.
+
+    ``state`` carries each (rule, vehicle)'s last value between chunks, so
+    an excursion spanning two chunks is reported once.
+    """
+    alerts = []
+    vehicle = df["vehicle_id"]
+    masks = _rule_masks(df)
+    for prefix, kind, severity, message in ALERT_RULES:
+        mask = masks.get(prefix)
+        if mask is None:
+            continue
+        previous = mask.groupby(vehicle).shift(1)
+        carried = vehicle.map(lambda v: state.get((prefix, v), False))
+        previous = previous.where(previous.notna(), carried).astype(bool)
+        fired = df[mask & ~previous]
+        for vid, value in mask.groupby(vehicle).last().items():
+            state[(prefix, vid)] = bool(value)
+        icon, color, bg_color = ALERT_STYLE[kind]
+        times = fired["timestamp"].values.astype("datetime64[us]")
+        # Microsecond ids: two alerts in the same second must not overwrite each other on re-import
+        for row, stamp, micros in zip(fired.itertuples(index=False), format_times(times),
+                                      times.astype(np.int64).tolist()):
+            alerts.append((f"{prefix}-{row.vehicle_id}-{micros}", row.vehicle_id, kind, severity,
+                           message.format(speed=row.speed), stamp, f"{row.latitude}, {row.longitude}",
+                           row.latitude, row.longitude, True, icon, color, bg_color))
+    return alerts
+
+
+# --- import job ---
+
+class TelemetryImporter:
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS, alerts: bool = False, create_vehicles: bool = False,
+                 rejects_path: Optional[str] = None, checkpoint_path: Optional[str] = None, restart: bool = False,
+                 owner_id: Optional[str] = None):
+        if create_vehicles and not owner_id:
+            raise ValueError("create_vehicles needs an owner_id for the new vehicles")
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.alerts = alerts
+        self.create_vehicles = create_vehicles
+        self.owner_id = owner_id
+        self.rejects_path = rejects_path
+        self.checkpoint_path = checkpoint_path or path + ".checkpoint.json"
+        self.restart = restart
+        self.resumed_rows = 0
+        self.known_vehicles = set()
+        self.foreign_vehicles = set()
+        self.alert_state = {}
+        stat = os.stat(path)
+        self.stats = {"source": os.path.abspath(path), "size": stat.st_size, "mtime": int(stat.st_mtime),
+                      "position": 0, "rows_read": 0, "inserted": 0, "rejected": 0, "rejected_by_reason": {},
+                      "alerts": 0, "vehicles_created": 0, "done": False, "error": None}
+
+    def _load_checkpoint(self):
+        if self.restart or not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as f:
+            saved = json.load(f)
+        if (saved.get("size"), saved.get("mtime")) != (self.stats["size"], self.stats["mtime"]):
+            raise RuntimeError("%s changed since the checkpoint was written; use --restart" % self.path)
+        self.alert_state = {(rule, vid): True for rule, vid in saved.pop("alert_state", [])}
+        self.stats.update(saved)
+
+    def _save_checkpoint(self):
+        saved = dict(self.stats, alert_state=[list(key) for key, value in self.alert_state.items() if value])
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _check_vehicles(self, df: pd.DataFrame, errors: pd.Series) -> pd.Series:
+        unseen = set(df["vehicle_id"].dropna().unique()) - self.known_vehicles - self.foreign_vehicles
+        if unseen:
+            vehicle = sql_models.Vehicle
+            with database.engine.begin() as conn:
+                owners = dict(conn.execute(
+                    select(vehicle.vehicle_id, vehicle.owner_id).where(vehicle.vehicle_id.in_(unseen))).all())
+                missing = unseen - set(owners)
+                if missing and self.create_vehicles:
+                    # Placeholder details so GET /vehicle/{id} works until the owner edits them
+                    conn.execute(insert(vehicle.__table__), [
+                        {"vehicle_id": vid, "owner_id": self.owner_id, "make": "Unknown", "model": "Unknown",
+                         "year": 0, "registration_number": vid, "fuel_type": "UNKNOWN"}
+                        for vid in sorted(missing)
+                    ])
+                    versions.bump_many(conn, "vehicle", missing)
+                    self.stats["vehicles_created"] += len(missing)
+                    owners.update(dict.fromkeys(missing, self.owner_id))
+            # With an owner (every upload through the API) only that user's vehicles take rows
+            foreign = {vid for vid, owner in owners.items() if self.owner_id and owner != self.owner_id}
+            self.foreign_vehicles |= foreign
+            self.known_vehicles |= set(owners) - foreign
+            if missing and self.create_vehicles:
+                profile_cache.invalidate(self.owner_id)
+        foreign = df["vehicle_id"].isin(self.foreign_vehicles)
+        unknown = df["vehicle_id"].notna() & ~df["vehicle_id"].isin(self.known_vehicles) & ~foreign
+        errors = errors.mask(errors.isna() & foreign, "vehicle owned by another user")
+        return errors.mask(errors.isna() & unknown, "unknown vehicle")
+
+    def _reject(self, raw: pd.DataFrame, errors: pd.Series):
+        bad = errors.notna()
+        if not bad.any():
+            return
+        self.stats["rejected"] += int(bad.sum())
+        by_reason = self.stats["rejected_by_reason"]
+        for reason, count in errors[bad].value_counts().items():
+            by_reason[reason] = by_reason.get(reason, 0) + int(count)
+        if self.rejects_path:
+            rejected = raw[bad].assign(error=errors[bad])
+            header = not os.path.exists(self.rejects_path)
+            rejected.to_csv(self.rejects_path, mode="a", header=header, index=False)
+
+    def _insert(self, df: pd.DataFrame, writers: list):
+        battery = df["battery_level"] if "battery_level" in df.columns else pd.Series(np.nan, index=df.index)
+        rows = list(zip(df["vehicle_id"].tolist(), format_times(df["timestamp"].values.astype("datetime64[us]")),
+                        df["speed"].tolist(), df["latitude"].tolist(), df["longitude"].tolist(),
+                        battery.astype(object).where(battery.notna(), None).tolist()))
+        alerts = detect_alerts(df, self.alert_state) if self.alerts else []
+        if len(writers) == 1:
+            writers[0].add("telemetry_logs", TELEMETRY_COLUMNS, rows)
+            writers[0].add("alerts", ALERT_COLUMNS, alerts, conflict_key="alert_id")
+        else:
+            for row in rows:
+                writers[shards.shard_index(row[0], len(writers))].add("telemetry_logs", TELEMETRY_COLUMNS, [row])
+            for alert in alerts:
+                writers[shards.shard_index(alert[1], len(writers))].add("alerts", ALERT_COLUMNS, [alert],
+                                                                        conflict_key="alert_id")
+        # One commit per shard per chunk, before the checkpoint moves past it
+        for writer in writers:
+            writer.flush()
+        self.stats["inserted"] += len(rows)
+        self.stats["alerts"] += len(alerts)
+        # Other workers cache ETags for these; one bump per shard per chunk
+        engines = shards.router.engines or [database.engine]
+        versions.bump_on_shards(engines, "insights", df["vehicle_id"].unique().tolist())
+        versions.bump_on_shards(engines, "alerts", {alert[1] for alert in alerts})
+
+    def run(self, progress=None) -> dict:
+        self._load_checkpoint()
+        self.resumed_rows = self.stats["rows_read"]
+        if self.stats["done"]:
+            return self.stats
+        engines = shards.router.engines or [database.engine]
+        writers = [BulkWriter(engine, batch_size=self.chunk_rows * 2) for engine in engines]
+        try:
+            for raw, position in read_chunks(self.path, self.chunk_rows, self.stats["position"]):
+                df, errors = validate(raw)
+                errors = self._check_vehicles(df, errors)
+                self._reject(raw, errors)
+                valid = df[errors.isna()]
+                if len(valid):
+                    self._insert(valid, writers)
+                self.stats["rows_read"] += len(raw)
+                self.stats["position"] = position
+                self._save_checkpoint()
+                if progress is not None:
+                    progress(self.stats)
+            self.stats["done"] = True
+            self._save_checkpoint()
+        except Exception as e:
+            self.stats["error"] = str(e)
+            raise
+        finally:
+            for writer in writers:
+                writer.close()
+        return self.stats
+
+
+# --- uploads via POST /admin/import ---
+
+jobs = LRUCache(maxsize=MAX_JOBS)
+
+
+def upload_path(filename: str) -> str:
+    name = os.path.basename(filename or "").lower()
+    extension = next((ext for ext in sorted(EXTENSIONS, key=len, reverse=True) if name.endswith(ext)), None)
+    if extension is None:
+        raise ValueError("expected a %s file" % ", ".join(EXTENSIONS))
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    return os.path.join(IMPORT_DIR, uuid.uuid4().hex + extension)
+
+
+def start_job(path: str, **options) -> str:
+    job_id = os.path.basename(path).split(".")[0]
+    importer = TelemetryImporter(path, **options)
+    jobs.put(job_id, importer)
+
+    def run():
+        try:
+            importer.run()
+        except Exception:
+            pass  # kept in importer.stats["error"]
+        finally:
+            # Uploads can't be resumed through the API, so nothing needs them after this
+            for leftover in (path, importer.checkpoint_path, importer.checkpoint_path + ".tmp"):
+                with suppress(FileNotFoundError):
+                    os.remove(leftover)
+            # Running jobs never expire; finished ones age out
+            jobs.put(job_id, importer, ttl=JOB_TTL_S)
+
+    threading.Thread(target=run, name="import-" + job_id, daemon=True).start()
+    return job_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import historical telemetry from CSV or Parquet")
+    parser.add_argument("path", help=".csv, .csv.gz or .parquet file")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--alerts", action="store_true", help="run the alert rules over the imported rows")
+    parser.add_argument("--create-vehicles", action="store_true", help="register unknown vehicle ids instead of rejecting their rows")
+    parser.add_argument("--owner", help="only import rows for this user's vehicles; also owns vehicles registered "
+                                        "by --create-vehicles")
+    parser.add_argument("--rejects", help="append rejected rows, with an error column, to this CSV")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <path>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+    if args.create_vehicles and not args.owner:
+        parser.error("--create-vehicles needs --owner")
+
+    started = time.perf_counter()
+
+    def progress(stats):
+        elapsed = time.perf_counter() - started
+        print("%12d rows read, %12d inserted, %9d rejected, %7d alerts  %8.0f rows/s" % (
+            stats["rows_read"], stats["inserted"], stats["rejected"], stats["alerts"],
+            (stats["rows_read"] - importer.resumed_rows) / elapsed))
+
+    importer = TelemetryImporter(args.path, args.chunk_rows, args.alerts, args.create_vehicles, args.rejects,
+                                 args.checkpoint, args.restart, args.owner)
+    stats = importer.run(progress)
+    print(json.dumps({k: v for k, v in stats.items() if k not in ("size", "mtime")}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
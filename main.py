@@ -1,108 +1,402 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import List, Dict
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Optional
 import asyncio
 import json
-from datetime import datetime
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
 
 from models import (
     VehicleTelemetry, Alert, Vehicle, UserProfile, 
-    Trip, TripPoint, UserCreate, UserLogin,
-    InsightsResponse
+    Trip, TripPoint, UserCreate, UserLogin, AuthResponse,
+    InsightsResponse, VehicleStateResponse, VehiclePosition,
+    Geofence
 )
 from ai_engine import AIEngine
-from dummy_data import populate_dummy_data
-from database import SessionLocal, engine, Base, get_db
+from state_store import StateStore
+from spatial_index import SpatialIndex
+from geofence import GeofenceEngine
+from geocoder import ReverseGeocoder
+from heatmap import HeatmapAggregator, KINDS, TILE_CACHE_SIZE, get_tile, parse_location
+from cache import LRUCache, profile_cache
+from database import SessionLocal, engine, get_db, profiler
 import sql_models
 import crud
+import auth
+import versions
+import shards
+from compression import CompressionMiddleware, choose_encoding, precompressed_response
+from admission import AdmissionController, LoadSheddingMiddleware
+from dedup import DUPLICATE, IN_FLIGHT, IngestDeduplicator, ReorderBuffer
+import metrics
+import export
+from metrics import MetricsMiddleware
+from sql_profiler import SQLProfilingMiddleware
+import stage_timing
+from stage_timing import StageTimingMiddleware, stage_stats
+from serialization import (
+    dumps, fast_response, BroadcastMessage, MESSAGE_FORMATS, telemetry_message, alerts_message,
+    alert_to_dict, telemetry_log_to_dict, trip_to_dict
+)
+
+logger = logging.getLogger("main")
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+# Schema is created by `python migrate.py`, not on import (see README)
 
 app = FastAPI(title="Swadeshi Smart Vehicle Backend")
-ai_engine = AIEngine()
+admission = AdmissionController()
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(LoadSheddingMiddleware, controller=admission)
+app.add_middleware(SQLProfilingMiddleware, profiler=profiler)
+app.add_middleware(StageTimingMiddleware)
+# Outermost, so shed requests and compression time are measured too
+app.add_middleware(MetricsMiddleware)
+metrics.instrument_engine(engine)
+for shard_engine in shards.router.engines:
+    metrics.instrument_engine(shard_engine)
+    profiler.attach(shard_engine)
+geofence_engine = GeofenceEngine()
+ai_engine = AIEngine(geofence_engine, ReverseGeocoder())
+state_store = StateStore()
+spatial_index = SpatialIndex()
+tile_cache = LRUCache(TILE_CACHE_SIZE)
+heatmap_aggregator = HeatmapAggregator(tile_cache)
+deduplicator = IngestDeduplicator()
+reorder_buffer = ReorderBuffer()
 
-# Active WebSocket Connections
 # Active WebSocket Connections
 class ConnectionManager:
     def __init__(self):
         # Map vehicle_id -> List[WebSocket]
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Payload format each connection asked for (json, binary, deflate)
+        self.formats: Dict[WebSocket, str] = {}
 
-    async def connect(self, websocket: WebSocket, vehicle_id: str):
+    async def connect(self, websocket: WebSocket, vehicle_id: str, fmt: str = "json"):
         await websocket.accept()
         if vehicle_id not in self.active_connections:
             self.active_connections[vehicle_id] = []
         self.active_connections[vehicle_id].append(websocket)
+        self.formats[websocket] = fmt
 
     def disconnect(self, websocket: WebSocket, vehicle_id: str):
+        self.formats.pop(websocket, None)
         if vehicle_id in self.active_connections:
             if websocket in self.active_connections[vehicle_id]:
                 self.active_connections[vehicle_id].remove(websocket)
             if not self.active_connections[vehicle_id]:
                 del self.active_connections[vehicle_id]
 
-    async def broadcast_to_vehicle(self, vehicle_id: str, message: str):
+    async def send(self, websocket: WebSocket, message: BroadcastMessage):
+        payload = message.encode(self.formats.get(websocket, "json"))
+        if isinstance(payload, str):
+            await websocket.send_text(payload)
+        else:
+            await websocket.send_bytes(payload)
+
+    def has_subscribers(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.active_connections
+
+    async def broadcast_to_vehicle(self, vehicle_id: str, message: BroadcastMessage):
         if vehicle_id in self.active_connections:
+            start = time.perf_counter()
             # Create a copy to iterate safely in case of disconnects during iteration
             for connection in self.active_connections[vehicle_id][:]:
                 try:
-                    await connection.send_text(message)
+                    # The message caches its encodings, so each format is built once
+                    await self.send(connection, message)
                 except RuntimeError:
                     # Connection might be closed already
-                    pass
+                    metrics.ws_send_failures.inc()
+            metrics.ws_fanout_duration.observe(time.perf_counter() - start)
 
 manager = ConnectionManager()
 
-# Initialize Dummy Data
+def update_live_state(telemetry: VehicleTelemetry):
+    state = state_store.update(telemetry)
+    # Index the stored state, not the sample, so late samples don't move the vehicle back
+    spatial_index.update(state.vehicle_id, state.latitude, state.longitude)
+    return state
+
+def geofence_to_dict(f: sql_models.Geofence):
+    return {
+        "geofence_id": f.geofence_id,
+        "name": f.name,
+        "user_id": f.user_id,
+        "vehicle_id": f.vehicle_id,
+        "shape": f.shape,
+        "center_lat": f.center_lat,
+        "center_lng": f.center_lng,
+        "radius_m": f.radius_m,
+        "points": json.loads(f.points_json),
+        "trigger": f.trigger
+    }
+
+def load_geofences(db: Session):
+    for vehicle_id, owner_id in crud.get_vehicle_owners(db):
+        geofence_engine.set_vehicle_owner(vehicle_id, owner_id)
+    for f in crud.get_geofences(db):
+        try:
+            geofence_engine.add(Geofence(**geofence_to_dict(f)))
+        except ValidationError as e:
+            # Stored before validation was tightened (e.g. a radius <= 0); it could never match
+            logger.warning("Skipping invalid geofence %s: %s", f.geofence_id, e)
+
+def is_duplicate(telemetry: VehicleTelemetry) -> bool:
+    # A retry racing its original can't be acked yet: the original may still fail
+    verdict = deduplicator.check(telemetry)
+    if verdict == IN_FLIGHT:
+        raise HTTPException(status_code=409, detail="Sample is still being processed",
+                            headers={"Retry-After": "1"})
+    return verdict == DUPLICATE
+
+@asynccontextmanager
+async def in_order(telemetry: VehicleTelemetry):
+    # Process samples in seq order (briefly waiting out small gaps); if processing
+    # fails or is cancelled, forget the sample so the device's retry isn't dropped
+    try:
+        await reorder_buffer.wait_turn(telemetry.vehicle_id, telemetry.seq)
+        try:
+            yield
+        finally:
+            reorder_buffer.done(telemetry.vehicle_id, telemetry.seq)
+    except BaseException:
+        deduplicator.forget(telemetry)
+        raise
+    deduplicator.done(telemetry)
+
+# Readiness checks, flipped by warm_up(); /readyz answers 503 until all are True
+WARM_UP_RETRY_S = 2.0
+readiness = {"database": False, "geofences": False, "geocoder": False}
+
+def ping_databases():
+    # The main database and every telemetry shard
+    for e in [engine, *shards.router.engines]:
+        with e.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+def _warm_up():
+    db = SessionLocal()
+    try:
+        if not readiness["database"]:
+            ping_databases()
+            readiness["database"] = True
+        if not readiness["geofences"]:
+            load_geofences(db)
+            readiness["geofences"] = True
+    finally:
+        db.close()
+    if not readiness["geocoder"]:
+        ai_engine.geocoder.warm_up()
+        readiness["geocoder"] = True
+
+async def warm_up():
+    # Retries until the database is reachable and migrated
+    while True:
+        try:
+            await run_in_threadpool(_warm_up)
+            return
+        except Exception as e:
+            print(f"Warm-up failed, retrying in {WARM_UP_RETRY_S}s: {e}")
+            await asyncio.sleep(WARM_UP_RETRY_S)
+
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
+    # Don't block boot on DB work: serve /healthz right away, /readyz once warm
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+def shutdown_event():
+    # Counters batched since the last flush would otherwise be lost
     db = SessionLocal()
-    populate_dummy_data(db)
-    db.close()
-    print("Database initialized") # Trigger redeploy
+    try:
+        heatmap_aggregator.flush(db)
+    finally:
+        db.close()
+    auth.shutdown()
+
+@app.get("/healthz")
+def healthz():
+    # Liveness only: the process is up and serving
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    checks = dict(readiness)
+    if all(checks.values()):
+        try:
+            ping_databases()
+        except Exception:
+            checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse({"status": "ready" if ready else "starting", "checks": checks},
+                        status_code=200 if ready else 503)
 
 @app.get("/")
 def read_root():
-    return {"message": "Swadeshi Smart Vehicle Backend is Running with SQLite"}
+    backend = "PostgreSQL" if engine.dialect.name == "postgresql" else "SQLite"
+    return {"message": f"Swadeshi Smart Vehicle Backend is Running with {backend}"}
+
+@app.get("/admin/admission")
+def get_admission_stats():
+    return admission.stats()
+
+@app.get("/admin/ingest-timing")
+def get_ingest_timing():
+    return stage_stats.summary()
+
+@app.post("/admin/ingest-timing/reset")
+def reset_ingest_timing():
+    stage_stats.reset()
+    return {"status": "reset"}
+
+@app.get("/admin/sql-profile")
+def get_sql_profile():
+    return profiler.status()
+
+@app.post("/admin/sql-profiling")
+def set_sql_profiling(enabled: bool):
+    if enabled:
+        profiler.enable()
+    else:
+        profiler.disable()
+    return {"enabled": profiler.enabled}
+
+def _import_status(job_id: str, job) -> dict:
+    return {"job_id": job_id, **{k: v for k, v in job.stats.items() if k not in ("source", "mtime")}}
+
+@app.post("/admin/import", status_code=202)
+async def start_import(request: Request, filename: str, alerts: bool = False, create_vehicles: bool = False,
+                       user_id: str = Depends(auth.require_user_id)):
+    # The file is the raw request body, streamed to disk so the size cap
+    # holds without spooling the whole upload first (as multipart would)
+    # pandas is only needed here; keep it off the startup path
+    import importer
+
+    try:
+        path = importer.upload_path(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    too_large = HTTPException(status_code=413, detail="Upload exceeds %d bytes" % importer.MAX_UPLOAD_BYTES)
+    if int(request.headers.get("content-length") or 0) > importer.MAX_UPLOAD_BYTES:
+        raise too_large
+
+    size = 0
+    buffer = bytearray()
+    out = await run_in_threadpool(open, path, "wb")
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > importer.MAX_UPLOAD_BYTES:
+                raise too_large
+            buffer += chunk
+            if len(buffer) >= 1024 * 1024:
+                await run_in_threadpool(out.write, bytes(buffer))
+                buffer.clear()
+        await run_in_threadpool(out.write, bytes(buffer))
+    except BaseException:
+        out.close()
+        os.remove(path)
+        raise
+    out.close()
+    job_id = importer.start_job(path, alerts=alerts, create_vehicles=create_vehicles, owner_id=user_id)
+    return _import_status(job_id, importer.jobs.get(job_id))
+
+@app.get("/admin/import/{job_id}")
+def get_import(job_id: str, user_id: str = Depends(auth.require_user_id)):
+    import importer
+
+    job = importer.jobs.get(job_id)
+    if job is None or job.owner_id != user_id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return _import_status(job_id, job)
+
+# Scrape-time gauges for state that is already tracked elsewhere
+metrics.registry.gauge_callback(
+    "ws_connections", "Active WebSocket connections per vehicle",
+    lambda: {(vid, ): len(conns) for vid, conns in manager.active_connections.items()},
+    labels=("vehicle_id",))
+metrics.registry.gauge_callback(
+    "ingest_admission", "Ingest admission controller state and counters",
+    lambda: {(k, ): v for k, v in admission.stats().items()}, labels=("stat",))
+metrics.registry.gauge_callback(
+    "ingest_reordered_total", "Samples that waited for a missing seq and got it",
+    lambda: {(): reorder_buffer.reordered}, metric_type="counter")
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.registry.expose(), media_type="text/plain; version=0.0.4")
 
 # --- Telemetry & AI ---
 
 @app.post("/ingest/telemetry")
 async def ingest_telemetry(data: VehicleTelemetry, db: Session = Depends(get_db)):
-    # Log telemetry to DB (Optional, skipping for now to keep DB small)
-    
-    # Run Real-time AI Analysis
-    rash_alerts = ai_engine.detect_rash_driving(data)
-    maintenance_alerts = ai_engine.predict_maintenance(data)
-    
-    new_alerts = rash_alerts + maintenance_alerts
-    
-    for alert in new_alerts:
-        crud.create_alert(db, alert)
-    
-    # Broadcast to WebSocket clients subscribed to this vehicle
-    await manager.broadcast_to_vehicle(data.vehicle_id, json.dumps({
-        "type": "telemetry",
-        "data": data.dict(exclude_none=True, by_alias=True)
-    }, default=str))
-
-    if new_alerts:
-        await manager.broadcast_to_vehicle(data.vehicle_id, json.dumps({
-            "type": "alert",
-            "data": [a.dict(default=str) for a in new_alerts]
-        }, default=str))
-
-    return {
-        "status": "success",
-        "alerts_generated": len(new_alerts),
-        "alerts": new_alerts
-    }
+    timer = stage_timing.current()
+    timer.lap("parse_validate")
+    admission.check_vehicle(data.vehicle_id)
+    if is_duplicate(data):
+        metrics.ingest_duplicates.inc("ingest")
+        return fast_response({"status": "duplicate", "alerts_generated": 0, "alerts": []})
+    metrics.ingest_samples.inc("ingest")
+    timer.lap("admission")
+
+    async with in_order(data):
+        timer.lap("reorder_wait")
+        # Log telemetry to DB (Optional, skipping for now to keep DB small)
+        update_live_state(data)
+        timer.lap("state_update")
+
+        # Run Real-time AI Analysis
+        ai_start = time.perf_counter()
+        rash_alerts = ai_engine.detect_rash_driving(data)
+        maintenance_alerts = ai_engine.predict_maintenance(data)
+        geofence_alerts = ai_engine.detect_geofence_events(data)
+        metrics.ai_evaluation_duration.observe(time.perf_counter() - ai_start)
+        timer.lap("ai_engine")
+
+        new_alerts = rash_alerts + maintenance_alerts + geofence_alerts
+
+        for alert in new_alerts:
+            metrics.alerts_generated.inc(alert.type)
+            crud.create_alert(db, alert)
+            heatmap_aggregator.record(data.latitude, data.longitude, alert.timestamp, "alert")
+        timer.lap("alert_persist")
+        heatmap_aggregator.maybe_flush(db)
+        timer.lap("heatmap")
+
+        # Broadcast to WebSocket clients subscribed to this vehicle
+        # (skip encoding entirely when nobody is watching)
+        if manager.has_subscribers(data.vehicle_id):
+            await manager.broadcast_to_vehicle(data.vehicle_id, telemetry_message(data))
+            if new_alerts:
+                await manager.broadcast_to_vehicle(data.vehicle_id, alerts_message(new_alerts))
+        timer.lap("broadcast")
+
+        response = fast_response({
+            "status": "success",
+            "alerts_generated": len(new_alerts),
+            "alerts": [alert_to_dict(a) for a in new_alerts]
+        })
+        timer.lap("serialize")
+        return response
 
 @app.websocket("/ws/telemetry/{vehicle_id}")
-async def websocket_endpoint(websocket: WebSocket, vehicle_id: str):
-    await manager.connect(websocket, vehicle_id)
+async def websocket_endpoint(websocket: WebSocket, vehicle_id: str, format: str = "json"):
+    if format not in MESSAGE_FORMATS:
+        await websocket.close(code=1008)
+        return
+    await manager.connect(websocket, vehicle_id, format)
+    # Send the last known state right away so dashboards don't wait for the next frame
+    state = state_store.get(vehicle_id)
+    if state:
+        await manager.send(websocket, BroadcastMessage("snapshot", state.to_dict()))
     try:
         while True:
             await websocket.receive_text()
@@ -111,54 +405,198 @@ async def websocket_endpoint(websocket: WebSocket, vehicle_id: str):
 
 @app.post("/telemetry")
 async def create_telemetry(telemetry: VehicleTelemetry, db: Session = Depends(get_db)):
-    # Broadcast to WebSocket clients subscribed to this vehicle
-    await manager.broadcast_to_vehicle(telemetry.vehicle_id, json.dumps({
-        "type": "telemetry",
-        "data": telemetry.dict(exclude_none=True, by_alias=True)
-    }, default=str))
-
-    return crud.create_telemetry(db, telemetry)
+    timer = stage_timing.current()
+    timer.lap("parse_validate")
+    admission.check_vehicle(telemetry.vehicle_id)
+    if is_duplicate(telemetry):
+        metrics.ingest_duplicates.inc("telemetry")
+        return fast_response({"status": "duplicate", "vehicle_id": telemetry.vehicle_id,
+                              "seq": telemetry.seq, "message_id": telemetry.message_id})
+    metrics.ingest_samples.inc("telemetry")
+    timer.lap("admission")
+
+    async with in_order(telemetry):
+        timer.lap("reorder_wait")
+        update_live_state(telemetry)
+        timer.lap("state_update")
+
+        # Broadcast to WebSocket clients subscribed to this vehicle
+        if manager.has_subscribers(telemetry.vehicle_id):
+            await manager.broadcast_to_vehicle(telemetry.vehicle_id, telemetry_message(telemetry))
+        timer.lap("broadcast")
+
+        db_telemetry = crud.create_telemetry(db, telemetry)
+        timer.lap("db_write")
+        heatmap_aggregator.record(telemetry.latitude, telemetry.longitude, telemetry.timestamp)
+        heatmap_aggregator.maybe_flush(db)
+        timer.lap("heatmap")
+        response = fast_response(telemetry_log_to_dict(db_telemetry))
+        timer.lap("serialize")
+        return response
 
 @app.get("/telemetry/{vehicle_id}")
 def get_telemetry(vehicle_id: str, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_telemetry(db, vehicle_id, limit)
+    return fast_response([telemetry_log_to_dict(log) for log in crud.get_telemetry(db, vehicle_id, limit)])
+
+@app.get("/export/telemetry")
+def export_telemetry(request: Request, format: str = "csv", vehicle_id: Optional[str] = None,
+                     start: Optional[datetime] = None, end: Optional[datetime] = None):
+    # Streams straight from a DB cursor; use this rather than /telemetry with a huge limit
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(export.MEDIA_TYPES)}")
+    # Stored timestamps are naive UTC; convert aware bounds before the stream (and its 200) starts
+    start, end = (t.astimezone(timezone.utc).replace(tzinfo=None) if t and t.tzinfo else t for t in (start, end))
+    # Parquet pages are already compressed
+    gzip = format != "parquet" and choose_encoding(request.headers.get("accept-encoding"), ("gzip",)) == "gzip"
+    name = "".join(c if c.isalnum() or c in "-_" else "_" for c in vehicle_id or "fleet")
+    filename = f"telemetry-{name}.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if format != "parquet":
+        headers["Vary"] = "Accept-Encoding"
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export.stream(format, vehicle_id, start, end, gzip=gzip),
+                             media_type=export.MEDIA_TYPES[format], headers=headers)
 
 @app.get("/insights/{vehicle_id}", response_model=InsightsResponse)
-def get_insights(vehicle_id: str, db: Session = Depends(get_db)):
+def get_insights(vehicle_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    # The 7-day window moves daily even without new telemetry
+    not_modified = versions.check(request, response, db, "insights", vehicle_id,
+                                  extra=f"-{datetime.now().date().isoformat()}")
+    if not_modified:
+        return not_modified
     return crud.get_insights(db, vehicle_id)
 
+@app.get("/vehicle/{vehicle_id}/state", response_model=VehicleStateResponse)
+def get_vehicle_state(vehicle_id: str):
+    state = state_store.get(vehicle_id)
+    if not state:
+        raise HTTPException(status_code=404, detail="No telemetry received for vehicle")
+    return state.to_dict()
+
+@app.get("/vehicles/state", response_model=List[VehicleStateResponse])
+def get_vehicles_state(vehicle_ids: List[str] = Query(...)):
+    # Vehicles that have not reported yet are simply left out
+    return [s.to_dict() for s in state_store.get_many(vehicle_ids)]
+
+@app.get("/vehicles/nearby", response_model=List[VehiclePosition])
+def get_vehicles_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(1000, gt=0, le=100000),
+    limit: int = Query(50, gt=0, le=1000),
+):
+    results = []
+    for vid, distance in spatial_index.within_radius(lat, lng, radius_m, limit):
+        vlat, vlng = spatial_index.position(vid)
+        results.append({"vehicle_id": vid, "latitude": vlat, "longitude": vlng,
+                        "distance_m": round(distance, 1)})
+    return results
+
+@app.get("/vehicles/within", response_model=List[VehiclePosition])
+def get_vehicles_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+):
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    results = []
+    for vid in spatial_index.within_bbox(min_lat, min_lng, max_lat, max_lng):
+        vlat, vlng = spatial_index.position(vid)
+        results.append({"vehicle_id": vid, "latitude": vlat, "longitude": vlng})
+    return results
+
 # --- User & Vehicle ---
 
+def vehicle_to_dict(v: sql_models.Vehicle):
+    return {
+        "vehicle_id": v.vehicle_id,
+        "owner_id": v.owner_id,
+        "make": v.make,
+        "model": v.model,
+        "year": v.year,
+        "registration_number": v.registration_number,
+        "fuel_type": v.fuel_type,
+        "insurance_expiry": v.insurance_expiry,
+        "last_service": v.last_service
+    }
+
+def user_profile(user: sql_models.User):
+    # Cached as plain dicts: ORM objects can't outlive their session
+    profile = profile_cache.get(user.user_id)
+    if profile is None:
+        profile = {
+            "user_id": user.user_id,
+            "name": user.name,
+            "email": user.email,
+            "phone": user.phone,
+            "avatar_url": user.avatar_url,
+            "vehicles": [vehicle_to_dict(v) for v in user.vehicles]
+        }
+        profile_cache.put(user.user_id, profile)
+    return profile
+
+def get_user_profile(db: Session, user_id: str):
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        db_user = crud.get_user(db, user_id)
+        if not db_user:
+            raise HTTPException(status_code=404, detail="User not found")
+        profile = user_profile(db_user)
+    return profile
+
 @app.get("/user/{user_id}", response_model=UserProfile)
 def get_user(user_id: str, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id)
-    if not db_user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return get_user_profile(db, user_id)
 
 @app.post("/user", response_model=UserProfile)
 def create_new_user(user: UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db, user)
 
-@app.post("/auth/register", response_model=UserProfile)
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_phone(db, user.phone)
+def auth_response(user: sql_models.User):
+    token, expires_at = auth.create_access_token(user.user_id)
+    return {**user_profile(user), "access_token": token, "expires_at": expires_at}
+
+# bcrypt runs in auth's process pool and DB calls in the threadpool,
+# so a burst of logins never holds threadpool workers while hashing
+@app.post("/auth/register", response_model=AuthResponse)
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(crud.get_user_by_phone, db, user.phone)
     if db_user:
         raise HTTPException(status_code=400, detail="Phone number already registered")
-    return crud.create_user(db, user)
+    hashed_password = await auth.hash_password(user.password)
+    db_user = await run_in_threadpool(crud.create_user, db, user, hashed_password)
+    return await run_in_threadpool(auth_response, db_user)
 
-@app.post("/auth/login", response_model=UserProfile)
-def login(data: UserLogin, db: Session = Depends(get_db)):
-    user = crud.get_user_by_phone(db, data.phone)
+@app.post("/auth/login", response_model=AuthResponse)
+async def login(data: UserLogin, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_phone, db, data.phone)
     if not user:
         # Generic error message or specific as requested ("user not found")
         raise HTTPException(status_code=404, detail="User not found")
-    if not crud.verify_password(data.password, user.hashed_password):
+    if not await auth.verify_password(data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect password")
-    return user
+    return await run_in_threadpool(auth_response, user)
+
+@app.get("/auth/me", response_model=UserProfile)
+def get_me(user_id: str = Depends(auth.require_user_id), db: Session = Depends(get_db)):
+    # Token check only: clients resume sessions here instead of logging in again
+    return get_user_profile(db, user_id)
+
+@app.post("/auth/refresh", response_model=AuthResponse)
+def refresh(user_id: str = Depends(auth.require_user_id), db: Session = Depends(get_db)):
+    db_user = crud.get_user(db, user_id)
+    if not db_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return auth_response(db_user)
 
 @app.get("/vehicle/{vehicle_id}", response_model=Vehicle)
-def get_vehicle(vehicle_id: str, db: Session = Depends(get_db)):
+def get_vehicle(vehicle_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = versions.check(request, response, db, "vehicle", vehicle_id)
+    if not_modified:
+        return not_modified
     db_vehicle = crud.get_vehicle(db, vehicle_id)
     if not db_vehicle:
          raise HTTPException(status_code=404, detail="Vehicle not found")
@@ -166,13 +604,20 @@ def get_vehicle(vehicle_id: str, db: Session = Depends(get_db)):
 
 @app.post("/vehicle", response_model=Vehicle)
 def create_new_vehicle(vehicle: Vehicle, db: Session = Depends(get_db)):
-    return crud.create_vehicle(db, vehicle)
+    db_vehicle = crud.create_vehicle(db, vehicle)
+    geofence_engine.set_vehicle_owner(db_vehicle.vehicle_id, db_vehicle.owner_id)
+    return db_vehicle
 
 @app.delete("/vehicle/{vehicle_id}")
 def delete_vehicle(vehicle_id: str, db: Session = Depends(get_db)):
     vehicle = crud.delete_vehicle(db, vehicle_id)
     if not vehicle:
          raise HTTPException(status_code=404, detail="Vehicle not found")
+    state_store.remove(vehicle_id)
+    spatial_index.remove(vehicle_id)
+    deduplicator.remove(vehicle_id)
+    reorder_buffer.remove(vehicle_id)
+    geofence_engine.forget_vehicle(vehicle_id)
     return {"status": "success", "message": "Vehicle deleted"}
 
 @app.put("/vehicle/{vehicle_id}", response_model=Vehicle)
@@ -180,13 +625,18 @@ def update_vehicle(vehicle_id: str, vehicle_update: Dict, db: Session = Depends(
     db_vehicle = crud.update_vehicle(db, vehicle_id, vehicle_update)
     if not db_vehicle:
         raise HTTPException(status_code=404, detail="Vehicle not found")
+    geofence_engine.set_vehicle_owner(db_vehicle.vehicle_id, db_vehicle.owner_id)
     return db_vehicle
 
 # --- Alerts ---
 
 @app.get("/alerts/{vehicle_id}", response_model=List[Alert])
-def get_alerts(vehicle_id: str, actioned: bool = None, db: Session = Depends(get_db)):
-    return crud.get_alerts(db, vehicle_id, actioned)
+def get_alerts(vehicle_id: str, request: Request, response: Response,
+               actioned: bool = None, db: Session = Depends(get_db)):
+    not_modified = versions.check(request, response, db, "alerts", vehicle_id)
+    if not_modified:
+        return not_modified
+    return fast_response([alert_to_dict(a) for a in crud.get_alerts(db, vehicle_id, actioned)], response)
 
 @app.post("/alerts/{alert_id}/action")
 def action_alert(alert_id: str, db: Session = Depends(get_db)):
@@ -197,31 +647,84 @@ def action_alert(alert_id: str, db: Session = Depends(get_db)):
 
 @app.post("/alert", response_model=Alert)
 def create_alert(alert: Alert, db: Session = Depends(get_db)):
-    return crud.create_alert(db, alert)
+    if alert.latitude is None or alert.longitude is None:
+        # Keep the coordinates from a "lat, lng" location so heatmap rebuilds see them too
+        point = parse_location(alert.location)
+        if point:
+            alert.latitude, alert.longitude = point
+    db_alert = crud.create_alert(db, alert)
+    if alert.latitude is not None and alert.longitude is not None:
+        heatmap_aggregator.record(alert.latitude, alert.longitude, alert.timestamp, "alert")
+        heatmap_aggregator.maybe_flush(db)
+    return fast_response(alert_to_dict(db_alert))
+
+# --- Heatmap ---
+
+@app.get("/heatmap/{z}/{x}/{y}")
+def get_heatmap_tile(z: int, x: int, y: int, start: datetime = None, end: datetime = None,
+                     kind: str = "telemetry", db: Session = Depends(get_db)):
+    if kind not in KINDS:
+        raise HTTPException(status_code=400, detail="kind must be telemetry or alert")
+    if not (0 <= z <= 20 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+    end = end or datetime.now()
+    start = start or end - timedelta(days=7)
+    heatmap_aggregator.maybe_flush(db)
+    return get_tile(db, tile_cache, z, x, y, start, end, kind)
+
+# --- Geofences ---
+
+@app.post("/geofences", response_model=Geofence)
+def create_geofence(geofence: Geofence, db: Session = Depends(get_db)):
+    if not geofence.vehicle_id and not geofence.user_id:
+        raise HTTPException(status_code=400, detail="Geofence needs a vehicle_id or user_id")
+    if geofence.shape == "CIRCLE":
+        if geofence.center_lat is None or geofence.center_lng is None or geofence.radius_m is None:
+            raise HTTPException(status_code=400, detail="Circle geofence needs center and radius")
+    elif geofence.shape == "POLYGON":
+        if len(geofence.points) < 3:
+            raise HTTPException(status_code=400, detail="Polygon geofence needs at least 3 points")
+    else:
+        raise HTTPException(status_code=400, detail="Unknown geofence shape")
+    if geofence.trigger not in ("ENTER", "EXIT", "BOTH"):
+        raise HTTPException(status_code=400, detail="Unknown geofence trigger")
+    if crud.get_geofence(db, geofence.geofence_id):
+        raise HTTPException(status_code=400, detail="Geofence already exists")
+
+    db_fence = crud.create_geofence(db, geofence)
+    geofence_engine.add(geofence)
+    return geofence_to_dict(db_fence)
+
+@app.get("/geofences", response_model=List[Geofence])
+def get_geofences(vehicle_id: str = None, user_id: str = None, db: Session = Depends(get_db)):
+    return [geofence_to_dict(f) for f in crud.get_geofences(db, vehicle_id, user_id)]
+
+@app.delete("/geofences/{geofence_id}")
+def delete_geofence(geofence_id: str, db: Session = Depends(get_db)):
+    fence = crud.delete_geofence(db, geofence_id)
+    if not fence:
+        raise HTTPException(status_code=404, detail="Geofence not found")
+    geofence_engine.remove(geofence_id)
+    return {"status": "success", "message": "Geofence deleted"}
 
 # --- Trips ---
 
 @app.get("/trips/{vehicle_id}", response_model=List[Trip])
-def get_trips(vehicle_id: str, db: Session = Depends(get_db)):
-    db_trips = crud.get_trips(db, vehicle_id)
-    # Parse JSON route points
-    trips_response = []
-    for t in db_trips:
-        # Create a dict from the DB model
-        t_dict = {
-            "trip_id": t.trip_id,
-            "vehicle_id": t.vehicle_id,
-            "title": t.title,
-            "start_time": t.start_time,
-            "end_time": t.end_time,
-            "distance_km": t.distance_km,
-            "score": t.score,
-            "score_color": t.score_color,
-            "status": t.status,
-            "route_points": json.loads(t.route_points_json)
-        }
-        trips_response.append(t_dict)
-    return trips_response
+def get_trips(vehicle_id: str, request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = versions.check(request, response, db, "trips", vehicle_id)
+    if not_modified:
+        return not_modified
+    # Route points are stored as JSON; trip_to_dict parses them with the fast decoder
+    if not versions.ETAGS_ENABLED:
+        return fast_response([trip_to_dict(t) for t in crud.get_trips(db, vehicle_id)])
+    # Trips don't change until the next create_trip bumps the version, so the
+    # encoded (and compressed) body is built once per version
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return precompressed_response(
+        request, response.headers["etag"],
+        lambda: dumps([trip_to_dict(t) for t in crud.get_trips(db, vehicle_id)]),
+        headers
+    )
 
 @app.post("/trips")
 def create_trip(trip: Trip, db: Session = Depends(get_db)):
@@ -230,4 +733,7 @@ def create_trip(trip: Trip, db: Session = Depends(get_db)):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    from migrate import migrate
+    # Local convenience; deployments run `python migrate.py` before starting workers
+    migrate()
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws="ws_compression:TunedDeflateProtocol")
@@ -0,0 +1,239 @@
+"""Prometheus-style metrics, exposed as text at ``GET /metrics``.
+
+Deliberately tiny instead of pulling in prometheus_client: every hot-path
+update is a dict lookup plus an add (histograms add a ``bisect``) under a
+per-metric lock, since sync endpoints and SQL listeners run in threadpool
+threads alongside the event loop. Values that already live
+elsewhere (WebSocket connections, admission counters) are read through
+callbacks at scrape time instead of being mirrored on every request.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Seconds; covers sub-millisecond cache hits up to slow DB-bound requests
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    inner = ",".join('%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return "{" + inner + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def expose(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s counter" % self.name]
+        with self._lock:
+            snapshot = list(self._values.items())
+        for values, total in snapshot:
+            lines.append("%s%s %s" % (self.name, _labels(self.label_names, values), _fmt(total)))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[label_values] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def expose(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s histogram" % self.name]
+        names = self.label_names + ("le",)
+        with self._lock:
+            snapshot = [(values, (list(counts), total, n)) for values, (counts, total, n) in self._series.items()]
+        for values, (counts, total, n) in snapshot:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append("%s_bucket%s %d" % (self.name, _labels(names, values + (_fmt(bound),)), cumulative))
+            lines.append("%s_bucket%s %d" % (self.name, _labels(names, values + ("+Inf",)), n))
+            lines.append("%s_sum%s %s" % (self.name, _labels(self.label_names, values), _fmt(total)))
+            lines.append("%s_count%s %d" % (self.name, _labels(self.label_names, values), n))
+        return lines
+
+
+class GaugeCallback:
+    """Gauge whose samples come from ``fn()`` at scrape time: {label values tuple: value}."""
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Dict[Tuple, float]],
+                 labels: Tuple[str, ...] = (), metric_type: str = "gauge"):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self.fn = fn
+        self.type = metric_type
+
+    def expose(self) -> List[str]:
+        lines = ["# HELP %s %s" % (self.name, self.help), "# TYPE %s %s" % (self.name, self.type)]
+        for values, value in self.fn().items():
+            lines.append("%s%s %s" % (self.name, _labels(self.label_names, values), _fmt(value)))
+        return lines
+
+
+def _fmt(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge_callback(self, *args, **kwargs) -> GaugeCallback:
+        return self.register(GaugeCallback(*args, **kwargs))
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    labels=("method", "route", "status"))
+ingest_samples = registry.counter(
+    "ingest_samples_total", "Telemetry samples accepted for processing", labels=("endpoint",))
+ingest_duplicates = registry.counter(
+    "ingest_duplicates_total", "Telemetry samples dropped as retries", labels=("endpoint",))
+ai_evaluation_duration = registry.histogram(
+    "ai_evaluation_duration_seconds", "AIEngine evaluation time per telemetry sample")
+alerts_generated = registry.counter(
+    "alerts_generated_total", "Alerts raised by the AIEngine", labels=("type",))
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request",
+    labels=("route",), buckets=COUNT_BUCKETS)
+db_time_per_request = registry.histogram(
+    "db_query_duration_per_request_seconds", "Time spent in SQL per HTTP request", labels=("route",))
+ws_fanout_duration = registry.histogram(
+    "ws_fanout_duration_seconds", "Time to send one broadcast to every subscriber of a vehicle")
+ws_send_failures = registry.counter(
+    "ws_send_failures_total", "WebSocket sends that failed because the connection was gone")
+
+
+# Per-request SQL accounting: [statement count, seconds]. The list is shared
+# with threadpool workers through the copied context, so sync endpoints count too.
+current_db_stats: ContextVar[Optional[list]] = ContextVar("current_db_stats", default=None)
+# shards.fan_out updates one request's list from several threads at once
+_db_stats_lock = threading.Lock()
+
+
+def instrument_engine(engine):
+    """Count statements and time spent per request on ``engine``."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_db_stats.get()
+        if stats is not None:
+            with _db_stats_lock:
+                stats[0] += 1
+                stats[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        if context.execution_context is not None and context.connection is not None:
+            starts = context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+
+class MetricsMiddleware:
+    """Records latency per route template and SQL count/time per request.
+
+    Routes are labelled by their template (``/telemetry/{vehicle_id}``), not
+    the raw path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        db_stats = [0, 0.0]
+        token = current_db_stats.set(db_stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_db_stats.reset(token)
+            # The router fills in scope["route"] once a route matched
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(elapsed, scope["method"], template, status)
+            db_queries_per_request.observe(db_stats[0], template)
+            db_time_per_request.observe(db_stats[1], template)
@@ -0,0 +1,68 @@
+"""Create the database schema, and optionally seed the demo data.
+
+Run once per deploy before starting the app; importing or starting
+``main`` no longer touches the schema:
+
+    python migrate.py           # create missing tables and indexes (and telemetry shards)
+    python migrate.py --seed    # ... and insert the demo user, vehicle, alerts and trips
+
+``create_all`` only adds missing tables; indexes and nullable columns added
+to a model later are created separately. Existing columns are never altered.
+"""
+import argparse
+
+from sqlalchemy import inspect, text
+
+import shards
+import sql_models  # noqa: F401 - registers the tables on Base
+from database import Base, SessionLocal, engine
+
+
+def add_missing_columns(conn, tables):
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table in tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                conn.execute(text("ALTER TABLE %s ADD COLUMN %s %s" % (
+                    quote(table.name), quote(column.name), column.type.compile(dialect=conn.dialect))))
+
+
+def migrate(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as conn:
+        add_missing_columns(conn, Base.metadata.sorted_tables)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    if bind is engine:
+        shards.router.migrate()
+        for shard_engine in shards.router.engines:
+            with shard_engine.begin() as conn:
+                add_missing_columns(conn, shards.SHARDED_TABLES)
+
+
+def seed():
+    from dummy_data import populate_dummy_data
+
+    db = SessionLocal()
+    try:
+        populate_dummy_data(db)
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the database schema")
+    parser.add_argument("--seed", action="store_true", help="insert the demo data if the database is empty")
+    args = parser.parse_args()
+    migrate()
+    print("Schema up to date")
+    if args.seed:
+        seed()
+        print("Demo data seeded")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -21,6 +21,18 @@ class VehicleTelemetry(BaseModel):
     accelerometer: Optional[AccelerometerData] = None
     # Computed/Optional fields for UI
     is_engine_on: Optional[bool] = None # Populated by backend if needed, or derived on frontend
+    # Idempotency: per-vehicle increasing counter and/or unique id, so retries are dropped
+    seq: Optional[int] = None
+    message_id: Optional[str] = None
+
+class VehicleStateResponse(VehicleTelemetry):
+    received_at: datetime
+
+class VehiclePosition(BaseModel):
+    vehicle_id: str
+    latitude: float
+    longitude: float
+    distance_m: Optional[float] = None # Only set for radius queries
 
 class Alert(BaseModel):
     alert_id: str
@@ -30,6 +42,8 @@ class Alert(BaseModel):
     message: str
     timestamp: datetime
     location: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     is_actioned: bool = False
     icon: Optional[str] = "circle-info"
     color: Optional[str] = "0xFF90A4AE"
@@ -56,6 +70,11 @@ class UserBase(BaseModel):
 class UserProfile(UserBase):
     vehicles: List[Vehicle] = []
 
+class AuthResponse(UserProfile):
+    access_token: str
+    token_type: str = "bearer"
+    expires_at: int # Unix seconds
+
 class UserCreate(UserBase):
     password: str
 
@@ -80,6 +99,24 @@ class Trip(BaseModel):
     route_points: List[TripPoint] = []
     status: str = "COMPLETED" # ACTIVE, COMPLETED
 
+# Geofence Models
+class GeoPoint(BaseModel):
+    lat: float
+    lng: float
+
+class Geofence(BaseModel):
+    geofence_id: str
+    name: str
+    # Scope: a single vehicle, or every vehicle owned by a user
+    user_id: Optional[str] = None
+    vehicle_id: Optional[str] = None
+    shape: str = "CIRCLE" # CIRCLE, POLYGON
+    center_lat: Optional[float] = None
+    center_lng: Optional[float] = None
+    radius_m: Optional[float] = Field(None, gt=0)
+    points: List[GeoPoint] = [] # Polygon vertices
+    trigger: str = "BOTH" # ENTER, EXIT, BOTH
+
 # Insights Models
 class ChartPoint(BaseModel):
     x: int
@@ -0,0 +1,179 @@
+"""Fast JSON encoding for hot responses and WebSocket broadcasts.
+
+Endpoints that return many rows (telemetry history, alerts, trips) build
+plain dicts straight from ORM attributes and hand them to ``FastJSONResponse``,
+skipping ``response_model`` validation and ``jsonable_encoder``. orjson is
+used when installed; the stdlib encoder is the fallback.
+"""
+import json
+import zlib
+from datetime import date, datetime
+from typing import Any
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from models import VehicleTelemetry
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+
+def dumps_str(obj: Any) -> str:
+    return dumps(obj).decode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def fast_response(content: Any, response: Response = None) -> FastJSONResponse:
+    """Wrap ``content``, keeping headers already set on the injected response."""
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return FastJSONResponse(content, headers=headers)
+
+
+def telemetry_to_dict(t: VehicleTelemetry) -> dict:
+    # Same output as t.dict(exclude_none=True) without the pydantic walk
+    data = {
+        "vehicle_id": t.vehicle_id,
+        "timestamp": t.timestamp,
+        "speed": t.speed,
+        "latitude": t.latitude,
+        "longitude": t.longitude,
+    }
+    for name in ("rpm", "fuel_level", "battery_level", "engine_temp", "tire_pressure", "is_engine_on"):
+        value = getattr(t, name)
+        if value is not None:
+            data[name] = value
+    acc = t.accelerometer
+    if acc is not None:
+        data["accelerometer"] = {"x": acc.x, "y": acc.y, "z": acc.z}
+    return data
+
+
+def alert_to_dict(a) -> dict:
+    """Works for both models.Alert and sql_models.Alert."""
+    return {
+        "alert_id": a.alert_id,
+        "vehicle_id": a.vehicle_id,
+        "type": a.type,
+        "severity": a.severity,
+        "message": a.message,
+        "timestamp": a.timestamp,
+        "location": a.location,
+        "latitude": a.latitude,
+        "longitude": a.longitude,
+        "is_actioned": bool(a.is_actioned),
+        "icon": a.icon,
+        "color": a.color,
+        "bg_color": a.bg_color,
+    }
+
+
+def telemetry_log_to_dict(log) -> dict:
+    return {
+        "id": log.id,
+        "vehicle_id": log.vehicle_id,
+        "timestamp": log.timestamp,
+        "speed": log.speed,
+        "latitude": log.latitude,
+        "longitude": log.longitude,
+        "battery_level": log.battery_level,
+    }
+
+
+def trip_to_dict(t) -> dict:
+    route = loads(t.route_points_json)
+    for point in route:
+        # Older rows were stored with str(datetime) ("2024-01-01 12:00:00")
+        ts = point.get("timestamp")
+        if ts and len(ts) > 10 and ts[10] == " ":
+            point["timestamp"] = ts[:10] + "T" + ts[11:]
+        point.setdefault("timestamp", None)
+    return {
+        "trip_id": t.trip_id,
+        "vehicle_id": t.vehicle_id,
+        "title": t.title,
+        "start_time": t.start_time,
+        "end_time": t.end_time,
+        "distance_km": t.distance_km,
+        "score": t.score,
+        "score_color": t.score_color,
+        "route_points": route,
+        "status": t.status,
+    }
+
+
+# WebSocket payload formats a subscriber can ask for with ?format=
+MESSAGE_FORMATS = ("json", "binary", "deflate")
+
+
+class BroadcastMessage:
+    """One WebSocket message, encoded at most once per format.
+
+    The same instance is handed to every subscriber of a vehicle, so fan-out
+    costs one encode per format in use plus N sends.
+    """
+    __slots__ = ("type", "data", "_binary", "_text", "_deflate")
+
+    def __init__(self, message_type: str, data: Any):
+        self.type = message_type
+        self.data = data
+        self._binary = None
+        self._text = None
+        self._deflate = None
+
+    def binary(self) -> bytes:
+        if self._binary is None:
+            self._binary = dumps({"type": self.type, "data": self.data})
+        return self._binary
+
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.binary().decode()
+        return self._text
+
+    def deflate(self) -> bytes:
+        if self._deflate is None:
+            self._deflate = zlib.compress(self.binary(), 6)
+        return self._deflate
+
+    def encode(self, fmt: str):
+        """str for "json" (send as text), bytes for the binary formats."""
+        if fmt == "binary":
+            return self.binary()
+        if fmt == "deflate":
+            return self.deflate()
+        return self.text()
+
+
+def telemetry_message(t: VehicleTelemetry) -> BroadcastMessage:
+    return BroadcastMessage("telemetry", telemetry_to_dict(t))
+
+
+def alerts_message(alerts) -> BroadcastMessage:
+    return BroadcastMessage("alert", [alert_to_dict(a) for a in alerts])
@@ -0,0 +1,128 @@
+"""Telemetry and alert storage sharded by vehicle.
+
+SQLite takes one writer at a time per file, so every worker's telemetry and
+alert inserts queue on the same lock. With ``TELEMETRY_SHARDS=K`` those two
+tables live in K separate databases and each vehicle is pinned to one of
+them by a stable hash of its id, so writes for different vehicles proceed
+in parallel. Everything else (users, vehicles, trips, geofences, heatmap)
+stays in the main database.
+
+    TELEMETRY_SHARDS=4                                   # sqlite:///./telemetry_shard_{shard}.db
+    TELEMETRY_SHARD_URL=sqlite:////data/tel_{shard}.db   # custom location
+    TELEMETRY_SHARD_URLS=postgresql://a/tel,postgresql://b/tel   # explicit list (overrides both)
+
+Per-vehicle reads and writes go to one shard. Fleet-wide reads (acting on
+an alert by id, heatmap rebuilds) visit every shard. Unset, everything uses
+the main database session as before. Rows written before sharding was
+enabled are not moved.
+"""
+import contextvars
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List
+
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import sql_models
+from database import make_engine
+
+# resource_versions carries the alert/insights ETag counters (see versions.SHARDED_KINDS)
+SHARDED_TABLES = (sql_models.TelemetryLog.__table__, sql_models.Alert.__table__,
+                  sql_models.ResourceVersion.__table__)
+
+
+def configured_urls() -> List[str]:
+    urls = os.environ.get("TELEMETRY_SHARD_URLS")
+    if urls:
+        return [u.strip() for u in urls.split(",") if u.strip()]
+    count = int(os.environ.get("TELEMETRY_SHARDS", 0))
+    template = os.environ.get("TELEMETRY_SHARD_URL", "sqlite:///./telemetry_shard_{shard}.db")
+    return [template.format(shard=i) for i in range(count)] if count > 1 else []
+
+
+def create_tables(engine):
+    # Shards hold no vehicles table, so skip the foreign keys pointing at it
+    with engine.begin() as conn:
+        for table in SHARDED_TABLES:
+            conn.execute(CreateTable(table, include_foreign_key_constraints=[], if_not_exists=True))
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def shard_index(vehicle_id: str, count: int) -> int:
+    # crc32 rather than hash(): str hashes differ between processes
+    return zlib.crc32(vehicle_id.encode()) % count
+
+
+class ShardRouter:
+    def __init__(self, urls: List[str]):
+        self.urls = list(urls)
+        self.engines = [make_engine(url) for url in self.urls]
+        # Objects are handed back after the shard session closes; keep their loaded state
+        self.sessions = [sessionmaker(bind=e, autoflush=False, expire_on_commit=False) for e in self.engines]
+        self._executor = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for(self, vehicle_id: str) -> int:
+        return shard_index(vehicle_id, len(self.engines))
+
+    @contextmanager
+    def session(self, db: Session, vehicle_id: str) -> Iterator[Session]:
+        """Session holding ``vehicle_id``'s telemetry and alerts (``db`` itself when unsharded)."""
+        if not self.engines:
+            yield db
+            return
+        shard_db = self.sessions[self.shard_for(vehicle_id)]()
+        try:
+            yield shard_db
+        finally:
+            shard_db.close()
+
+    def each(self, db: Session) -> Iterator[Session]:
+        """Every shard's session in turn, for fleet-wide scans."""
+        if not self.engines:
+            yield db
+            return
+        for make_session in self.sessions:
+            shard_db = make_session()
+            try:
+                yield shard_db
+            finally:
+                shard_db.close()
+
+    def fan_out(self, db: Session, fn: Callable[[Session], object]) -> list:
+        """Run ``fn`` against every shard concurrently and return the results in shard order."""
+        if not self.engines:
+            return [fn(db)]
+
+        def run(make_session):
+            shard_db = make_session()
+            try:
+                return fn(shard_db)
+            finally:
+                shard_db.close()
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.sessions), thread_name_prefix="shard")
+        # Pool threads don't inherit contextvars: run each shard in a copy of the
+        # caller's (one copy each, since a context can't be entered twice) so
+        # metrics.current_db_stats and sql_profiler.current_profile see its queries
+        futures = [self._executor.submit(contextvars.copy_context().run, run, make_session)
+                   for make_session in self.sessions]
+        return [future.result() for future in futures]
+
+    def migrate(self):
+        for engine in self.engines:
+            create_tables(engine)
+
+
+router = ShardRouter(configured_urls())
@@ -0,0 +1,87 @@
+import math
+from typing import Dict, List, Set, Tuple
+
+from geo import haversine_m, radius_to_bbox
+
+# ~1.1 km cells at the equator: small enough that a city-scale query touches
+# a few hundred cells, large enough that the grid stays sparse.
+DEFAULT_CELL_DEG = 0.01
+
+Cell = Tuple[int, int]
+
+
+class SpatialIndex:
+    """Uniform lat/lng grid over each vehicle's latest position.
+
+    Updates are O(1) (a set move when the vehicle crosses a cell boundary),
+    queries only look at the cells overlapping the search area.
+    """
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._positions: Dict[str, Tuple[float, float, Cell]] = {}
+
+    def _cell(self, lat: float, lng: float) -> Cell:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def update(self, vehicle_id: str, lat: float, lng: float):
+        cell = self._cell(lat, lng)
+        old = self._positions.get(vehicle_id)
+        if old is not None and old[2] != cell:
+            self._discard(vehicle_id, old[2])
+        if old is None or old[2] != cell:
+            self._cells.setdefault(cell, set()).add(vehicle_id)
+        self._positions[vehicle_id] = (lat, lng, cell)
+
+    def remove(self, vehicle_id: str):
+        old = self._positions.pop(vehicle_id, None)
+        if old is not None:
+            self._discard(vehicle_id, old[2])
+
+    def _discard(self, vehicle_id: str, cell: Cell):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(vehicle_id)
+            if not members:
+                del self._cells[cell]
+
+    def position(self, vehicle_id: str):
+        pos = self._positions.get(vehicle_id)
+        return (pos[0], pos[1]) if pos else None
+
+    def within_bbox(self, min_lat: float, min_lng: float,
+                    max_lat: float, max_lng: float) -> List[str]:
+        ci0, cj0 = self._cell(min_lat, min_lng)
+        ci1, cj1 = self._cell(max_lat, max_lng)
+        span = (ci1 - ci0 + 1) * (cj1 - cj0 + 1)
+        if span > len(self._cells):
+            # Zoomed-out viewport: cheaper to walk the occupied cells than the range
+            cells = [c for c in self._cells if ci0 <= c[0] <= ci1 and cj0 <= c[1] <= cj1]
+        else:
+            cells = [(i, j) for i in range(ci0, ci1 + 1) for j in range(cj0, cj1 + 1)
+                     if (i, j) in self._cells]
+
+        result = []
+        positions = self._positions
+        for cell in cells:
+            for vid in self._cells[cell]:
+                lat, lng, _ = positions[vid]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    result.append(vid)
+        return result
+
+    def within_radius(self, lat: float, lng: float, radius_m: float,
+                      limit: int = None) -> List[Tuple[str, float]]:
+        """(vehicle_id, distance_m) pairs sorted nearest first."""
+        hits = []
+        for vid in self.within_bbox(*radius_to_bbox(lat, lng, radius_m)):
+            vlat, vlng, _ = self._positions[vid]
+            d = haversine_m(lat, lng, vlat, vlng)
+            if d <= radius_m:
+                hits.append((vid, d))
+        hits.sort(key=lambda h: h[1])
+        return hits[:limit] if limit else hits
+
+    def __len__(self):
+        return len(self._positions)
@@ -1,8 +1,35 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, JSON, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
 from database import Base
+from serialization import dumps_str, loads
 import datetime
 
+class JSONText(TypeDecorator):
+    """JSON kept as text by the application; stored as JSONB on PostgreSQL.
+
+    Callers always read and write a JSON string, whatever the backend.
+    """
+    impl = String
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(JSONB())
+        return dialect.type_descriptor(String())
+
+    def process_bind_param(self, value, dialect):
+        if dialect.name == "postgresql" and isinstance(value, str):
+            # JSONB's own processor serializes again; hand it the object
+            return loads(value)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if dialect.name == "postgresql" and value is not None and not isinstance(value, str):
+            return dumps_str(value)
+        return value
+
 class User(Base):
     __tablename__ = "users"
 
@@ -46,9 +73,8 @@ class Trip(Base):
     score_color = Column(String, nullable=True)
     status = Column(String, default="COMPLETED")
     
-    # Store route points as JSON for simplicity in SQLite 
-    # (In Production Postgres, use JSONB or separate table)
-    route_points_json = Column(String, default="[]") 
+    # Route points as JSON text (JSONB on PostgreSQL)
+    route_points_json = Column(JSONText, default="[]")
 
     vehicle = relationship("Vehicle", back_populates="trips")
 
@@ -62,6 +88,9 @@ class Alert(Base):
     message = Column(String)
     timestamp = Column(DateTime)
     location = Column(String, nullable=True)
+    # Where the alert fired; location may be a locality name
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     is_actioned = Column(Boolean, default=False)
     icon = Column(String, default="circle-info")
     color = Column(String, default="0xFF90A4AE")
@@ -81,3 +110,48 @@ class TelemetryLog(Base):
     battery_level = Column(Float, nullable=True)
     
     vehicle = relationship("Vehicle", back_populates="telemetry_logs")
+
+    # History, insights, archiving and export all read one vehicle's time range
+    __table_args__ = (Index("ix_telemetry_logs_vehicle_time", "vehicle_id", "timestamp"),)
+
+class Geofence(Base):
+    __tablename__ = "geofences"
+
+    geofence_id = Column(String, primary_key=True, index=True)
+    name = Column(String)
+    user_id = Column(String, ForeignKey("users.user_id"), nullable=True, index=True)
+    vehicle_id = Column(String, ForeignKey("vehicles.vehicle_id"), nullable=True, index=True)
+    shape = Column(String, default="CIRCLE")
+    center_lat = Column(Float, nullable=True)
+    center_lng = Column(Float, nullable=True)
+    radius_m = Column(Float, nullable=True)
+    # Polygon vertices as JSON, same approach as Trip.route_points_json
+    points_json = Column(JSONText, default="[]")
+    trigger = Column(String, default="BOTH")
+
+class HeatmapCell(Base):
+    __tablename__ = "heatmap_cells"
+
+    id = Column(Integer, primary_key=True)
+    precision = Column(Integer)
+    kind = Column(String) # telemetry, alert
+    geohash = Column(String)
+    bucket = Column(DateTime) # Start of the hour
+    # Cell center, so tiles can filter by bounding box
+    lat = Column(Float)
+    lng = Column(Float)
+    count = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("precision", "kind", "geohash", "bucket", name="uq_heatmap_cell"),
+        Index("ix_heatmap_lookup", "precision", "kind", "bucket", "lat", "lng"),
+    )
+
+class ResourceVersion(Base):
+    # ETag counters (see versions.py), shared by every worker and bulk writer
+    __tablename__ = "resource_versions"
+
+    kind = Column(String, primary_key=True) # vehicle, alerts, trips, insights
+    key = Column(String, primary_key=True)
+    version = Column(Integer, default=0)
+    updated_at = Column(DateTime) # UTC
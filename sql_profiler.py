@@ -0,0 +1,184 @@
+"""Optional per-request SQL profiling.
+
+When enabled (``SQL_PROFILING=1`` or ``POST /admin/sql-profiling``) the
+engine's cursor events record, for each HTTP request, how many statements
+ran, the total DB time, statements slower than ``SQL_SLOW_MS`` with their
+parameters, and statements issued ``SQL_N_PLUS_ONE_THRESHOLD`` or more
+times with different parameters (the usual sign of a lazy relationship
+loaded in a loop). Responses carry a ``Server-Timing: db;dur=...`` header,
+and requests with findings are kept for ``GET /admin/sql-profile``.
+
+When disabled the event listeners are removed from the engine and the
+middleware only checks one flag, so there is no per-query cost.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger("sql_profiler")
+
+SLOW_QUERY_MS = float(os.environ.get("SQL_SLOW_MS", 50))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", 3))
+MAX_REPORTS = 100
+# Keep reported statements readable
+MAX_STATEMENT_CHARS = 500
+
+
+class RequestProfile:
+    __slots__ = ("method", "path", "count", "total_s", "slow", "statements", "_lock")
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.count = 0
+        self.total_s = 0.0
+        self.slow: List[dict] = []
+        # statement text -> times executed
+        self.statements: Dict[str, int] = {}
+        # shards.fan_out records into one request's profile from several threads
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, parameters, elapsed: float):
+        with self._lock:
+            self.count += 1
+            self.total_s += elapsed
+            self.statements[statement] = self.statements.get(statement, 0) + 1
+            if elapsed * 1000.0 >= SLOW_QUERY_MS:
+                self.slow.append({
+                    "statement": statement[:MAX_STATEMENT_CHARS],
+                    "parameters": repr(parameters)[:MAX_STATEMENT_CHARS],
+                    "duration_ms": round(elapsed * 1000.0, 3),
+                })
+
+    def n_plus_one(self) -> List[dict]:
+        return [{"statement": stmt[:MAX_STATEMENT_CHARS], "count": n}
+                for stmt, n in self.statements.items() if n >= N_PLUS_ONE_THRESHOLD]
+
+    def server_timing(self) -> str:
+        return 'db;dur=%.3f;desc="%d queries"' % (self.total_s * 1000.0, self.count)
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "query_count": self.count,
+            "db_time_ms": round(self.total_s * 1000.0, 3),
+            "slow_queries": self.slow,
+            "n_plus_one_candidates": self.n_plus_one(),
+        }
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("profile_start")
+    if not starts:
+        # Listener was attached while this statement was already running
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, parameters, elapsed)
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    if context.execution_context is not None and context.connection is not None:
+        starts = context.connection.info.get("profile_start")
+        if starts:
+            starts.pop()
+
+
+def _listen(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class SQLProfiler:
+    def __init__(self, engine, enabled: bool = False):
+        self.engines = [engine]
+        self.enabled = False
+        self.reports = deque(maxlen=MAX_REPORTS)
+        if enabled:
+            self.enable()
+
+    def attach(self, engine):
+        """Profile another engine's statements too (e.g. a telemetry shard)."""
+        self.engines.append(engine)
+        if self.enabled:
+            _listen(engine)
+
+    def enable(self):
+        if not self.enabled:
+            for engine in self.engines:
+                _listen(engine)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            for engine in self.engines:
+                event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+                event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+                event.remove(engine, "handle_error", _handle_error)
+            self.enabled = False
+
+    def finish(self, profile: RequestProfile):
+        if not profile.slow and not profile.n_plus_one():
+            return
+        report = profile.to_dict()
+        self.reports.append(report)
+        for candidate in report["n_plus_one_candidates"]:
+            logger.warning("Possible N+1 on %s %s: %dx %s", profile.method, profile.path,
+                           candidate["count"], candidate["statement"])
+        for slow in report["slow_queries"]:
+            logger.warning("Slow query on %s %s (%.1f ms): %s %s", profile.method, profile.path,
+                           slow["duration_ms"], slow["statement"], slow["parameters"])
+
+    def status(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_query_ms": SLOW_QUERY_MS,
+            "n_plus_one_threshold": N_PLUS_ONE_THRESHOLD,
+            "reports": list(self.reports),
+        }
+
+
+class SQLProfilingMiddleware:
+    def __init__(self, app, profiler: SQLProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Statements run after this point (streaming bodies) are still
+                # reported, just not included in the header
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            self.profiler.finish(profile)
@@ -0,0 +1,147 @@
+"""Per-stage latency breakdown for the telemetry ingest handlers.
+
+A sampled request gets a ``StageTimer``; the handler calls ``lap(stage)``
+after each step and the time since the previous lap is recorded under that
+stage. The first lap is measured from when the request reached the
+middleware, so it covers body parsing and pydantic validation. Unsampled
+requests get ``NULL_TIMER`` whose ``lap`` does nothing, which keeps the
+default 10% sampling cheap enough to leave on.
+
+Rolling percentiles per route and stage are served at
+``GET /admin/ingest-timing``; set ``INGEST_TIMING_HEADER=1`` to also get
+them per request in a ``Server-Timing`` header.
+"""
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Tuple
+
+from admission import INGEST_PATHS
+
+SAMPLE_RATE = float(os.environ.get("INGEST_TIMING_SAMPLE_RATE", 0.1))
+SERVER_TIMING_HEADER = os.environ.get("INGEST_TIMING_HEADER", "0") == "1"
+# Samples kept per (route, stage) for the rolling percentiles
+WINDOW = int(os.environ.get("INGEST_TIMING_WINDOW", 2048))
+PERCENTILES = (50, 90, 99)
+
+
+class StageTimer:
+    __slots__ = ("laps", "_last")
+
+    def __init__(self, start: float):
+        self.laps: List[Tuple[str, float]] = []
+        self._last = start
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.laps.append((stage, now - self._last))
+        self._last = now
+
+    def server_timing(self) -> str:
+        return ", ".join("%s;dur=%.3f" % (stage, elapsed * 1000.0) for stage, elapsed in self.laps)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def lap(self, stage: str):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+_current: ContextVar = ContextVar("ingest_stage_timer", default=NULL_TIMER)
+
+
+def current():
+    """The timer for the request being handled (``NULL_TIMER`` if not sampled)."""
+    return _current.get()
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class StageStats:
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        # route -> stage -> recent durations in seconds
+        self._samples: Dict[str, Dict[str, Deque[float]]] = {}
+        self.sampled = 0
+
+    def record(self, route: str, timer: StageTimer, total: float):
+        stages = self._samples.get(route)
+        if stages is None:
+            stages = {}
+            self._samples[route] = stages
+        for stage, elapsed in timer.laps + [("total", total)]:
+            samples = stages.get(stage)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                stages[stage] = samples
+            samples.append(elapsed)
+        self.sampled += 1
+
+    def summary(self) -> dict:
+        routes = {}
+        for route, stages in self._samples.items():
+            routes[route] = {}
+            for stage, samples in stages.items():
+                ordered = sorted(samples)
+                entry = {"count": len(ordered)}
+                for pct in PERCENTILES:
+                    entry["p%d_ms" % pct] = round(_percentile(ordered, pct) * 1000.0, 3)
+                entry["max_ms"] = round(ordered[-1] * 1000.0, 3)
+                routes[route][stage] = entry
+        return {"sample_rate": SAMPLE_RATE, "window": self.window,
+                "sampled_requests": self.sampled, "routes": routes}
+
+    def reset(self):
+        self._samples.clear()
+        self.sampled = 0
+
+
+stage_stats = StageStats()
+
+
+class StageTimingMiddleware:
+    def __init__(self, app, stats: StageStats = stage_stats, sample_rate: float = SAMPLE_RATE,
+                 header: bool = SERVER_TIMING_HEADER, paths=INGEST_PATHS):
+        self.app = app
+        self.stats = stats
+        self.sample_rate = sample_rate
+        self.header = header
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        # An outer StageTimingMiddleware may already be timing this request
+        if (scope["type"] != "http" or scope["path"] not in self.paths
+                or _current.get() is not NULL_TIMER or random.random() >= self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timer = StageTimer(start)
+        token = _current.set(timer)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.header and timer.laps:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timer.server_timing().encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            # Rejected requests (422/429) never reach the stages and would skew the totals
+            if status == 200 and timer.laps:
+                self.stats.record(scope["path"], timer, time.perf_counter() - start)
@@ -0,0 +1,82 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from models import VehicleTelemetry
+
+
+class VehicleState:
+    # Fixed slots keep each record small; we hold one per vehicle in the fleet
+    __slots__ = (
+        "vehicle_id", "timestamp", "speed", "rpm", "latitude", "longitude",
+        "fuel_level", "battery_level", "engine_temp", "tire_pressure",
+        "accelerometer", "is_engine_on", "received_at",
+    )
+
+    def __init__(self, telemetry: VehicleTelemetry):
+        self.vehicle_id = telemetry.vehicle_id
+        self.apply(telemetry)
+
+    def apply(self, telemetry: VehicleTelemetry):
+        self.timestamp = telemetry.timestamp
+        self.speed = telemetry.speed
+        self.rpm = telemetry.rpm
+        self.latitude = telemetry.latitude
+        self.longitude = telemetry.longitude
+        self.fuel_level = telemetry.fuel_level
+        self.battery_level = telemetry.battery_level
+        self.engine_temp = telemetry.engine_temp
+        self.tire_pressure = telemetry.tire_pressure
+        acc = telemetry.accelerometer
+        self.accelerometer = (acc.x, acc.y, acc.z) if acc else None
+        self.is_engine_on = telemetry.is_engine_on
+        self.received_at = datetime.now()
+
+    def to_dict(self) -> dict:
+        # Same shape as the "telemetry" WebSocket frames (None fields dropped)
+        data = {}
+        for name in VehicleState.__slots__:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if name == "accelerometer":
+                value = {"x": value[0], "y": value[1], "z": value[2]}
+            data[name] = value
+        return data
+
+
+def _is_newer(ts: datetime, current: datetime) -> bool:
+    try:
+        return ts >= current
+    except TypeError:
+        # Devices mix naive and tz-aware timestamps; fall back to arrival order
+        return True
+
+
+class StateStore:
+    """Last known state per vehicle, updated on every ingest."""
+
+    def __init__(self):
+        self._states: Dict[str, VehicleState] = {}
+
+    def update(self, telemetry: VehicleTelemetry) -> VehicleState:
+        state = self._states.get(telemetry.vehicle_id)
+        if state is None:
+            state = VehicleState(telemetry)
+            self._states[telemetry.vehicle_id] = state
+        elif _is_newer(telemetry.timestamp, state.timestamp):
+            # Late samples (device retries, buffered uploads) must not rewind the state
+            state.apply(telemetry)
+        return state
+
+    def get(self, vehicle_id: str) -> Optional[VehicleState]:
+        return self._states.get(vehicle_id)
+
+    def get_many(self, vehicle_ids: Iterable[str]) -> List[VehicleState]:
+        states = self._states
+        return [states[v] for v in vehicle_ids if v in states]
+
+    def remove(self, vehicle_id: str):
+        self._states.pop(vehicle_id, None)
+
+    def __len__(self):
+        return len(self._states)
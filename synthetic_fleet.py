@@ -0,0 +1,360 @@
+"""Synthetic fleet history for scale and performance testing.
+
+Generates N users, M vehicles and D days of telemetry, trips and alerts:
+1-4 trips a day per vehicle along a heading random walk that drifts back
+towards home, speed that ramps up and down around a cruise speed, EV battery
+that drains with distance and charges overnight (or at a fast charger when it
+runs low), and occasional overspeed / harsh braking bursts that raise the
+matching alerts. Output is fully determined by ``--seed``; each vehicle has
+its own random stream, so changing ``--days`` does not reshuffle the others.
+
+Rows are generated with numpy a vehicle-day at a time and written with the
+DB driver's ``executemany`` (``COPY`` on PostgreSQL/psycopg2), bypassing the
+ORM. About 500 telemetry rows per vehicle-day at the default 10 s interval,
+so e.g. 6500 vehicles x 30 days is ~100M rows:
+
+    python -m synthetic_fleet --db sqlite:///./fleet.db --users 2000 --vehicles 6500 --days 30
+
+Against the configured database (the default ``--db``), telemetry and alerts
+go to each vehicle's shard when ``TELEMETRY_SHARDS`` is set, as the API
+would write them. Benchmarks can call ``generate_fleet(engine, ...)``
+directly, passing ``shard_engines`` for the same. All users get the
+password ``password123``.
+"""
+import argparse
+import csv
+import io
+import math
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import create_engine
+
+import crud
+import database
+import shards
+import versions
+from ai_engine import LOW_BATTERY, OVERSPEED_KMH
+from serialization import dumps_str
+
+CITY_CENTERS = [
+    ("Bengaluru", 12.9716, 77.5946),
+    ("Mumbai", 19.0760, 72.8777),
+    ("Delhi", 28.6139, 77.2090),
+    ("Chennai", 13.0827, 80.2707),
+    ("Hyderabad", 17.3850, 78.4867),
+    ("Pune", 18.5204, 73.8567),
+]
+MAKES = [("Tata", "Nexon EV", "ELECTRIC"), ("MG", "ZS EV", "ELECTRIC"), ("Mahindra", "XUV400", "ELECTRIC"),
+         ("Maruti", "Swift", "PETROL"), ("Hyundai", "Creta", "DIESEL"), ("Tata", "Punch", "PETROL")]
+TRIP_TITLES = ["Commute to Office", "Drive Home", "School Run", "Grocery Run", "Airport Drop",
+               "Client Visit", "Weekend Drive", "Delivery Round"]
+ALERT_STYLE = {
+    # type -> (icon, color, bg_color), matching dummy_data
+    "RASH_DRIVING": ("warning", "0xFFD32F2F", "0xFFFFCDD2"),
+    "MAINTENANCE": ("service", "0xFFF57C00", "0xFFFFE0B2"),
+}
+KM_PER_DEG = 111.0
+ROUTE_POINTS = 50
+DEFAULT_PASSWORD = "password123"
+
+TELEMETRY_COLUMNS = ("vehicle_id", "timestamp", "speed", "latitude", "longitude", "battery_level")
+TRIP_COLUMNS = ("trip_id", "vehicle_id", "title", "start_time", "end_time", "distance_km", "score",
+                "score_color", "status", "route_points_json")
+ALERT_COLUMNS = ("alert_id", "vehicle_id", "type", "severity", "message", "timestamp", "location",
+                 "latitude", "longitude", "is_actioned", "icon", "color", "bg_color")
+
+
+def format_times(times: np.ndarray) -> List[str]:
+    # SQLAlchemy's SQLite DateTime format; a "T" separator would break string comparisons
+    return [s.replace("T", " ") for s in np.datetime_as_string(times, unit="us").tolist()]
+
+
+def _score_color(score: int) -> str:
+    if score >= 80:
+        return "0xFF388E3C"
+    if score >= 60:
+        return "0xFFFBC02D"
+    return "0xFFD32F2F"
+
+
+class BulkWriter:
+    """Appends rows straight through the DBAPI connection, committing per flush."""
+
+    def __init__(self, engine, batch_size: int = 50000):
+        self.batch_size = batch_size
+        self.raw = engine.raw_connection()
+        self.cursor = self.raw.cursor()
+        self.dialect = engine.dialect.name
+        self.use_copy = self.dialect == "postgresql" and hasattr(self.cursor, "copy_expert")
+        self.placeholder = "?" if engine.dialect.paramstyle == "qmark" else "%s"
+        self.pending = {}
+        self.written = {}
+        if self.dialect == "sqlite":
+            # Bulk load: skip fsyncs; restored (with the journal mode) in close()
+            self.cursor.execute("PRAGMA synchronous")
+            self.sqlite_synchronous = self.cursor.fetchone()[0]
+            self.cursor.execute("PRAGMA journal_mode")
+            self.sqlite_journal_mode = self.cursor.fetchone()[0]
+            self.cursor.execute("PRAGMA synchronous=OFF")
+            if self.sqlite_journal_mode.lower() != "wal":
+                self.cursor.execute("PRAGMA journal_mode=MEMORY")
+
+    def add(self, table: str, columns: Sequence[str], rows: list, conflict_key: Optional[str] = None):
+        # With conflict_key (a unique column) rows overwrite the ones they collide with
+        key = (table, columns, conflict_key)
+        buffered = self.pending.setdefault(key, [])
+        buffered.extend(rows)
+        if len(buffered) >= self.batch_size:
+            self._write(table, columns, buffered, conflict_key)
+            self.pending[key] = []
+
+    def _write(self, table: str, columns: Sequence[str], rows: list, conflict_key: Optional[str] = None):
+        if not rows:
+            return
+        if self.use_copy and conflict_key is None:
+            buf = io.StringIO()
+            csv.writer(buf).writerows(rows)
+            buf.seek(0)
+            self.cursor.copy_expert("COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (table, ", ".join(columns)), buf)
+        else:
+            sql = "INSERT INTO %s (%s) VALUES (%s)" % (table, ", ".join(columns),
+                                                       ", ".join([self.placeholder] * len(columns)))
+            if conflict_key is not None:
+                # Same syntax on SQLite and PostgreSQL
+                sql += " ON CONFLICT (%s) DO UPDATE SET %s" % (conflict_key, ", ".join(
+                    "%s = excluded.%s" % (c, c) for c in columns if c != conflict_key))
+            self.cursor.executemany(sql, rows)
+        self.raw.commit()
+        self.written[table] = self.written.get(table, 0) + len(rows)
+
+    def flush(self):
+        for (table, columns, conflict_key), rows in self.pending.items():
+            self._write(table, columns, rows, conflict_key)
+        self.pending = {}
+
+    def close(self):
+        self.flush()
+        if self.dialect == "sqlite":
+            self.cursor.execute("PRAGMA synchronous=%d" % self.sqlite_synchronous)
+            self.cursor.execute("PRAGMA journal_mode=%s" % self.sqlite_journal_mode)
+        self.cursor.close()
+        self.raw.close()
+
+
+class _VehicleSim:
+    def __init__(self, vehicle_id: str, index: int, seed: int, interval_s: float):
+        self.vehicle_id = vehicle_id
+        self.rng = np.random.default_rng([seed, index])
+        self.interval_s = interval_s
+        rng = self.rng
+        _, lat, lng = CITY_CENTERS[index % len(CITY_CENTERS)]
+        self.home = (lat + rng.normal(0, 0.04), lng + rng.normal(0, 0.04))
+        self.lat, self.lng = self.home
+        make = MAKES[index % len(MAKES)]
+        self.electric = make[2] == "ELECTRIC"
+        self.range_km = rng.uniform(250, 420)
+        self.battery = rng.uniform(60, 100)
+
+    def _heading(self) -> float:
+        # Head back home when far from it, anywhere otherwise
+        dlat, dlng = self.home[0] - self.lat, self.home[1] - self.lng
+        if math.hypot(dlat, dlng) > 0.03:
+            return math.atan2(dlng, dlat) + self.rng.normal(0, 0.4)
+        return self.rng.uniform(0, 2 * math.pi)
+
+    def trip(self, start: np.datetime64, duration_s: float):
+        """Arrays for one trip plus the harsh events in it, as sample indexes."""
+        rng = self.rng
+        n = max(2, int(duration_s / self.interval_s))
+        t = np.arange(n)
+        cruise = rng.uniform(25, 65)
+        ramp = np.minimum(1.0, np.minimum(t, n - 1 - t) / 6.0)
+        wave = 12 * np.sin(rng.uniform(0, 2 * np.pi) + t / rng.uniform(8, 30))
+        noise = np.convolve(rng.normal(0, 6, n), np.ones(5) / 5, mode="same")
+        speed = np.clip((cruise + wave + noise) * ramp, 0, 110)
+
+        overspeed = []
+        harsh = []
+        if rng.random() < 0.08 and n > 20:
+            i = int(rng.integers(5, n - 10))
+            k = int(rng.integers(3, 8))
+            speed[i:i + k] = rng.uniform(OVERSPEED_KMH + 3, 150, k)
+            overspeed.append(i)
+        if rng.random() < 0.05 and n > 20:
+            i = int(rng.integers(5, n - 5))
+            speed[i] = speed[i - 1] * 0.3
+            harsh.append(i)
+
+        step_km = speed * self.interval_s / 3600.0
+        heading = self._heading() + np.cumsum(rng.normal(0, 0.12, n))
+        lat = self.lat + np.cumsum(step_km * np.cos(heading)) / KM_PER_DEG
+        lng = self.lng + np.cumsum(step_km * np.sin(heading)) / (KM_PER_DEG * math.cos(math.radians(self.lat)))
+        self.lat, self.lng = float(lat[-1]), float(lng[-1])
+
+        distance = float(step_km.sum())
+        if self.electric:
+            battery = self.battery - np.cumsum(step_km) / self.range_km * 100.0
+            battery = np.maximum(battery, 1.0)
+            self.battery = float(battery[-1])
+        else:
+            battery = None
+        times = start + (t * self.interval_s * 1e6).astype("timedelta64[us]")
+        return times, speed, lat, lng, battery, distance, overspeed, harsh
+
+    def charge(self, fast: bool = False):
+        if self.electric:
+            self.battery = float(self.rng.uniform(80, 90) if fast else self.rng.uniform(90, 100))
+
+
+def _alert(alert_id: str, vehicle_id: str, alert_type: str, severity: str, message: str,
+           ts: str, lat: float, lng: float, actioned: bool):
+    icon, color, bg = ALERT_STYLE[alert_type]
+    return (alert_id, vehicle_id, alert_type, severity, message, ts, "%.5f, %.5f" % (lat, lng),
+            float(lat), float(lng), actioned, icon, color, bg)
+
+
+def generate_fleet(engine, users: int = 10, vehicles: int = 100, days: int = 7, interval_s: float = 10.0,
+                   seed: int = 42, end: Optional[datetime] = None, prefix: str = "syn",
+                   batch_size: int = 50000, progress: Optional[Callable[[int, dict], None]] = None,
+                   shard_engines: Sequence = ()) -> dict:
+    """Write a synthetic fleet into ``engine``'s database and return row counts per table.
+
+    With ``shard_engines``, telemetry and alerts go to each vehicle's shard instead.
+    """
+    database.Base.metadata.create_all(bind=engine)
+    for shard_engine in shard_engines:
+        shards.create_tables(shard_engine)
+    end = (end or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = np.datetime64(end - timedelta(days=days), "us")
+    writer = BulkWriter(engine, batch_size)
+    shard_writers = [BulkWriter(shard_engine, batch_size) for shard_engine in shard_engines]
+    writers = [writer] + shard_writers
+
+    def written() -> dict:
+        totals = {}
+        for w in writers:
+            for table, count in w.written.items():
+                totals[table] = totals.get(table, 0) + count
+        return totals
+
+    hashed = crud.get_password_hash(DEFAULT_PASSWORD)
+
+    try:
+        writer.add("users", ("user_id", "name", "email", "phone", "hashed_password"), [
+            ("%s-user-%06d" % (prefix, i), "Driver %d" % i, "%s.driver%d@example.com" % (prefix, i),
+             "+91 %03d%07d" % (zlib.crc32(prefix.encode()) % 1000, i), hashed)
+            for i in range(users)
+        ])
+        vehicle_ids = ["%s-%06d" % (prefix.upper(), i) for i in range(vehicles)]
+        writer.add("vehicles", ("vehicle_id", "owner_id", "make", "model", "year", "registration_number", "fuel_type"), [
+            (vid, "%s-user-%06d" % (prefix, i % max(users, 1)) if users else None,
+             MAKES[i % len(MAKES)][0], MAKES[i % len(MAKES)][1], 2019 + i % 6,
+             "KA %02d %s %04d" % (1 + i % 50, "ABCDEFGHJK"[i % 10] * 2, i % 10000), MAKES[i % len(MAKES)][2])
+            for i, vid in enumerate(vehicle_ids)
+        ])
+        writer.flush()
+
+        for index, vehicle_id in enumerate(vehicle_ids):
+            sim = _VehicleSim(vehicle_id, index, seed, interval_s)
+            rng = sim.rng
+            log_writer = shard_writers[shards.shard_index(vehicle_id, len(shard_writers))] if shard_writers else writer
+            for day in range(days):
+                day_start = first_day + np.timedelta64(day, "D")
+                # Older alerts have mostly been dealt with
+                actioned = day < days - 2
+                clock = 6 * 3600 + rng.uniform(0, 3 * 3600)
+                low_battery_raised = False
+                for k in range(int(rng.integers(1, 5))):
+                    duration = rng.uniform(10, 60) * 60
+                    if clock + duration > 23 * 3600:
+                        break
+                    start = day_start + np.timedelta64(int(clock * 1e6), "us")
+                    times, speed, lat, lng, battery, distance, overspeed, harsh = sim.trip(start, duration)
+                    stamps = format_times(times)
+                    battery_list = battery.tolist() if battery is not None else [None] * len(stamps)
+                    log_writer.add("telemetry_logs", TELEMETRY_COLUMNS, list(zip(
+                        [vehicle_id] * len(stamps), stamps, speed.tolist(), lat.tolist(), lng.tolist(), battery_list)))
+
+                    trip_id = "%s-%d-%d" % (vehicle_id, day, k)
+                    alerts = []
+                    for j, i in enumerate(overspeed):
+                        alerts.append(_alert("%s-os%d" % (trip_id, j), vehicle_id, "RASH_DRIVING", "MEDIUM",
+                                             "Overspeeding detected: %.1f km/h" % speed[i], stamps[i],
+                                             lat[i], lng[i], actioned))
+                    for j, i in enumerate(harsh):
+                        alerts.append(_alert("%s-hb%d" % (trip_id, j), vehicle_id, "RASH_DRIVING", "HIGH",
+                                             "Harsh driving maneuver detected!", stamps[i], lat[i], lng[i], actioned))
+                    if battery is not None and not low_battery_raised and battery[-1] < LOW_BATTERY:
+                        i = int(np.argmax(battery < LOW_BATTERY))
+                        alerts.append(_alert("%s-lb" % trip_id, vehicle_id, "MAINTENANCE", "MEDIUM",
+                                             "Battery critically low. Recharge required soon.", stamps[i],
+                                             lat[i], lng[i], actioned))
+                        low_battery_raised = True
+                        sim.charge(fast=True)
+                    log_writer.add("alerts", ALERT_COLUMNS, alerts)
+
+                    score = int(max(40, min(100, 95 - 10 * len(overspeed) - 12 * len(harsh) - rng.uniform(0, 10))))
+                    route_idx = np.linspace(0, len(stamps) - 1, min(ROUTE_POINTS, len(stamps))).astype(int)
+                    route = [{"lat": la, "lng": ln, "timestamp": stamps[i].replace(" ", "T")}
+                             for la, ln, i in zip(np.round(lat[route_idx], 6).tolist(),
+                                                  np.round(lng[route_idx], 6).tolist(), route_idx.tolist())]
+                    writer.add("trips", TRIP_COLUMNS, [(
+                        trip_id, vehicle_id, TRIP_TITLES[int(rng.integers(len(TRIP_TITLES)))], stamps[0], stamps[-1],
+                        round(distance, 2), score, _score_color(score), "COMPLETED", dumps_str(route))])
+                    clock += duration + rng.uniform(20, 240) * 60
+                # Overnight charge when below 60%
+                if sim.battery < 60:
+                    sim.charge()
+            if progress is not None:
+                progress(index + 1, written())
+        for w in writers:
+            w.flush()
+    finally:
+        for w in writers:
+            w.close()
+    # Running servers cache ETags per resource; these vehicles all changed
+    with engine.begin() as conn:
+        for kind in ("vehicle", "trips"):
+            versions.bump_many(conn, kind, vehicle_ids)
+    for kind in ("alerts", "insights"):
+        versions.bump_on_shards(list(shard_engines) or [engine], kind, vehicle_ids)
+    return written()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic fleet dataset")
+    parser.add_argument("--db", default=database.SQLALCHEMY_DATABASE_URL, help="SQLAlchemy URL")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--vehicles", type=int, default=100)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between telemetry samples")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=datetime.fromisoformat, help="last day of history (default: today)")
+    parser.add_argument("--prefix", default="syn", help="id prefix, so several runs can share a database")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db)
+    # The configured shards belong to the configured database only
+    shard_engines = shards.router.engines if args.db == database.SQLALCHEMY_DATABASE_URL else []
+    started = time.perf_counter()
+    every = max(1, args.vehicles // 20)
+
+    def progress(done: int, written: dict):
+        if done % every == 0 or done == args.vehicles:
+            rows = written.get("telemetry_logs", 0)
+            elapsed = time.perf_counter() - started
+            print("%d/%d vehicles, %d telemetry rows (%.0f rows/s)" % (done, args.vehicles, rows, rows / elapsed))
+
+    counts = generate_fleet(engine, users=args.users, vehicles=args.vehicles, days=args.days,
+                            interval_s=args.interval, seed=args.seed, end=args.end, prefix=args.prefix,
+                            batch_size=args.batch_size, progress=progress, shard_engines=shard_engines)
+    print("done in %.1fs: %s" % (time.perf_counter() - started, counts))
+
+
+if __name__ == "__main__":
+    main()
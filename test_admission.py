@@ -0,0 +1,52 @@
+
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from admission import AdmissionController, LoadSheddingMiddleware
+from main import app, admission
+
+def test_vehicle_rate_limit():
+    client = TestClient(app)
+    vid = "test_rate_limited_vehicle"
+    telemetry = {"vehicle_id": vid, "timestamp": "2024-01-01T12:00:00",
+                 "speed": 10.0, "latitude": 12.0, "longitude": 77.0}
+
+    limited_before = admission.rate_limited
+    statuses = [client.post("/ingest/telemetry", json=telemetry).status_code
+                for _ in range(int(admission.burst) + 5)]
+    assert statuses[:int(admission.burst)] == [200] * int(admission.burst)
+    assert statuses[-1] == 429
+
+    resp = client.post("/ingest/telemetry", json=telemetry)
+    assert int(resp.headers["retry-after"]) >= 1
+    assert admission.rate_limited > limited_before
+
+    # Other vehicles are unaffected
+    assert client.post("/ingest/telemetry", json={**telemetry, "vehicle_id": "test_polite_vehicle"}).status_code == 200
+
+def test_bucket_refills():
+    controller = AdmissionController(rate=10.0, burst=1.0)
+    controller.check_vehicle("v")
+    with pytest.raises(HTTPException):
+        controller.check_vehicle("v")
+    # One token every 100 ms
+    time.sleep(0.15)
+    controller.check_vehicle("v")
+
+def test_load_shedding():
+    controller = AdmissionController(max_in_flight=0)
+    sent = []
+
+    async def downstream(scope, receive, send):
+        raise AssertionError("should have been shed")
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = LoadSheddingMiddleware(downstream, controller)
+    asyncio.run(middleware({"type": "http", "method": "POST", "path": "/telemetry"}, None, send))
+    assert sent[0]["status"] == 503
+    assert (b"retry-after", b"1") in sent[0]["headers"]
+    assert controller.shed == 1
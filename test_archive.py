@@ -0,0 +1,129 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+import archive
+import crud
+import sql_models
+from archive import TelemetryArchive
+from database import Base
+
+def make_db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine)()
+
+def add_rows(db, vid, start, count, step=timedelta(minutes=10)):
+    for i in range(count):
+        db.add(sql_models.TelemetryLog(vehicle_id=vid, timestamp=start + i * step, speed=30.0 + i % 50 * 0.5,
+                                       latitude=12.97 + i * 1e-4, longitude=77.59 - i * 1e-4,
+                                       battery_level=None if i % 7 == 0 else 90.0 - i * 0.01))
+    db.commit()
+
+def test_compaction_moves_old_rows_and_reads_stay_transparent():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db = make_db()
+        store = TelemetryArchive(os.path.join(tmp, "archive"))
+        previous, archive.telemetry_archive = archive.telemetry_archive, store
+        try:
+            now = datetime.now().replace(microsecond=0)
+            old_start = now - timedelta(days=60)
+            # ~17 days of 10-minute samples, spanning a month boundary
+            add_rows(db, "V/1", old_start, 2500)
+            add_rows(db, "V/1", now - timedelta(hours=1), 5)
+            expected = [(r.timestamp, r.speed, r.latitude, r.longitude, r.battery_level)
+                        for r in crud.get_telemetry(db, "V/1", limit=50)]
+
+            stats = store.compact(db, older_than_days=archive.ARCHIVE_AFTER_DAYS)
+            assert stats == {"vehicles": 1, "rows": 2500}
+            with engine.connect() as conn:
+                assert conn.execute(text("SELECT count(*) FROM telemetry_logs")).scalar() == 5
+            assert len(store.months("V/1")) >= 2
+
+            # Newest page mixes the 5 hot rows with archived ones, in the same order and precision
+            rows = crud.get_telemetry(db, "V/1", limit=50)
+            assert [r.id is None for r in rows] == [False] * 5 + [True] * 45
+            for row, (ts, speed, lat, lng, battery) in zip(rows, expected):
+                assert row.timestamp == ts
+                assert abs(row.speed - speed) < 0.01 and abs(row.latitude - lat) < 1e-6 and abs(row.longitude - lng) < 1e-6
+                assert (row.battery_level is None) == (battery is None)
+
+            # Range reads skip blocks and months outside the window
+            start = old_start + timedelta(days=3)
+            window = store.rows("V/1", start=start, end=start + timedelta(hours=2))
+            assert [r.timestamp for r in window] == [start + timedelta(minutes=10 * i) for i in range(12)]
+
+            # Compacting again (or after a crash before the delete) doesn't duplicate rows
+            add_rows(db, "V/1", old_start, 3)
+            assert store.compact(db)["rows"] == 3
+            assert len(store.rows("V/1")) == 2500
+        finally:
+            archive.telemetry_archive = previous
+            db.close()
+
+def test_reads_follow_the_cutoff_compaction_actually_used():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db = make_db()
+        store = TelemetryArchive(tmp)
+        previous, archive.telemetry_archive = archive.telemetry_archive, store
+        try:
+            assert store.archived_before() is None
+            add_rows(db, "V2", datetime.now() - timedelta(days=5), 100, step=timedelta(hours=1))
+            before = crud.get_insights(db, "V2")
+            latest = [r.timestamp for r in crud.get_telemetry(db, "V2", limit=10)]
+            # Far more aggressive than ARCHIVE_AFTER_DAYS, e.g. `python -m archive --older-than-days 3`
+            assert store.compact(db, older_than_days=3)["rows"] > 0
+            assert store.archived_before() > datetime.now() - timedelta(days=4)
+            assert crud.get_insights(db, "V2") == before
+            assert [r.timestamp for r in crud.get_telemetry(db, "V2", limit=10)] == latest
+        finally:
+            archive.telemetry_archive = previous
+            db.close()
+
+def test_compaction_keeps_rows_inserted_while_it_runs():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db = make_db()
+        store = TelemetryArchive(tmp)
+        old = datetime.now().replace(microsecond=0) - timedelta(days=40)
+        add_rows(db, "V3", old, 10)
+        write_month = store.write_month
+
+        def write_then_race(*args):
+            write_month(*args)
+            # An import lands an old row between the SELECT and the DELETE
+            other = sessionmaker(bind=engine)()
+            add_rows(other, "V3", old + timedelta(seconds=30), 1)
+            other.close()
+
+        store.write_month = write_then_race
+        assert store.compact_vehicle(db, "V3", datetime.now() - timedelta(days=21)) == 10
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM telemetry_logs")).scalar() == 1
+        # ... and the next run picks it up
+        store.write_month = write_month
+        assert store.compact_vehicle(db, "V3", datetime.now() - timedelta(days=21)) == 1
+        assert len(store.rows("V3")) == 11
+        db.close()
+
+def test_heatmap_rebuild_counts_archived_history():
+    from heatmap import HeatmapAggregator
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, db = make_db()
+        store = TelemetryArchive(tmp)
+        previous, archive.telemetry_archive = archive.telemetry_archive, store
+        try:
+            add_rows(db, "V4", datetime.now() - timedelta(days=40), 50)
+            add_rows(db, "V4", datetime.now() - timedelta(hours=2), 5)
+
+            def cells():
+                HeatmapAggregator().rebuild(db)
+                return sorted((c.precision, c.geohash, c.bucket, c.count) for c in db.query(sql_models.HeatmapCell))
+
+            before = cells()
+            assert store.compact(db)["rows"] == 50
+            assert cells() == before
+        finally:
+            archive.telemetry_archive = previous
+            db.close()
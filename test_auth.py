@@ -0,0 +1,55 @@
+
+import uuid
+from fastapi.testclient import TestClient
+from main import app
+import auth
+
+def test_token_sessions():
+    client = TestClient(app)
+    suffix = uuid.uuid4().hex[:8]
+    user = {
+        "user_id": f"auth_user_{suffix}",
+        "name": "Auth Test",
+        "email": f"auth_{suffix}@example.com",
+        "phone": f"+91 {suffix}",
+        "password": "secret123"
+    }
+
+    registered = client.post("/auth/register", json=user).json()
+    assert registered["user_id"] == user["user_id"]
+    assert registered["token_type"] == "bearer"
+
+    login = client.post("/auth/login", json={"phone": user["phone"], "password": "secret123"})
+    assert login.status_code == 200
+    token = login.json()["access_token"]
+
+    bad = client.post("/auth/login", json={"phone": user["phone"], "password": "wrong"})
+    assert bad.status_code == 401
+
+    me = client.get("/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert me.status_code == 200
+    assert me.json()["user_id"] == user["user_id"]
+
+    assert client.get("/auth/me").status_code == 401
+    tampered = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    assert client.get("/auth/me", headers={"Authorization": f"Bearer {tampered}"}).status_code == 401
+
+def test_expired_token():
+    token, _ = auth.create_access_token("someone")
+    assert auth.verify_access_token(token) == "someone"
+    ttl = auth.TOKEN_TTL_S
+    auth.TOKEN_TTL_S = -1
+    try:
+        expired, _ = auth.create_access_token("someone")
+    finally:
+        auth.TOKEN_TTL_S = ttl
+    assert auth.verify_access_token(expired) is None
+
+def test_non_ascii_token_is_rejected():
+    token, _ = auth.create_access_token("someone")
+    assert auth.verify_access_token(token[:-1] + "\u00e9") is None
+    assert auth.verify_access_token("\u00e9" + token) is None
+    assert auth.verify_access_token(token + "\udcff") is None
+    client = TestClient(app)
+    header = b"Bearer " + token[:-1].encode() + "\u00e9".encode()
+    assert client.get("/auth/me", headers={"Authorization": header}).status_code == 401
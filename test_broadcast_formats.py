@@ -0,0 +1,33 @@
+
+import json
+import zlib
+from fastapi.testclient import TestClient
+from main import app
+from serialization import BroadcastMessage
+
+def test_encode_once():
+    message = BroadcastMessage("telemetry", {"vehicle_id": "v", "speed": 1.0})
+    assert message.binary() is message.binary()
+    assert message.text() is message.text()
+    assert json.loads(zlib.decompress(message.deflate())) == json.loads(message.text())
+
+def test_subscriber_formats():
+    client = TestClient(app)
+    vid = "test_format_vehicle"
+    telemetry = {
+        "vehicle_id": vid,
+        "timestamp": "2024-01-01T12:00:00",
+        "speed": 30.0,
+        "latitude": 12.0,
+        "longitude": 77.0
+    }
+    with client.websocket_connect(f"/ws/telemetry/{vid}") as text_ws, \
+         client.websocket_connect(f"/ws/telemetry/{vid}?format=binary") as binary_ws, \
+         client.websocket_connect(f"/ws/telemetry/{vid}?format=deflate") as deflate_ws:
+        client.post("/ingest/telemetry", json=telemetry)
+
+        from_text = text_ws.receive_json()
+        from_binary = json.loads(binary_ws.receive_bytes())
+        from_deflate = json.loads(zlib.decompress(deflate_ws.receive_bytes()))
+        assert from_text == from_binary == from_deflate
+        assert from_text["data"]["vehicle_id"] == vid
@@ -0,0 +1,51 @@
+
+import uuid
+from fastapi.testclient import TestClient
+from main import app
+
+def test_compressed_trips():
+    client = TestClient(app)
+    vid = f"compress_vehicle_{uuid.uuid4().hex[:8]}"
+    client.post("/trips", json={
+        "trip_id": f"trip_{vid}",
+        "vehicle_id": vid,
+        "title": "Long drive",
+        "start_time": "2024-01-01T08:00:00",
+        "distance_km": 120.0,
+        "score": 90,
+        "route_points": [{"lat": 12.9 + i * 1e-4, "lng": 77.5 + i * 1e-4} for i in range(500)]
+    })
+
+    plain = client.get(f"/trips/{vid}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    expected = plain.content
+
+    for encoding in ("gzip", "br"):
+        resp = client.get(f"/trips/{vid}", headers={"Accept-Encoding": encoding})
+        assert resp.headers["content-encoding"] == encoding
+        assert resp.headers["vary"] == "Accept-Encoding"
+        # httpx decodes the body; content-length is the size on the wire
+        assert int(resp.headers["content-length"]) < len(expected) / 3
+        assert resp.content == expected
+
+    # Other large responses are compressed on the fly by the middleware
+    for i in range(15):
+        client.post("/telemetry", json={"vehicle_id": vid, "timestamp": f"2024-01-01T08:00:{i:02d}",
+                                        "speed": 40.0, "latitude": 12.9, "longitude": 77.5})
+    history = client.get(f"/telemetry/{vid}", headers={"Accept-Encoding": "gzip"})
+    assert history.headers["content-encoding"] == "gzip"
+    assert len(history.json()) == 15
+
+def test_choose_encoding_honours_q_values():
+    from compression import choose_encoding
+
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("br;q=0, gzip") == "gzip"
+    assert choose_encoding("br;q=0.5, gzip;q=0.8") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("*;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "br"
+    assert choose_encoding("br;q=0, *") == "gzip"
+    assert choose_encoding("BR; Q=0 , GZIP") == "gzip"
+    assert choose_encoding("gzip, br", supported=("gzip",)) == "gzip"
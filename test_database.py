@@ -0,0 +1,44 @@
+import os
+import tempfile
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateTable
+from database import make_engine
+import sql_models
+
+def test_sqlite_pragmas_on_every_connection():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine("sqlite:///" + os.path.join(tmp, "test.db"))
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert conn.execute(text("PRAGMA mmap_size")).scalar() > 0
+        engine.dispose()
+
+def test_routes_are_jsonb_on_postgres():
+    ddl = str(CreateTable(sql_models.Trip.__table__).compile(dialect=postgresql.dialect()))
+    assert "route_points_json JSONB" in ddl
+    ddl = str(CreateTable(sql_models.Trip.__table__).compile(dialect=sqlite.dialect()))
+    assert "route_points_json VARCHAR" in ddl
+
+    # The application still reads and writes JSON text
+    column_type = sql_models.Trip.__table__.c.route_points_json.type
+    pg = postgresql.dialect()
+    assert column_type.process_bind_param('[{"lat": 1.0}]', pg) == [{"lat": 1.0}]
+    assert column_type.process_result_value([{"lat": 1.0}], pg) == '[{"lat":1.0}]'
+    assert column_type.process_bind_param("[]", sqlite.dialect()) == "[]"
+
+def test_migrate_adds_new_nullable_columns():
+    from migrate import migrate
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine("sqlite:///" + os.path.join(tmp, "old.db"))
+        with engine.begin() as conn:
+            # alerts as it was before it had coordinates
+            conn.execute(text("CREATE TABLE alerts (alert_id VARCHAR PRIMARY KEY, vehicle_id VARCHAR, location VARCHAR)"))
+            conn.execute(text("INSERT INTO alerts VALUES ('a', 'v', 'Somewhere')"))
+        migrate(engine)
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT location, latitude, longitude FROM alerts")).one() == ("Somewhere", None, None)
+        engine.dispose()
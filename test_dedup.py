@@ -0,0 +1,117 @@
+import asyncio
+from fastapi.testclient import TestClient
+import dedup
+from dedup import DUPLICATE, IN_FLIGHT, NEW, IngestDeduplicator, ReorderBuffer
+from models import VehicleTelemetry
+from main import app, deduplicator
+
+def sample(vid, seq=None, message_id=None):
+    return VehicleTelemetry(vehicle_id=vid, timestamp="2024-01-01T12:00:00", speed=10.0,
+                            latitude=12.0, longitude=77.0, seq=seq, message_id=message_id)
+
+def test_retried_sample_is_dropped():
+    client = TestClient(app)
+    telemetry = {"vehicle_id": "test_dedup_vehicle", "timestamp": "2024-01-01T12:00:00",
+                 "speed": 10.0, "latitude": 12.0, "longitude": 77.0, "seq": 1}
+
+    duplicates_before = deduplicator.duplicates
+    assert client.post("/ingest/telemetry", json=telemetry).json()["status"] == "success"
+    resp = client.post("/ingest/telemetry", json=telemetry)
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "duplicate"
+    assert deduplicator.duplicates == duplicates_before + 1
+
+def seen(dedup, telemetry):
+    # check() and, for a new sample, finish processing it
+    verdict = dedup.check(telemetry)
+    if verdict == NEW:
+        dedup.done(telemetry)
+    return verdict == DUPLICATE
+
+def test_seq_window():
+    dedup = IngestDeduplicator()
+    assert not seen(dedup, sample("v", seq=10))
+    assert not seen(dedup, sample("v", seq=8))   # late, but not seen yet
+    assert seen(dedup, sample("v", seq=8))
+    assert seen(dedup, sample("v", seq=10))
+    assert not seen(dedup, sample("v", seq=100))
+    assert not seen(dedup, sample("v", seq=10))  # far behind: a restarted counter
+    # Samples without seq or message_id are never deduplicated
+    assert not seen(dedup, sample("v"))
+    assert not seen(dedup, sample("v"))
+
+def test_message_ids_and_forget(monkeypatch):
+    dedup_ = IngestDeduplicator()
+    assert not seen(dedup_, sample("v", message_id="a"))
+    assert seen(dedup_, sample("v", message_id="a"))
+    assert not seen(dedup_, sample("w", message_id="a"))
+
+    failed = sample("v", seq=5)
+    assert dedup_.check(failed) == NEW
+    dedup_.forget(failed)
+    assert not seen(dedup_, failed)
+
+    # A forgotten id leaves no stale entry behind to evict its re-added copy early
+    monkeypatch.setattr(dedup, "MESSAGE_ID_WINDOW", 3)
+    failed = sample("x", message_id="m")
+    assert dedup_.check(failed) == NEW
+    dedup_.forget(failed)
+    for message_id in ("m", "n", "o"):
+        assert not seen(dedup_, sample("x", message_id=message_id))
+    assert seen(dedup_, sample("x", message_id="m"))
+
+def test_retry_during_processing_is_not_acked():
+    dedup = IngestDeduplicator()
+    for original in (sample("v", seq=1), sample("v", message_id="a")):
+        assert dedup.check(original) == NEW
+        assert dedup.check(original) == IN_FLIGHT
+        # The original fails: the next retry is processed, not dropped
+        dedup.forget(original)
+        assert dedup.check(original) == NEW
+        dedup.done(original)
+        assert dedup.check(original) == DUPLICATE
+
+def test_seq_restart():
+    dedup = IngestDeduplicator()
+    for seq in range(1, 201):
+        assert not seen(dedup, sample("v", seq=seq))
+    # The device rebooted and counts from 1 again: new samples, and their retries caught
+    for seq in (1, 2, 3):
+        assert not seen(dedup, sample("v", seq=seq))
+    assert seen(dedup, sample("v", seq=2))
+    assert not seen(dedup, sample("v", seq=4))
+
+    buffer = ReorderBuffer(wait_s=1.0)
+
+    async def run():
+        for seq in (200, 1, 2):
+            await buffer.wait_turn("v", seq)
+            buffer.done("v", seq)
+        # 4 waits for 3 again rather than going straight through behind next_seq 201
+        waiting = asyncio.ensure_future(buffer.wait_turn("v", 4))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        buffer.done("v", 3)
+        await waiting
+
+    asyncio.run(run())
+    assert buffer.reordered == 1
+
+def test_reorder_buffer_releases_in_order():
+    buffer = ReorderBuffer(wait_s=1.0)
+    order = []
+
+    async def process(seq, delay):
+        await asyncio.sleep(delay)
+        await buffer.wait_turn("v", seq)
+        order.append(seq)
+        buffer.done("v", seq)
+
+    async def run():
+        await process(1, 0)
+        # 3 arrives before 2 and waits for it
+        await asyncio.gather(process(3, 0), process(2, 0.05))
+
+    asyncio.run(run())
+    assert order == [1, 2, 3]
+    assert buffer.reordered == 1
@@ -0,0 +1,46 @@
+
+import uuid
+from datetime import datetime
+from fastapi.testclient import TestClient
+from main import app
+
+def test_conditional_get():
+    client = TestClient(app)
+    vid = f"etag_vehicle_{uuid.uuid4().hex[:8]}"
+
+    first = client.get(f"/alerts/{vid}")
+    tag = first.headers["etag"]
+    assert "last-modified" in first.headers
+
+    cached = client.get(f"/alerts/{vid}", headers={"If-None-Match": tag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    client.post("/alert", json={
+        "alert_id": f"etag_alert_{vid}",
+        "vehicle_id": vid,
+        "type": "MAINTENANCE",
+        "severity": "LOW",
+        "message": "Tyre rotation due",
+        "timestamp": datetime.now().isoformat()
+    })
+
+    fresh = client.get(f"/alerts/{vid}", headers={"If-None-Match": tag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != tag
+    assert len(fresh.json()) == 1
+
+    # Writes to other resources don't invalidate this one
+    trips_tag = client.get(f"/trips/{vid}").headers["etag"]
+    assert client.get(f"/trips/{vid}", headers={"If-None-Match": trips_tag}).status_code == 304
+
+def test_versions_are_shared_through_the_database():
+    import database
+    import shards
+    import versions
+    client = TestClient(app)
+    vid = f"etag_bulk_{uuid.uuid4().hex[:8]}"
+    tag = client.get(f"/insights/{vid}").headers["etag"]
+    # A bulk writer in another process only touches the database
+    versions.bump_on_shards(shards.router.engines or [database.engine], "insights", [vid, "someone_else"])
+    assert client.get(f"/insights/{vid}", headers={"If-None-Match": tag}).status_code == 200
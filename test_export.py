@@ -0,0 +1,106 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+import pytest
+import archive
+import export
+import sql_models
+from archive import TelemetryArchive
+from database import SessionLocal
+from main import app
+
+def add_rows(vid, start, count):
+    db = SessionLocal()
+    for i in range(count):
+        db.add(sql_models.TelemetryLog(vehicle_id=vid, timestamp=start + timedelta(minutes=i), speed=float(i),
+                                       latitude=12.9, longitude=77.6, battery_level=None if i % 2 else 80.0))
+    db.commit()
+    db.close()
+
+def test_export_streams_archive_and_hot_rows():
+    client = TestClient(app)
+    vid = f"export_vehicle_{uuid.uuid4().hex[:8]}"
+    now = datetime.now().replace(microsecond=0)
+    add_rows(vid, now - timedelta(days=40), 30)
+    add_rows(vid, now - timedelta(hours=1), 20)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TelemetryArchive(tmp)
+        previous, archive.telemetry_archive = archive.telemetry_archive, store
+        previous_batch, export.BATCH_ROWS = export.BATCH_ROWS, 8
+        try:
+            db = SessionLocal()
+            store.compact_vehicle(db, vid, now - timedelta(days=21))
+            db.close()
+
+            # Archive first, then the database, in batches of BATCH_ROWS
+            batches = list(export.iter_batches(vid))
+            assert [len(b) for b in batches] == [8, 8, 8, 6, 8, 8, 4]
+
+            response = client.get("/export/telemetry", params={"vehicle_id": vid})
+            assert response.headers["content-type"].startswith("text/csv")
+            assert response.headers["content-encoding"] == "gzip"
+            rows = list(csv.DictReader(io.StringIO(response.text)))
+            assert len(rows) == 50
+            assert rows[0]["timestamp"] == (now - timedelta(days=40)).isoformat()
+            assert [float(r["speed"]) for r in rows[:3]] == [0.0, 1.0, 2.0]
+            assert rows[1]["battery_level"] == ""
+
+            plain = client.get("/export/telemetry", params={"vehicle_id": vid, "format": "ndjson",
+                                                             "start": (now - timedelta(minutes=50)).isoformat()},
+                               headers={"Accept-Encoding": "identity"})
+            assert "content-encoding" not in plain.headers
+            refused = client.get("/export/telemetry", params={"vehicle_id": vid}, headers={"Accept-Encoding": "gzip;q=0"})
+            assert "content-encoding" not in refused.headers
+            assert len(list(csv.DictReader(io.StringIO(refused.text)))) == 50
+            records = [json.loads(line) for line in plain.text.splitlines()]
+            assert len(records) == 10
+            assert set(records[0]) == set(export.COLUMNS)
+
+            # A Z-suffixed bound is aware; it must not break the stream after the headers went out
+            aware = client.get("/export/telemetry", params={
+                "vehicle_id": vid, "format": "ndjson",
+                "start": (now - timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "end": (now + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")})
+            assert aware.status_code == 200
+            assert len(aware.text.splitlines()) == 20
+            archived = client.get("/export/telemetry", params={
+                "vehicle_id": vid, "format": "ndjson",
+                "end": (now - timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%SZ")})
+            assert len(archived.text.splitlines()) == 30
+        finally:
+            archive.telemetry_archive = previous
+            export.BATCH_ROWS = previous_batch
+
+def test_export_format_validation():
+    client = TestClient(app)
+    assert client.get("/export/telemetry", params={"format": "xlsx"}).status_code == 400
+    empty = client.get("/export/telemetry", params={"vehicle_id": "no_such_vehicle"})
+    assert empty.text == ",".join(export.COLUMNS) + "\n"
+    assert gzip.decompress(b"".join(export.stream("csv", "no_such_vehicle", gzip=True))) == empty.content
+
+def test_parquet_export():
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    client = TestClient(app)
+    vid = f"parquet_vehicle_{uuid.uuid4().hex[:8]}"
+    add_rows(vid, datetime.now().replace(microsecond=0) - timedelta(hours=1), 25)
+    previous, export.BATCH_ROWS = export.BATCH_ROWS, 10
+    try:
+        response = client.get("/export/telemetry", params={"vehicle_id": vid, "format": "parquet"})
+    finally:
+        export.BATCH_ROWS = previous
+    assert response.headers["content-type"] == export.MEDIA_TYPES["parquet"]
+    assert "content-encoding" not in response.headers
+    parquet = pyarrow.parquet.ParquetFile(pyarrow.BufferReader(response.content))
+    # One row group per batch
+    assert parquet.metadata.num_row_groups == 3
+    table = parquet.read()
+    assert table.column_names == list(export.COLUMNS)
+    assert table.column("speed").to_pylist() == [float(i) for i in range(25)]
+    assert table.column("battery_level").null_count == 12
@@ -0,0 +1,21 @@
+
+from datetime import datetime
+from ai_engine import AIEngine
+from geocoder import ReverseGeocoder
+from models import AccelerometerData, VehicleTelemetry
+
+def test_reverse_geocoding():
+    geocoder = ReverseGeocoder()
+    assert geocoder.reverse(12.9785, 77.6409) == "Indiranagar, Bengaluru"
+    # Middle of the ocean: nothing nearby
+    assert geocoder.reverse(0.0, 0.0) is None
+
+    # Same ~100 m cell is served from the cache
+    geocoder.reverse(12.97851, 77.64092)
+    assert geocoder.cache_info().hits >= 1
+
+    telemetry = VehicleTelemetry(vehicle_id="geocode_vehicle", timestamp=datetime.now(), speed=40.0,
+                                 latitude=12.9353, longitude=77.6246,
+                                 accelerometer=AccelerometerData(x=12.0, y=9.0, z=9.8))
+    alerts = AIEngine(geocoder=geocoder).detect_rash_driving(telemetry)
+    assert alerts[0].location == "Koramangala, Bengaluru"
@@ -0,0 +1,49 @@
+
+from datetime import datetime
+from ai_engine import AIEngine
+from geofence import GeofenceEngine
+from models import Geofence, GeoPoint, VehicleTelemetry
+
+def sample(lat, lng):
+    return VehicleTelemetry(vehicle_id="geo_vehicle", timestamp=datetime.now(),
+                            speed=30.0, latitude=lat, longitude=lng)
+
+def test_geofence_transitions():
+    engine = GeofenceEngine()
+    engine.set_vehicle_owner("geo_vehicle", "geo_user")
+    engine.add(Geofence(geofence_id="home", name="Home", vehicle_id="geo_vehicle",
+                        center_lat=12.9716, center_lng=77.5946, radius_m=200))
+    engine.add(Geofence(geofence_id="office", name="Office", user_id="geo_user", shape="POLYGON",
+                        points=[GeoPoint(lat=12.93, lng=77.62), GeoPoint(lat=12.93, lng=77.63),
+                                GeoPoint(lat=12.94, lng=77.63), GeoPoint(lat=12.94, lng=77.62)]))
+    # Fence for someone else's vehicle is never a match
+    engine.add(Geofence(geofence_id="other", name="Other", vehicle_id="v_other",
+                        center_lat=12.9716, center_lng=77.5946, radius_m=5000))
+    ai = AIEngine(engine)
+
+    # First sample only establishes state
+    assert ai.detect_geofence_events(sample(12.9716, 77.5946)) == []
+    assert ai.detect_geofence_events(sample(12.9717, 77.5947)) == []
+
+    alerts = ai.detect_geofence_events(sample(12.935, 77.625))
+    assert sorted(a.message for a in alerts) == [
+        "Vehicle entered geofence 'Office'",
+        "Vehicle left geofence 'Home'",
+    ]
+    assert all(a.type == "GEOFENCE" for a in alerts)
+
+    engine.remove("office")
+    assert ai.detect_geofence_events(sample(12.0, 77.0)) == []
+
+def test_geofence_radius_must_be_positive():
+    import uuid
+    from fastapi.testclient import TestClient
+    from main import app
+
+    client = TestClient(app)
+    fence = {"geofence_id": f"fence_{uuid.uuid4().hex[:8]}", "name": "Depot", "vehicle_id": "geo_vehicle",
+             "center_lat": 12.97, "center_lng": 77.59}
+    for radius in (-50, 0):
+        assert client.post("/geofences", json={**fence, "radius_m": radius}).status_code == 422
+    assert client.post("/geofences", json=fence).status_code == 400
+    assert client.post("/geofences", json={**fence, "radius_m": 250}).json()["radius_m"] == 250
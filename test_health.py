@@ -0,0 +1,36 @@
+import time
+from fastapi.testclient import TestClient
+from main import app, readiness
+
+def test_health_and_readiness():
+    client = TestClient(app)
+    assert client.get("/healthz").json() == {"status": "ok"}
+    if not all(readiness.values()):
+        # Startup hasn't run: not ready yet
+        resp = client.get("/readyz")
+        assert resp.status_code == 503
+        assert resp.json()["status"] == "starting"
+
+    # Entering the client runs startup, which warms up in the background
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        resp = client.get("/readyz")
+        assert resp.status_code == 200
+        assert resp.json() == {"status": "ready", "checks": {"database": True, "geofences": True, "geocoder": True}}
+
+def test_readiness_covers_shards(monkeypatch):
+    import shards
+    from sqlalchemy import create_engine
+
+    with TestClient(app) as client:
+        deadline = time.monotonic() + 10
+        while client.get("/readyz").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # A shard that can't be reached makes the worker unready
+        unreachable = create_engine("sqlite:////nonexistent/dir/shard.db")
+        monkeypatch.setattr(shards.router, "engines", [unreachable])
+        resp = client.get("/readyz")
+        assert resp.status_code == 503
+        assert resp.json()["checks"]["database"] is False
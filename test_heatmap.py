@@ -0,0 +1,99 @@
+
+import time
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from database import Base
+from cache import LRUCache
+import heatmap
+from heatmap import HeatmapAggregator, get_tile
+import sql_models
+
+def test_heatmap_tile(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    cache = LRUCache(16)
+    aggregator = HeatmapAggregator(cache)
+    ts = datetime(2024, 1, 1, 12, 30)
+    for _ in range(3):
+        aggregator.record(12.9716, 77.5946, ts)
+    aggregator.record(12.9716, 77.5946, ts, "alert")
+    aggregator.flush(db)
+    # A second flush adds onto the existing counters
+    aggregator.record(12.9716, 77.5946, ts)
+    aggregator.flush(db)
+
+    # Zoom 10 tile covering Bengaluru
+    tile = get_tile(db, cache, 10, 732, 474, datetime(2024, 1, 1), datetime(2024, 1, 2), "telemetry")
+    assert tile["max_count"] == 4
+    assert len(tile["cells"]) == 1
+
+    alerts = get_tile(db, cache, 10, 732, 474, datetime(2024, 1, 1), datetime(2024, 1, 2), "alert")
+    assert alerts["max_count"] == 1
+
+    # Outside the time range nothing shows up
+    empty = get_tile(db, cache, 10, 732, 474, datetime(2024, 2, 1), datetime(2024, 2, 2), "telemetry")
+    assert empty["cells"] == []
+
+    # Closed ranges are served from cache...
+    assert get_tile(db, cache, 10, 732, 474, datetime(2024, 1, 1), datetime(2024, 1, 2), "telemetry") is tile
+    # ...until a late sample lands in one of their hours
+    aggregator.record(12.9716, 77.5946, ts)
+    aggregator.flush(db)
+    tile = get_tile(db, cache, 10, 732, 474, datetime(2024, 1, 1), datetime(2024, 1, 2), "telemetry")
+    assert tile["max_count"] == 5
+
+    # Writes from other processes never reach this cache, so closed tiles expire as well
+    monkeypatch.setattr(heatmap, "CLOSED_TILE_TTL_S", 0.01)
+    get_tile(db, cache, 10, 732, 474, datetime(2024, 3, 1), datetime(2024, 3, 2), "telemetry")
+    importer = HeatmapAggregator()
+    importer.record(12.9716, 77.5946, datetime(2024, 3, 1, 8))
+    importer.flush(db)
+    time.sleep(0.02)
+    assert get_tile(db, cache, 10, 732, 474, datetime(2024, 3, 1), datetime(2024, 3, 2), "telemetry")["max_count"] == 1
+
+def test_rebuild_matches_live_counts_for_geocoded_alerts():
+    import crud
+    from ai_engine import AIEngine
+    from models import VehicleTelemetry
+
+    class Geocoder:
+        def reverse(self, lat, lng):
+            return "Koramangala, Bengaluru"
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    sample = VehicleTelemetry(vehicle_id="heatmap_alerts", timestamp=datetime.now(), speed=130.0,
+                              latitude=12.9716, longitude=77.5946, battery_level=10.0)
+    ai = AIEngine(geocoder=Geocoder())
+    live = HeatmapAggregator()
+    for alert in ai.detect_rash_driving(sample) + ai.predict_maintenance(sample):
+        crud.create_alert(db, alert)
+        live.record(sample.latitude, sample.longitude, alert.timestamp, "alert")
+    live.flush(db)
+
+    def cells():
+        return sorted((c.precision, c.kind, c.geohash, c.bucket, c.count) for c in db.query(sql_models.HeatmapCell))
+
+    before = cells()
+    assert before and all(kind == "alert" and count == 2 for _, kind, _, _, count in before)
+    HeatmapAggregator().rebuild(db)
+    assert cells() == before
+
+def test_shutdown_flushes_pending_counters():
+    from fastapi.testclient import TestClient
+    from database import SessionLocal
+    from main import app, heatmap_aggregator
+
+    ts = datetime(2023, 6, 1, 9, 15)
+    with TestClient(app):
+        heatmap_aggregator.record(-33.8688, 151.2093, ts)
+    db = SessionLocal()
+    try:
+        assert db.query(sql_models.HeatmapCell).filter(sql_models.HeatmapCell.bucket == datetime(2023, 6, 1, 9)).count() == 5
+    finally:
+        db.close()
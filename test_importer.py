@@ -0,0 +1,165 @@
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+import pandas as pd
+import pytest
+import auth
+import crud
+import importer
+from database import SessionLocal
+from importer import TelemetryImporter
+from main import app
+
+def write_csv(path, vid, rows=30):
+    start = datetime(2024, 3, 1, 8, 0)
+    speeds = [130 if 5 <= i < 8 or 20 <= i < 25 else 60 for i in range(rows)]
+    speeds[3] = "fast"
+    frame = pd.DataFrame({
+        "vehicle_id": [vid] * rows,
+        "timestamp": [(start + timedelta(seconds=10 * i)).isoformat() for i in range(rows)],
+        "speed": speeds,
+        "latitude": 12.97,
+        "longitude": 77.59,
+        "battery_level": [None if i % 3 else 50.0 for i in range(rows)],
+    })
+    frame.loc[4, "timestamp"] = "yesterday"
+    frame.to_csv(path, index=False)
+
+def test_import_validates_detects_alerts_and_resumes():
+    vid = f"import_vehicle_{uuid.uuid4().hex[:8]}"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "history.csv")
+        write_csv(path, vid)
+        rejects = os.path.join(tmp, "rejects.csv")
+
+        # Unknown vehicles are rejected unless asked to register them
+        stats = TelemetryImporter(path, chunk_rows=10, checkpoint_path=os.path.join(tmp, "a.json")).run()
+        assert stats["inserted"] == 0 and stats["rejected_by_reason"]["unknown vehicle"] == 28
+
+        def interrupt(stats):
+            raise KeyboardInterrupt
+
+        with pytest.raises(ValueError):
+            TelemetryImporter(path, create_vehicles=True)
+        job = TelemetryImporter(path, chunk_rows=10, alerts=True, create_vehicles=True, rejects_path=rejects,
+                                owner_id="import_owner")
+        with pytest.raises(KeyboardInterrupt):
+            job.run(interrupt)
+        assert job.stats["rows_read"] == 10 and job.stats["inserted"] == 8
+
+        # Picks up after the first chunk; the overspeed runs give one alert each
+        stats = TelemetryImporter(path, chunk_rows=10, alerts=True, create_vehicles=True, rejects_path=rejects,
+                                  owner_id="import_owner").run()
+        assert stats["done"] and stats["rows_read"] == 30
+        assert stats["inserted"] == 28 and stats["vehicles_created"] == 1
+        assert stats["rejected_by_reason"] == {"invalid speed": 1, "invalid timestamp": 1}
+        assert stats["alerts"] == 2
+        assert pd.read_csv(rejects)["error"].tolist() == ["invalid speed", "invalid timestamp"]
+
+        db = SessionLocal()
+        try:
+            logs = crud.get_telemetry(db, vid, limit=100)
+            assert len(logs) == 28
+            assert logs[-1].timestamp == datetime(2024, 3, 1, 8, 0)
+            assert sum(log.battery_level is not None for log in logs) == 9
+            alerts = crud.get_alerts(db, vid, actioned=True)
+            assert sorted(a.timestamp for a in alerts) == [datetime(2024, 3, 1, 8, 0, 50), datetime(2024, 3, 1, 8, 3, 20)]
+            assert crud.get_vehicle(db, vid).owner_id == "import_owner"
+        finally:
+            db.close()
+
+        # A finished checkpoint makes re-running a no-op
+        again = TelemetryImporter(path, chunk_rows=10, alerts=True, create_vehicles=True, owner_id="import_owner").run()
+        assert again["inserted"] == 28
+
+        # Importing the same rows again overwrites their alerts rather than adding more
+        TelemetryImporter(path, chunk_rows=10, alerts=True, restart=True).run()
+        db = SessionLocal()
+        try:
+            assert len(crud.get_alerts(db, vid, actioned=True)) == 2
+        finally:
+            db.close()
+
+def test_alerts_within_one_second_keep_distinct_ids():
+    start = datetime(2024, 3, 1, 8, 0)
+    frame = pd.DataFrame({
+        "vehicle_id": "V1",
+        "timestamp": pd.to_datetime([start + timedelta(milliseconds=300 * i) for i in range(3)]),
+        "speed": [130.0, 60.0, 130.0],
+        "latitude": 12.97,
+        "longitude": 77.59,
+    })
+    alerts = importer.detect_alerts(frame, {})
+    assert len(alerts) == 2
+    assert alerts[0][0] != alerts[1][0]
+
+def wait_for(client, job_id, headers):
+    for _ in range(100):
+        status = client.get(f"/admin/import/{job_id}", headers=headers).json()
+        if status["done"] or status["error"]:
+            return status
+        time.sleep(0.05)
+    return status
+
+def test_admin_upload():
+    client = TestClient(app)
+    vid = f"upload_vehicle_{uuid.uuid4().hex[:8]}"
+    owner = f"upload_owner_{uuid.uuid4().hex[:8]}"
+    headers = {"Authorization": "Bearer " + auth.create_access_token(owner)[0]}
+    with tempfile.TemporaryDirectory() as tmp:
+        previous = importer.IMPORT_DIR, importer.MAX_UPLOAD_BYTES, importer.JOB_TTL_S
+        importer.IMPORT_DIR = os.path.join(tmp, "uploads")
+        try:
+            path = os.path.join(tmp, "upload.csv")
+            write_csv(path, vid)
+            with open(path, "rb") as f:
+                body = f.read()
+            assert client.post("/admin/import?filename=history.csv", content=body).status_code == 401
+            assert client.post("/admin/import?filename=notes.txt", content=b"hello", headers=headers).status_code == 400
+            importer.MAX_UPLOAD_BYTES = len(body) - 1
+            assert client.post("/admin/import?filename=history.csv", content=body, headers=headers).status_code == 413
+            assert os.listdir(importer.IMPORT_DIR) == []
+            importer.MAX_UPLOAD_BYTES = len(body)
+
+            response = client.post("/admin/import?filename=history.csv&create_vehicles=true", content=body,
+                                   headers=headers)
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            status = wait_for(client, job_id, headers)
+            assert status["done"] and status["inserted"] == 28
+            assert len(client.get(f"/telemetry/{vid}").json()) == 28
+            assert client.get(f"/vehicle/{vid}").json()["owner_id"] == owner
+
+            # The upload and its checkpoint are cleaned up once the job ends
+            for _ in range(100):
+                if not os.listdir(importer.IMPORT_DIR):
+                    break
+                time.sleep(0.05)
+            assert os.listdir(importer.IMPORT_DIR) == []
+
+            # Only the uploader sees the job
+            other = {"Authorization": "Bearer " + auth.create_access_token("someone_else")[0]}
+            assert client.get(f"/admin/import/{job_id}", headers=other).status_code == 404
+            assert client.get("/admin/import/missing", headers=headers).status_code == 404
+
+            # ...and nobody can upload rows for someone else's vehicle
+            importer.JOB_TTL_S = 0.2
+            response = client.post("/admin/import?filename=history.csv&create_vehicles=true", content=body,
+                                   headers=other)
+            job_id = response.json()["job_id"]
+            status = wait_for(client, job_id, other)
+            assert status["done"] and status["inserted"] == 0
+            assert status["rejected_by_reason"]["vehicle owned by another user"] == 28
+            assert len(client.get(f"/telemetry/{vid}").json()) == 28
+
+            # Finished jobs are forgotten after JOB_TTL_S
+            for _ in range(100):
+                if client.get(f"/admin/import/{job_id}", headers=other).status_code == 404:
+                    break
+                time.sleep(0.05)
+            assert client.get(f"/admin/import/{job_id}", headers=other).status_code == 404
+        finally:
+            importer.IMPORT_DIR, importer.MAX_UPLOAD_BYTES, importer.JOB_TTL_S = previous
@@ -0,0 +1,74 @@
+from fastapi.testclient import TestClient
+from metrics import Histogram, registry
+from main import app
+
+def test_metrics_endpoint():
+    client = TestClient(app)
+    telemetry = {"vehicle_id": "test_metrics_vehicle", "timestamp": "2024-01-01T12:00:00",
+                 "speed": 150.0, "latitude": 12.0, "longitude": 77.0}
+    assert client.post("/ingest/telemetry", json=telemetry).status_code == 200
+    assert client.get("/vehicle/does-not-exist").status_code == 404
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    # Latency is labelled by route template, not the raw path
+    assert 'http_request_duration_seconds_count{method="GET",route="/vehicle/{vehicle_id}",status="404"}' in body
+    assert 'ingest_samples_total{endpoint="ingest"}' in body
+    assert 'alerts_generated_total{type="RASH_DRIVING"}' in body
+    assert "ai_evaluation_duration_seconds_count" in body
+    assert 'db_queries_per_request_count{route="/ingest/telemetry"}' in body
+    assert 'ingest_admission{stat="admitted_total"}' in body
+
+def test_histogram_buckets():
+    h = Histogram("h", "test", buckets=(1, 5))
+    for value in (0.5, 1, 3, 10):
+        h.observe(value)
+    lines = h.expose()
+    assert 'h_bucket{le="1"} 2' in lines
+    assert 'h_bucket{le="5"} 3' in lines
+    assert 'h_bucket{le="+Inf"} 4' in lines
+    assert "h_sum 14.5" in lines
+
+def test_failed_statements_leave_no_start_times():
+    import pytest
+    from sqlalchemy import create_engine, exc, text
+    from metrics import current_db_stats, instrument_engine
+    from sql_profiler import SQLProfiler
+
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    SQLProfiler(engine, enabled=True)
+    stats = [0, 0.0]
+    token = current_db_stats.set(stats)
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(exc.OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            assert conn.info["query_start"] == [] and conn.info["profile_start"] == []
+    finally:
+        current_db_stats.reset(token)
+    assert stats[0] == 1
+
+def test_counters_are_thread_safe():
+    import threading
+    from metrics import Counter
+
+    counter = Counter("threaded_total", "test")
+    histogram = Histogram("threaded_seconds", "test")
+
+    def work():
+        for _ in range(20000):
+            counter.inc()
+            histogram.observe(0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counter.value() == 80000
+    assert histogram.count() == 80000
@@ -0,0 +1,40 @@
+
+import uuid
+from fastapi.testclient import TestClient
+from main import app
+from cache import profile_cache
+
+def test_profile_cache_invalidation():
+    client = TestClient(app)
+    suffix = uuid.uuid4().hex[:8]
+    user_id = f"cache_user_{suffix}"
+    client.post("/user", json={
+        "user_id": user_id,
+        "name": "Cache Test",
+        "email": f"cache_{suffix}@example.com",
+        "phone": f"+91 c{suffix}",
+        "password": "secret123"
+    })
+
+    assert client.get(f"/user/{user_id}").json()["vehicles"] == []
+    hits = profile_cache.hits
+    client.get(f"/user/{user_id}")
+    assert profile_cache.hits == hits + 1
+
+    vehicle = {
+        "vehicle_id": f"cache_vehicle_{suffix}",
+        "owner_id": user_id,
+        "make": "Tata",
+        "model": "Nexon EV",
+        "year": 2024,
+        "registration_number": "KA 01 AB 1234",
+        "fuel_type": "ELECTRIC"
+    }
+    client.post("/vehicle", json=vehicle)
+    assert [v["vehicle_id"] for v in client.get(f"/user/{user_id}").json()["vehicles"]] == [vehicle["vehicle_id"]]
+
+    client.put(f"/vehicle/{vehicle['vehicle_id']}", json={"model": "Punch EV"})
+    assert client.get(f"/user/{user_id}").json()["vehicles"][0]["model"] == "Punch EV"
+
+    client.delete(f"/vehicle/{vehicle['vehicle_id']}")
+    assert client.get(f"/user/{user_id}").json()["vehicles"] == []
@@ -0,0 +1,21 @@
+
+from spatial_index import SpatialIndex
+
+def test_radius_and_bbox():
+    index = SpatialIndex()
+    index.update("near", 12.9716, 77.5946)      # MG Road
+    index.update("close", 12.9800, 77.6000)     # ~1.1 km away
+    index.update("far", 13.1986, 77.7066)       # Airport, ~28 km away
+
+    hits = index.within_radius(12.9716, 77.5946, 2000)
+    assert [vid for vid, _ in hits] == ["near", "close"]
+
+    assert sorted(index.within_bbox(12.9, 77.5, 13.0, 77.7)) == ["close", "near"]
+
+    # Moving across cells keeps exactly one entry per vehicle
+    index.update("far", 12.9717, 77.5947)
+    assert len(index.within_radius(12.9716, 77.5946, 100)) == 2
+
+    index.remove("near")
+    assert [vid for vid, _ in index.within_radius(12.9716, 77.5946, 100)] == ["far"]
+    assert len(index) == 2
@@ -0,0 +1,49 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sql_profiler import RequestProfile, SQLProfiler, current_profile
+from main import app, profiler
+
+def test_server_timing_header():
+    client = TestClient(app)
+    assert "server-timing" not in client.get("/vehicle/does-not-exist").headers
+
+    assert client.post("/admin/sql-profiling", params={"enabled": True}).json() == {"enabled": True}
+    try:
+        resp = client.get("/vehicle/does-not-exist")
+        assert resp.headers["server-timing"].startswith("db;dur=")
+        # The ETag version lookup plus the vehicle query
+        assert 'desc="2 queries"' in resp.headers["server-timing"]
+    finally:
+        client.post("/admin/sql-profiling", params={"enabled": False})
+    assert not profiler.enabled
+
+def test_n_plus_one_and_disable():
+    engine = create_engine("sqlite://")
+    sql_profiler = SQLProfiler(engine, enabled=True)
+    profile = RequestProfile("GET", "/test")
+    token = current_profile.set(profile)
+    try:
+        with engine.connect() as conn:
+            for i in range(3):
+                conn.execute(text("SELECT :i"), {"i": i})
+            conn.execute(text("SELECT 1"))
+        sql_profiler.finish(profile)
+        assert profile.count == 4
+        assert profile.n_plus_one() == [{"statement": "SELECT ?", "count": 3}]
+        assert sql_profiler.status()["reports"][0]["path"] == "/test"
+
+        # Shard engines attached later are profiled too
+        shard = create_engine("sqlite://")
+        sql_profiler.attach(shard)
+        with shard.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert profile.count == 5
+
+        # Once disabled the listeners are gone and nothing is recorded
+        sql_profiler.disable()
+        for e in (engine, shard):
+            with e.connect() as conn:
+                conn.execute(text("SELECT 2"))
+        assert profile.count == 5
+    finally:
+        current_profile.reset(token)
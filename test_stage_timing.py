@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+from stage_timing import StageStats, StageTimingMiddleware
+from main import app
+
+def test_ingest_stage_breakdown():
+    stats = StageStats()
+    client = TestClient(StageTimingMiddleware(app, stats=stats, sample_rate=1.0, header=True))
+    telemetry = {"vehicle_id": "test_stage_timing_vehicle", "timestamp": "2024-01-01T12:00:00",
+                 "speed": 10.0, "latitude": 12.0, "longitude": 77.0}
+
+    resp = client.post("/ingest/telemetry", json=telemetry)
+    assert resp.status_code == 200
+    assert "parse_validate;dur=" in resp.headers["server-timing"]
+    assert "ai_engine;dur=" in resp.headers["server-timing"]
+    client.post("/telemetry", json=telemetry)
+    # Not an ingest path, not sampled
+    client.get("/vehicles/state")
+
+    summary = stats.summary()
+    assert summary["sampled_requests"] == 2
+    assert set(summary["routes"]) == {"/ingest/telemetry", "/telemetry"}
+    stages = summary["routes"]["/ingest/telemetry"]
+    for stage in ("parse_validate", "admission", "ai_engine", "alert_persist", "broadcast", "total"):
+        assert stages[stage]["count"] == 1
+    assert "db_write" in summary["routes"]["/telemetry"]
+
+def test_unsampled_requests_not_recorded():
+    stats = StageStats()
+    client = TestClient(StageTimingMiddleware(app, stats=stats, sample_rate=0.0, header=True))
+    resp = client.post("/telemetry", json={"vehicle_id": "test_stage_timing_vehicle", "timestamp": "2024-01-01T12:00:00",
+                                           "speed": 10.0, "latitude": 12.0, "longitude": 77.0})
+    assert resp.status_code == 200
+    assert "server-timing" not in resp.headers
+    assert stats.summary()["sampled_requests"] == 0
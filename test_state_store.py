@@ -0,0 +1,35 @@
+
+from fastapi.testclient import TestClient
+from main import app
+
+def test_state_snapshot():
+    client = TestClient(app)
+    vid = "test_state_vehicle"
+
+    assert client.get(f"/vehicle/{vid}/state").status_code == 404
+
+    telemetry = {
+        "vehicle_id": vid,
+        "timestamp": "2024-01-01T12:00:00",
+        "speed": 42.0,
+        "latitude": 12.97,
+        "longitude": 77.59,
+        "battery_level": 64.0
+    }
+    client.post("/ingest/telemetry", json=telemetry)
+
+    # An older sample must not overwrite the newer state
+    client.post("/ingest/telemetry", json={**telemetry, "timestamp": "2024-01-01T11:59:00", "speed": 10.0})
+
+    state = client.get(f"/vehicle/{vid}/state").json()
+    assert state["speed"] == 42.0
+    assert state["battery_level"] == 64.0
+
+    bulk = client.get("/vehicles/state", params={"vehicle_ids": [vid, "unknown_vehicle"]}).json()
+    assert [s["vehicle_id"] for s in bulk] == [vid]
+
+    # New subscribers get the snapshot before any live frame
+    with client.websocket_connect(f"/ws/telemetry/{vid}") as ws:
+        msg = ws.receive_json()
+        assert msg["type"] == "snapshot"
+        assert msg["data"]["speed"] == 42.0
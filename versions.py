@@ -0,0 +1,131 @@
+"""Per-resource version counters for ETag / conditional GET.
+
+crud bumps a resource's version in the same transaction as the write; read
+endpoints derive their ETag from it, so a matching ``If-None-Match`` is
+answered with 304 after a single primary-key lookup instead of the full
+query. Counters live in ``resource_versions`` tables, so every worker sees
+every other worker's writes. Vehicle and trip counters sit in the main
+database; alert and insights counters (``SHARDED_KINDS``) sit on the
+vehicle's telemetry shard next to the rows they describe, so ingest never
+touches the main database. Bulk writers (importer, synthetic_fleet) bump
+once per batch with ``bump_on_shards``. Set ETAGS_ENABLED=0 to turn
+conditional responses (and the bumps) off.
+"""
+import os
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import shards
+import sql_models
+
+ETAGS_ENABLED = os.environ.get("ETAGS_ENABLED", "1") != "0"
+
+_BOOT_TIME = datetime.now(timezone.utc)
+_table = sql_models.ResourceVersion.__table__
+# Kinds whose counters live on the vehicle's telemetry shard
+SHARDED_KINDS = ("alerts", "insights")
+
+
+def bump(db, kind: str, key: str):
+    """Bump in ``db``'s open transaction; the caller commits.
+
+    ``db`` is the session (or connection) the write went through: the
+    vehicle's shard for ``SHARDED_KINDS``, the main database otherwise.
+    """
+    bump_many(db, kind, [key])
+
+
+def bump_many(db, kind: str, keys: Iterable[str]):
+    if not ETAGS_ENABLED:
+        return
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    bind = db.get_bind() if isinstance(db, Session) else db
+    dialect = postgresql if bind.dialect.name == "postgresql" else sqlite
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    stmt = dialect.insert(_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["kind", "key"],
+        set_={"version": _table.c.version + 1, "updated_at": stmt.excluded.updated_at}
+    )
+    db.execute(stmt, [{"kind": kind, "key": key, "version": 1, "updated_at": now} for key in keys])
+
+
+def bump_on_shards(engines: List, kind: str, keys: Iterable[str]):
+    """Bulk writers: one committed bump per shard, each vehicle on its own shard of ``engines``."""
+    by_shard = {}
+    for key in set(keys):
+        by_shard.setdefault(shards.shard_index(key, len(engines)), []).append(key)
+    for index, shard_keys in by_shard.items():
+        with engines[index].begin() as conn:
+            bump_many(conn, kind, shard_keys)
+
+
+def _current(db: Session, kind: str, key: str) -> Tuple[int, Optional[datetime]]:
+    scope = shards.router.session(db, key) if kind in SHARDED_KINDS else nullcontext(db)
+    with scope as source:
+        row = source.execute(
+            select(_table.c.version, _table.c.updated_at).where(_table.c.kind == kind, _table.c.key == key)
+        ).first()
+    return (row[0], row[1]) if row else (0, None)
+
+
+def _tag(kind: str, key: str, version: int, modified: Optional[datetime], extra: str = "") -> str:
+    # The write time keeps tags from a recreated database from matching old ones
+    stamp = int(modified.replace(tzinfo=timezone.utc).timestamp() * 1e6) if modified else 0
+    return f'W/"{kind}-{key}-{version}-{stamp:x}{extra}"'
+
+
+def etag(db: Session, kind: str, key: str, extra: str = "") -> str:
+    version, modified = _current(db, kind, key)
+    return _tag(kind, key, version, modified, extra)
+
+
+def last_modified(db: Session, kind: str, key: str) -> datetime:
+    _, modified = _current(db, kind, key)
+    return modified.replace(tzinfo=timezone.utc) if modified else _BOOT_TIME
+
+
+def _matches(if_none_match: str, tag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: ignore W/ prefixes on either side
+    bare = tag[2:] if tag.startswith("W/") else tag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+def check(request: Request, response: Response, db: Session, kind: str, key: str,
+          extra: str = "") -> Optional[Response]:
+    """Set validators on ``response``; return a 304 if the client is current.
+
+    ``extra`` is mixed into the tag for resources that also change with
+    something other than writes (e.g. insights roll over daily).
+    """
+    if not ETAGS_ENABLED:
+        return None
+    version, modified = _current(db, kind, key)
+    tag = _tag(kind, key, version, modified, extra)
+    headers = {
+        "ETag": tag,
+        "Last-Modified": format_datetime(modified.replace(tzinfo=timezone.utc) if modified else _BOOT_TIME,
+                                         usegmt=True),
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,46 @@
+"""uvicorn WebSocket protocol with permessage-deflate tuned for telemetry frames.
+
+Telemetry frames are small (a few hundred bytes) and highly repetitive: the
+same keys and similar values every two seconds. Keeping the compression
+context between messages ("context takeover") lets each frame reference
+the previous ones, which is where nearly all the savings come from; a small
+window and memLevel keep per-connection memory low.
+
+Use it with:
+
+    uvicorn main:app --ws ws_compression:TunedDeflateProtocol
+"""
+import logging
+import os
+
+from uvicorn.protocols.websockets.websockets_sansio_impl import WebSocketsSansIOProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+from websockets.server import ServerProtocol
+
+# 2 KiB window: several telemetry frames of history at a fraction of the 32 KiB default
+WINDOW_BITS = int(os.environ.get("WS_DEFLATE_WINDOW_BITS", 11))
+MEM_LEVEL = int(os.environ.get("WS_DEFLATE_MEM_LEVEL", 4))
+LEVEL = int(os.environ.get("WS_DEFLATE_LEVEL", 6))
+CONTEXT_TAKEOVER = os.environ.get("WS_DEFLATE_CONTEXT_TAKEOVER", "1") != "0"
+
+
+def deflate_factory() -> ServerPerMessageDeflateFactory:
+    return ServerPerMessageDeflateFactory(
+        server_no_context_takeover=not CONTEXT_TAKEOVER,
+        client_no_context_takeover=not CONTEXT_TAKEOVER,
+        server_max_window_bits=WINDOW_BITS,
+        client_max_window_bits=WINDOW_BITS,
+        compress_settings={"memLevel": MEM_LEVEL, "level": LEVEL},
+    )
+
+
+class TunedDeflateProtocol(WebSocketsSansIOProtocol):
+    def __init__(self, config, server_state, app_state, _loop=None):
+        super().__init__(config, server_state, app_state, _loop)
+        if config.ws_per_message_deflate:
+            # Same construction as the parent, with our extension settings
+            self.conn = ServerProtocol(
+                extensions=[deflate_factory()],
+                max_size=config.ws_max_size,
+                logger=logging.getLogger("uvicorn.error"),
+            )